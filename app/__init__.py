@@ -11,7 +11,7 @@ def create_app():
     # Initialize services
     load_data = LoadHRdata(data_dir='data_files', db_path='hr_data.db')
 
-    # vector_store = load_data.pdf_loader()
+    # pdf_loader also makes the index resident in load_data, so queries never hit the DB blob
     load_data.pdf_loader()
     conversation_manager = ConversationManager(load_data)
     
@@ -22,4 +22,21 @@ def create_app():
     from app.routes import chat_routes
     app.register_blueprint(chat_routes.bp)
     
+    return app
+
+def create_asgi_app():
+    """asyncio counterpart of create_app, serving the same routes under an ASGI server:
+
+        uvicorn asgi:app --host 0.0.0.0 --port 5491 --workers 8
+
+    A chat turn awaits its LLM calls (ainvoke) instead of holding a gevent greenlet.
+    """
+    from starlette.applications import Starlette
+    from app.routes import asgi_routes
+
+    load_data = LoadHRdata(data_dir='data_files', db_path='hr_data.db')
+    load_data.pdf_loader()
+
+    app = Starlette(routes=asgi_routes.routes)
+    app.state.conversation_manager = ConversationManager(load_data)
     return app
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""The routes of chat_routes.py for the asyncio app (see app.create_asgi_app).
+
+Same paths, request bodies and responses as the Flask blueprint; a chat turn is
+awaited end to end (HrTalk.achat_with_follow_up) instead of holding a greenlet.
+"""
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+async def start_conversation(request: Request):
+    conversation_manager = request.app.state.conversation_manager
+    data = await request.json()
+    session_id = data.get('conversation_id')
+    session_id = conversation_manager.start_conversation(session_id)
+    return JSONResponse({"session_id": session_id}, status_code=200)
+
+
+async def send_message(request: Request):
+    conversation_manager = request.app.state.conversation_manager
+    data = await request.json()
+    session_id = data.get('conversation_id')
+    message = data.get('message')
+
+    if not session_id or not message:
+        return JSONResponse({"error": "Missing session_id or message", "cost_detail_list": []}, status_code=400)
+
+    try:
+        response, cost_details = await conversation_manager.aprocess_message(session_id, message)
+        return JSONResponse({
+            "reply": response,
+            "cost_detail_list": cost_details
+        }, status_code=200)
+    except Exception as e:
+        print(e)
+        return JSONResponse({"error": str(e), "cost_detail_list": []}, status_code=400)
+
+
+async def end_conversation(request: Request):
+    conversation_manager = request.app.state.conversation_manager
+    data = await request.json()
+    session_id = data.get('session_id')
+
+    if not session_id:
+        return JSONResponse({"error": "Missing session_id"}, status_code=400)
+
+    conversation_manager.end_conversation(session_id)
+    return JSONResponse({"message": "Conversation ended successfully"}, status_code=200)
+
+
+routes = [
+    Route('/start_conversation', start_conversation, methods=['POST']),
+    Route('/api/chat/hr', send_message, methods=['POST']),
+    Route('/end_conversation', end_conversation, methods=['POST']),
+]
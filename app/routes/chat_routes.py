@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask import current_app
 
 bp = Blueprint('chat', __name__)
@@ -32,6 +33,30 @@ def send_message():
         print(e)
         return jsonify({"error": str(e),"cost_detail_list":[]}), 400
 
+@bp.route('/api/chat/hr/stream', methods=['POST'])
+def stream_message():
+    """Same request as /api/chat/hr, answered as Server-Sent Events.
+
+    Emits ``event: token`` with ``{"delta": ...}`` while the answer is generated, then
+    a single ``event: done`` (or ``event: error``) carrying the full ``reply`` and the
+    ``cost_detail_list``.
+    """
+    conversation_manager = current_app.conversation_manager
+    data = request.json
+    session_id = data.get('conversation_id')
+    message = data.get('message')
+
+    if not session_id or not message:
+        return jsonify({"error": "Missing session_id or message", "cost_detail_list":[]}), 400
+
+    def generate():
+        for event in conversation_manager.stream_message(session_id, message):
+            kind = event.pop('type')
+            yield f"event: {kind}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @bp.route('/end_conversation', methods=['POST'])
 def end_conversation():
     conversation_manager = current_app.conversation_manager
@@ -42,4 +67,10 @@ def end_conversation():
         return jsonify({"error": "Missing session_id"}), 400
     
     conversation_manager.end_conversation(session_id)
-    return jsonify({"message": "Conversation ended successfully"}), 200
\ No newline at end of file
+    return jsonify({"message": "Conversation ended successfully"}), 200
+
+@bp.route('/sessions/stats', methods=['GET'])
+def session_stats():
+    # Live sessions in the worker that answers, with their approximate memory use.
+    conversation_manager = current_app.conversation_manager
+    return jsonify(conversation_manager.session_stats()), 200
\ No newline at end of file
@@ -1,19 +1,22 @@
 import os
 import json
 import time
-from typing import Dict, List, Set
+import logging
+from typing import List, Optional
 from pydantic import BaseModel
 
 from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import ChatPromptTemplate
 
-from langchain.memory import ConversationBufferMemory
 from langchain_openai import AzureChatOpenAI
 
 # Local imports
-from config import OpenaiConfig
+from config import OpenaiConfig, NLUFastPathConfig
+from app.services import chains, clients
+from app.services.memory import NLUMemory
 from app.utils.utils import EntityType, HRIntentCategory, get_Chinese_intent
+from app.utils.nlu_rules import log_classification
+from app.utils.prompt_cache import static_first_prompt
 
 # Pydantic models
 class Entity(BaseModel):
@@ -25,24 +28,22 @@ class NLUOutput(BaseModel):
     entities: List[Entity]
     keywords: List[str]
 
+class UnderstandOutput(NLUOutput):
+    # The input rewritten as one standalone question using the conversation history.
+    refined_query: str
+
 # Environment setup
 os.environ["AZURE_OPENAI_ENDPOINT"] = OpenaiConfig.endpoint
 os.environ["AZURE_OPENAI_API_KEY"] = OpenaiConfig.token
 
-# LLM setup
-llm = AzureChatOpenAI(
-    azure_deployment="gpt4o",
-    api_version="2024-05-01-preview",
-    model="gpt-4o",
-    model_version="2024-05-13",
-    temperature=0
-)
-
-# Prompt template
-nlu_prompt = ChatPromptTemplate.from_messages([
-    ("system", """您是一位專精於人力資源查詢的 AI 助理。請從人力資源的角度分析以下輸入：
+# Prompt templates: the static instructions, with the label lists filled in once per
+# process, come first; the session history and the input last (see app/utils/prompt_cache.py).
+_LABELS = {
+    "entity_types": ", ".join([f"{e.name}: {e.value}" for e in EntityType]),
+    "intent_categories": "\n".join([f"{i.name}: {i.value}" for i in HRIntentCategory]),
+}
 
-    輸入：{input}
+nlu_prompt = static_first_prompt("""您是一位專精於人力資源查詢的 AI 助理。請從人力資源的角度分析使用者訊息最後的輸入，並參考之前的對話摘要。
 
     請提取實體和關鍵字，並判斷意圖。使用以下預定義的實體類型和意圖類別：
 
@@ -69,92 +70,195 @@ nlu_prompt = ChatPromptTemplate.from_messages([
     }}
 
     請確保對類似的查詢保持一致的分類，並反映實體之間的關係。
+    """, """之前的對話摘要：
+{history}
+
+輸入：{input}""", **_LABELS)
+
+# NLU and query refinement in one call, for turns that have history to refine with.
+understand_prompt = static_first_prompt("""您是一位專精於人力資源查詢的 AI 助理。Human 是員工，AI 是你。請根據使用者訊息中的歷史記錄分析員工這一輪的輸入：
+
+    1. 從人力資源的角度提取實體和關鍵字，並判斷意圖。使用以下預定義的實體類型和意圖類別：
+
+    實體類型：
+    {entity_types}
 
-    之前的對話摘要：
-    {history}
-    """),
-])
+    意圖類別：
+    {intent_categories}
+
+    注意某些實體可能同時屬於多個類型。如果實體不屬於這些類型，請使用"其他"。
 
-# Chain setup
-memory = ConversationBufferMemory(memory_key="history", input_key="input")
-nlu_chain = (
-    {"input": RunnablePassthrough(), 
-     "entity_types": lambda _: ", ".join([f"{e.name}: {e.value}" for e in EntityType]),
-     "intent_categories": lambda _: "\n".join([f"{i.name}: {i.value}" for i in HRIntentCategory]),
-     "history": lambda _: memory.load_memory_variables({})["history"]}
-    | nlu_prompt
-    | llm
-    | RunnablePassthrough()
-)
+    2. 改寫成1個具備'明確性、簡潔性、延續性'的問題：萃取歷史記錄中 Human 提供的重要資訊（例如 Human 的身份、詢問的主題）來延伸輸入；如果輸入是在追問 AI 先前的回答，則將追問的項目轉化成完整的問題。如果輸入涉及違法、違規、不道德的行為（如欺騙、性騷擾、歧視等），refined_query 為空字串。
 
-sensitive_word_set: Set[str] = {"性騷擾"}
-sensitive_word_map: Dict[str, str] = {"性騷擾": "越矩的肢體碰觸行為"}
+    請只回覆以下 JSON 格式：
+    {{
+        "intent": "IntentCategory",
+        "entities": [
+            {{
+                "value": "entites",
+                "types": ["entity_type1", "entity_type2"]
+            }}
+        ],
+        "keywords": ["keyword1", "keyword2"],
+        "refined_query": "完整的問題"
+    }}
+    """, """歷史記錄：
+{history}
+
+輸入：{input}""", **_LABELS)
+
+# Chain setup. History is per session (NLUMemory) and passed in with each call.
+chains.register('nlu', lambda llm: nlu_prompt | llm | RunnablePassthrough())
+# JSON mode: the reply is always a parseable object, checked against UnderstandOutput.
+chains.register('understand', lambda llm: understand_prompt | llm.bind(response_format={"type": "json_object"}))
+
+
+def get_nlu_chain():
+    return chains.get('nlu')
+
+
+def get_understand_chain():
+    return chains.get('understand')
+
+
+def fast_classify(input_text: str, memory: Optional[NLUMemory] = None) -> Optional[NLUOutput]:
+    """The local rule/model classification of a short query, or None when the LLM is needed."""
+    if not NLUFastPathConfig.enabled:
+        return None
+    start_time = time.time()
+    output_dict = clients.get_fast_nlu().classify(input_text)
+    if output_dict is None:
+        return None
+    output = NLUOutput(**_nlu_fields(output_dict))
+    _finish_nlu(input_text, output, memory, start_time)
+    return output
 
 
-def NLU_classification(input_text: str) -> NLUOutput:
+def NLU_classification(input_text: str, memory: Optional[NLUMemory] = None) -> NLUOutput:
 
+    fast_output = fast_classify(input_text, memory)
+    if fast_output is not None:
+        return fast_output
     start_time = time.time()
     try:
-        result = nlu_chain.invoke(input_text)
-        
-        if isinstance(result, AIMessage):
-            result = result.content
-        
-        output_dict = json.loads(result)
-        # print(f"=========NLU=========")
-        for i,v in enumerate(output_dict['keywords']):
-            # print("======output_dict['keywords']======")
-            print(f"{v}")
-            if v in sensitive_word_set:
-                print("Find the sensative word!")
-                output_dict['keywords'][i] = sensitive_word_map.get(v,v)
+        result = get_nlu_chain().invoke({
+            "input": clients.rewrite_for_llm(input_text),
+            "history": clients.rewrite_for_llm(memory.history()) if memory is not None else "",
+        })
+        return _parse_nlu_result(input_text, result, memory, start_time)
+    except Exception as e:
+        return NLUOutput(intent=HRIntentCategory.OTHER, entities=[], keywords=[])
 
-            
-        for e in output_dict['entities']:
-            if e['value'] in sensitive_word_set:
-                output_dict['entities'] = sensitive_word_map.get(e['value'],e['value'])
 
-        # print(f"=========NLU=========")
-        intent_str = output_dict['intent'].upper()
-        
-        try:
-            intent = HRIntentCategory[intent_str]
-        except KeyError:
-            intent = HRIntentCategory.OTHER
-
-
-        entities = []
-        for entity_dict in output_dict.get('entities', []):
-            try:
-                entity_types = []
-                for t in entity_dict['types']:
-                    try:
-                        # print("========entity_dict['types']=======")
-                        print(t)
-                        # print("========entity_dict['types']=======")
-                        entity_types.append(EntityType[t.upper()])
-                    except KeyError:
-                        entity_types.append(EntityType.OTHER)
-                
-                entity = Entity(
-                    value=entity_dict['value'],
-                    types=entity_types
-                )
-                entities.append(entity)
-            except Exception as e:
-                continue
-        
-        output = NLUOutput(
-            intent=intent,
-            entities=entities,
-            keywords=output_dict.get('keywords', [])
-        )
-
-        memory.save_context({"input": input_text}, {"output": result})
-        end_time = time.time()
-        print(f"Processing time: {end_time - start_time:.2f} seconds")
-
-        return output
+async def aNLU_classification(input_text: str, memory: Optional[NLUMemory] = None) -> NLUOutput:
+    """NLU_classification for the asyncio serving path (app.asgi)."""
+    fast_output = fast_classify(input_text, memory)
+    if fast_output is not None:
+        return fast_output
+    start_time = time.time()
+    try:
+        result = await get_nlu_chain().ainvoke({
+            "input": clients.rewrite_for_llm(input_text),
+            "history": clients.rewrite_for_llm(memory.history()) if memory is not None else "",
+        })
+        return _parse_nlu_result(input_text, result, memory, start_time)
     except Exception as e:
         return NLUOutput(intent=HRIntentCategory.OTHER, entities=[], keywords=[])
 
+
+def understand(input_text: str, history: str, memory: Optional[NLUMemory] = None) -> UnderstandOutput:
+    """NLU_classification and query refinement against ``history`` in one call."""
+    start_time = time.time()
+    try:
+        result = get_understand_chain().invoke({"input": clients.rewrite_for_llm(input_text),
+                                                 "history": clients.rewrite_for_llm(history)})
+        return _parse_understand_result(input_text, result, memory, start_time)
+    except Exception as e:
+        return UnderstandOutput(intent=HRIntentCategory.OTHER, entities=[], keywords=[], refined_query=input_text)
+
+
+async def aunderstand(input_text: str, history: str, memory: Optional[NLUMemory] = None) -> UnderstandOutput:
+    start_time = time.time()
+    try:
+        result = await get_understand_chain().ainvoke({"input": clients.rewrite_for_llm(input_text),
+                                                        "history": clients.rewrite_for_llm(history)})
+        return _parse_understand_result(input_text, result, memory, start_time)
+    except Exception as e:
+        return UnderstandOutput(intent=HRIntentCategory.OTHER, entities=[], keywords=[], refined_query=input_text)
+
+
+def _parse_nlu_result(input_text: str, result, memory: Optional[NLUMemory], start_time: float) -> NLUOutput:
+    output = NLUOutput(**_nlu_fields(_load_json(result)))
+    _finish_nlu(input_text, output, memory, start_time)
+    if NLUFastPathConfig.log_path:
+        # Training data for the fast path's intent model.
+        log_classification(NLUFastPathConfig.log_path, input_text, output, NLUFastPathConfig.log_max_bytes)
+    return output
+
+
+def _parse_understand_result(input_text: str, result, memory: Optional[NLUMemory],
+                             start_time: float) -> UnderstandOutput:
+    output_dict = _load_json(result)
+    # An empty refined_query is the prompt's answer to a disallowed input (HrTalk._checked_search_query
+    # then searches with the input); a missing one is not.
+    output = UnderstandOutput(**_nlu_fields(output_dict), refined_query=output_dict.get('refined_query', input_text))
+    _finish_nlu(input_text, output, memory, start_time)
+    return output
+
+
+def _load_json(result) -> dict:
+    if isinstance(result, AIMessage):
+        result = result.content
+    return json.loads(result)
+
+
+def _nlu_fields(output_dict: dict) -> dict:
+    # Prompts carry rewritten terms (clients.rewrite_for_llm); this catches terms the model wrote itself.
+    sensitive_filter = clients.get_sensitive_filter()
+    output_dict['keywords'] = [sensitive_filter.rewrite(keyword) for keyword in output_dict['keywords']]
+    for e in output_dict['entities']:
+        e['value'] = sensitive_filter.rewrite(e['value'])
+
+    intent_str = output_dict['intent'].upper()
+    
+    try:
+        intent = HRIntentCategory[intent_str]
+    except KeyError:
+        intent = HRIntentCategory.OTHER
+
+
+    entities = []
+    for entity_dict in output_dict.get('entities', []):
+        try:
+            entity_types = []
+            for t in entity_dict['types']:
+                try:
+                    entity_types.append(EntityType[t.upper()])
+                except KeyError:
+                    entity_types.append(EntityType.OTHER)
+            
+            entity = Entity(
+                value=entity_dict['value'],
+                types=entity_types
+            )
+            entities.append(entity)
+        except Exception as e:
+            continue
+    
+    return {
+        'intent': intent,
+        'entities': entities,
+        'keywords': output_dict.get('keywords', []),
+    }
+
+
+def _finish_nlu(input_text: str, output: NLUOutput, memory: Optional[NLUMemory], start_time: float):
+    if memory is not None:
+        # The compact classification is enough context; the raw JSON reply is not kept.
+        memory.save(input_text, json.dumps({
+            'intent': output.intent.value,
+            'entities': [entity.value for entity in output.entities],
+            'keywords': output.keywords,
+        }, ensure_ascii=False, separators=(',', ':')))
+    end_time = time.time()
+    logging.debug(f"NLU processing time: {end_time - start_time:.2f} seconds")
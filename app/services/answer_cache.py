@@ -0,0 +1,104 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Process-wide cache of final answers keyed by the refined search query's embedding.
+
+    A lookup hits when the cosine similarity to a stored query is at least
+    ``threshold``. Entries expire after ``ttl`` seconds, the least recently used one is
+    evicted beyond ``max_entries``, and everything is dropped as soon as the caller
+    reports a different index version, i.e. after pdf_loader changed the corpus.
+    """
+
+    def __init__(self, threshold: float = 0.97, ttl: float = 6 * 3600, max_entries: int = 2000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Unit vectors live in one preallocated matrix so a lookup is a single matmul.
+        self._vectors: Optional[np.ndarray] = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _release(self, slot: int):
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+        self._free_slots.append(slot)
+
+    def _check_version(self, index_version: Optional[int]):
+        if index_version != self.index_version:
+            for slot in list(self._entries):
+                self._release(slot)
+            self.index_version = index_version
+
+    def clear(self):
+        with self._lock:
+            for slot in list(self._entries):
+                self._release(slot)
+
+    def lookup(self, embedding: Sequence[float], index_version: Optional[int]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            scores = self._vectors @ query
+            scores[~self._valid] = -np.inf
+            slot = int(np.argmax(scores))
+            entry = self._entries[slot] if scores[slot] >= self.threshold else None
+            if entry is not None and time.monotonic() - entry['created_at'] > self.ttl:
+                self._release(slot)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return entry['answer'], entry['cost_detail_list']
+
+    def store(self, embedding: Sequence[float], index_version: Optional[int], answer: str,
+              cost_detail_list: List[Dict[str, Any]]):
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if not self._free_slots:
+                self._release(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = {
+                'answer': answer,
+                'cost_detail_list': cost_detail_list,
+                'created_at': time.monotonic(),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'index_version': self.index_version,
+            }
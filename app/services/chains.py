@@ -0,0 +1,50 @@
+"""Process-wide registry of the LLM chains (NLU, understand, refine, data_chain, summary).
+
+Each module registers a builder for its chain at import, next to the prompt it
+parsed once at import (app/utils/prompt_cache.py). get() builds the chain on first
+use with the chat model clients.get_chat_llm() returns, and every session shares
+it afterwards: sessions pass their history and NLU memory in with each call, so
+starting a conversation builds nothing. Chains are kept per chat model, so one
+installed later with clients.set_chat_llm (benchmarks) gets its own.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from langchain_core.runnables import Runnable
+
+from app.services import clients
+
+Builder = Callable[[Any], Runnable]
+
+_lock = threading.RLock()
+_builders: Dict[str, Builder] = {}
+_chains: Dict[Tuple[str, Hashable], Runnable] = {}
+
+
+def register(name: str, builder: Builder) -> Optional[Builder]:
+    """Set the builder of chain ``name`` (called with the chat model); returns the one it replaces."""
+    with _lock:
+        previous = _builders.get(name)
+        _builders[name] = builder
+        for key in [key for key in _chains if key[0] == name]:
+            del _chains[key]
+        return previous
+
+
+def get(name: str, temperature: float = 0) -> Runnable:
+    llm = clients.get_chat_llm(temperature)
+    # The chain holds on to its model, so the id is not reused while the entry exists.
+    key = (name, id(llm))
+    chain = _chains.get(key)
+    if chain is None:
+        with _lock:
+            chain = _chains.get(key)
+            if chain is None:
+                chain = _chains[key] = _builders[name](llm)
+    return chain
+
+
+def reset():
+    """Drop every built chain; the builders stay registered."""
+    with _lock:
+        _chains.clear()
@@ -0,0 +1,129 @@
+"""Process-wide registry of LLM and embedding clients.
+
+Every session, the NLU chain and LoadHRdata share the objects built here, so a new
+conversation reuses pooled keep-alive connections instead of paying for a fresh
+client and TLS handshake.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+import httpx
+from langchain_openai import AzureChatOpenAI
+
+from config import OpenaiConfig, ClientConfig, EmbeddingConfig, RerankConfig, NLUFastPathConfig, SensitiveTermConfig, DEFAULT_DB_PATH
+
+_lock = threading.RLock()
+_registry: Dict[Hashable, Any] = {}
+
+
+def _get_or_create(key: Hashable, factory: Callable[[], Any]) -> Any:
+    client = _registry.get(key)
+    if client is None:
+        with _lock:
+            client = _registry.get(key)
+            if client is None:
+                client = _registry[key] = factory()
+    return client
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=ClientConfig.max_connections,
+        max_keepalive_connections=ClientConfig.max_keepalive_connections,
+        keepalive_expiry=ClientConfig.keepalive_expiry,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    return _get_or_create('http_client', lambda: httpx.Client(limits=_limits(), timeout=ClientConfig.timeout))
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    return _get_or_create(
+        'http_async_client', lambda: httpx.AsyncClient(limits=_limits(), timeout=ClientConfig.timeout)
+    )
+
+
+def get_async_openai_client():
+    return _get_or_create('async_openai_client', lambda: OpenaiConfig.initial_openai_client(
+        http_client=get_async_http_client(),
+    ))
+
+
+def get_chat_llm(temperature: float = 0) -> AzureChatOpenAI:
+    return _get_or_create(('chat_llm', temperature), lambda: OpenaiConfig.initail_azurechatai_gpt4o(
+        temperature=temperature,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        async_client=get_async_openai_client(),
+    ))
+
+
+def get_embeddings(db_path: str = DEFAULT_DB_PATH):
+    if EmbeddingConfig.provider == 'local':
+        return _get_or_create(('embeddings', db_path), lambda: EmbeddingConfig.initial_local_embeddings(db_path))
+    return _get_or_create(('embeddings', db_path), lambda: OpenaiConfig.initail_azureopenai_embeddings(
+        db_path,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    ))
+
+
+def get_reranker():
+    # Imported here: the reranker module is only needed when RerankConfig.enabled.
+    from app.utils.reranker import CrossEncoderReranker
+    return _get_or_create('reranker', lambda: CrossEncoderReranker(
+        RerankConfig.model_name,
+        max_length=RerankConfig.max_length,
+        batch_size=RerankConfig.batch_size,
+        max_threads=RerankConfig.max_threads,
+        max_concurrent=RerankConfig.max_concurrent,
+        cache_size=RerankConfig.cache_size,
+    ))
+
+
+def get_fast_nlu():
+    from app.utils.nlu_rules import FastNLU
+    return _get_or_create('fast_nlu', lambda: FastNLU.from_path(
+        NLUFastPathConfig.model_path,
+        threshold=NLUFastPathConfig.threshold,
+        max_chars=NLUFastPathConfig.max_chars,
+    ))
+
+
+def get_sensitive_filter():
+    from app.utils.sensitive_terms import SensitiveTermFilter, load_lexicon
+    return _get_or_create('sensitive_filter', lambda: SensitiveTermFilter(
+        load_lexicon(SensitiveTermConfig.lexicon_path)))
+
+
+def rewrite_for_llm(text: str) -> str:
+    """``text`` with sensitive terms rewritten, for a prompt sent to the chat model.
+
+    Only prompts get the rewrite; retrieval, the answer cache and the stored history
+    keep what the user wrote.
+    """
+    if not SensitiveTermConfig.enabled or not text:
+        return text
+    return get_sensitive_filter().rewrite(text)
+
+
+def set_reranker(reranker):
+    """Install a reranker, e.g. one wrapping the benchmarks' FakeCrossEncoder."""
+    with _lock:
+        _registry['reranker'] = reranker
+
+
+def set_chat_llm(llm, temperature: float = 0):
+    """Install a chat model for ``temperature``, e.g. a FakeChatModel in benchmarks.
+
+    May run at any time: app.services.chains builds chains per chat model on first use.
+    """
+    with _lock:
+        _registry[('chat_llm', temperature)] = llm
+
+
+def reset():
+    """Drop every registered client, e.g. after fork or in benchmarks."""
+    with _lock:
+        _registry.clear()
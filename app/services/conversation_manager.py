@@ -1,32 +1,126 @@
 import uuid
+import time
+import atexit
+from typing import Optional
+from config import AnswerCacheConfig, SessionRegistryConfig
 from app.services.llm import HrTalk
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.session_registry import SessionRegistry, approx_size
+from app.services.session_store import SessionStore, create_session_store, dumps_state, loads_state
 from app.utils.load_data import LoadHRdata
 
 class ConversationManager:
-    def __init__(self, load_data: LoadHRdata):
-        self.sessions = {}
+    def __init__(self, load_data: LoadHRdata, session_store: Optional[SessionStore] = None):
         self.vector_store = load_data
+        # Sessions are loaded from the store per request, so any worker can serve any turn.
+        self.session_store = session_store or create_session_store()
+        # Recently used sessions stay live; the store is consulted on a miss, or when
+        # another worker has saved a newer revision of the session.
+        self.write_through = SessionRegistryConfig.write_through
+        self.registry = SessionRegistry(
+            max_sessions=SessionRegistryConfig.max_sessions,
+            idle_ttl=SessionRegistryConfig.idle_ttl_seconds,
+            spill=None if self.write_through else self._spill_session,
+        )
+        if not self.write_through:
+            atexit.register(self.registry.flush)
+        # Shared by every session in this worker
+        self.answer_cache = SemanticAnswerCache(
+            threshold=AnswerCacheConfig.similarity_threshold,
+            ttl=AnswerCacheConfig.ttl_seconds,
+            max_entries=AnswerCacheConfig.max_entries,
+        ) if AnswerCacheConfig.enabled else None
 
     def start_conversation(self, session_id):
-        self.sessions[session_id] = HrTalk(self.vector_store)
+        self._save_session(session_id, HrTalk(self.vector_store, answer_cache=self.answer_cache))
         return session_id
 
+    def load_session(self, session_id) -> HrTalk:
+        start = time.perf_counter()
+        hr_talk = self.registry.get(session_id)
+        if hr_talk is not None and self.write_through and self.session_store.revision(session_id) != hr_talk.revision:
+            hr_talk = None
+        if hr_talk is None:
+            hr_talk = self._restore_session(session_id)
+        hr_talk.last_timings = {'session_load': time.perf_counter() - start}
+        return hr_talk
+
+    def _restore_session(self, session_id) -> HrTalk:
+        data = self.session_store.load(session_id)
+        if data is None:
+            hr_talk = HrTalk(self.vector_store, answer_cache=self.answer_cache)
+        else:
+            hr_talk = HrTalk.from_state(self.vector_store, loads_state(data), answer_cache=self.answer_cache)
+        # A summary that finishes after the turn was saved is written back, unless
+        # another worker has saved a newer turn in the meantime.
+        hr_talk.chain_memories.on_summary = lambda: self._save_summary(session_id, hr_talk)
+        self.registry.put(session_id, hr_talk, approx_size(hr_talk.to_state()))
+        return hr_talk
+
+    def _save_session(self, session_id, hr_talk: HrTalk):
+        start = time.perf_counter()
+        hr_talk.revision += 1
+        state = hr_talk.to_state()
+        if self.write_through:
+            self.session_store.save(session_id, dumps_state(state), hr_talk.revision)
+        self.registry.put(session_id, hr_talk, approx_size(state))
+        hr_talk.last_timings['session_save'] = time.perf_counter() - start
+
+    def _spill_session(self, session_id, hr_talk: HrTalk):
+        self.session_store.save(session_id, dumps_state(hr_talk.to_state()), hr_talk.revision)
+
+    def _save_summary(self, session_id, hr_talk: HrTalk):
+        if not self.write_through:
+            self.registry.resize(session_id, hr_talk, approx_size(hr_talk.to_state()))
+        elif self.session_store.revision(session_id) == hr_talk.revision:
+            self._save_session(session_id, hr_talk)
+
+    def session_stats(self):
+        return self.registry.stats()
+
     def process_message(self, session_id, message):
-        print(self.sessions)
-        if session_id not in self.sessions:
-            self.start_conversation(session_id)
-        
-        hr_talk = self.sessions[session_id]
+        hr_talk = self.load_session(session_id)
         print(hr_talk)
+        load_seconds = hr_talk.last_timings['session_load']
         response, cost_details = hr_talk.chat_with_follow_up({
             'message': message,
             'current_conversation_id': session_id
         })
+        hr_talk.last_timings['session_load'] = load_seconds
+        self._save_session(session_id, hr_talk)
+        return response, cost_details
+
+    async def aprocess_message(self, session_id, message):
+        """process_message for the asyncio app; the session store calls stay synchronous (local and short)."""
+        hr_talk = self.load_session(session_id)
+        load_seconds = hr_talk.last_timings['session_load']
+        response, cost_details = await hr_talk.achat_with_follow_up({
+            'message': message,
+            'current_conversation_id': session_id
+        })
+        hr_talk.last_timings['session_load'] = load_seconds
+        self._save_session(session_id, hr_talk)
         return response, cost_details
 
+    def stream_message(self, session_id, message):
+        """Generator of chat events for one message; see HrTalk.stream_with_follow_up."""
+        hr_talk = self.load_session(session_id)
+        load_seconds = hr_talk.last_timings['session_load']
+        for event in hr_talk.stream_with_follow_up({
+            'message': message,
+            'current_conversation_id': session_id
+        }):
+            if event['type'] != 'token':
+                # Saved before the final event goes out, so a quick follow-up sees this turn.
+                hr_talk.last_timings['session_load'] = load_seconds
+                self._save_session(session_id, hr_talk)
+            yield event
+
     def end_conversation(self, session_id):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        hr_talk = self.registry.remove(session_id)
+        if hr_talk is not None:
+            hr_talk.close()
+        self.session_store.delete(session_id)
 
     def _generate_unique_id(self):
-        return str(uuid.uuid4())
\ No newline at end of file
+        return str(uuid.uuid4())
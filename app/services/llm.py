@@ -1,26 +1,34 @@
-from typing import List, Dict, Optional, Any, Tuple
+from typing import List, Dict, Optional, Any, Tuple, Generator
 from datetime import datetime
 
 from pydantic import BaseModel, Field
-from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages import AIMessage, BaseMessage, get_buffer_string
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain.output_parsers import CommaSeparatedListOutputParser
+from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import AzureChatOpenAI
-from langchain_community.callbacks import get_openai_callback
 from langchain_core.documents import Document
 
 from azure.core.exceptions import HttpResponseError
 
-from config import OpenaiConfig
+from config import ChatConfig, RetrievalConfig, SensitiveTermConfig
+from app.services import chains, clients
+from app.utils import concurrency
 from app.utils.utils import measure_time
-from app.services.NLU import NLU_classification, NLUOutput
-from app.utils.prompts import initial_data_chain_prompt, refine_query_prompt, sensitive_word_response
+from app.utils.tokens import count_tokens
+from app.utils.chunk_tags import query_tag_groups
+from app.utils.context_builder import build_context
+from app.services.NLU import NLU_classification, aNLU_classification, NLUOutput, UnderstandOutput, understand, aunderstand, fast_classify
+from app.utils.prompts import (initial_data_chain_prompt, data_chain_input, refine_query_prompt, refine_query_input,
+                               sensitive_word_response)
+from app.utils.prompt_cache import static_first_prompt, get_usage_callback
 from app.utils.load_data import LoadHRdata
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.memory import NLUMemory, SummarizingTokenMemory
 import re
+import time
+import asyncio
 
 class InMemoryHistory(BaseChatMessageHistory, BaseModel):
     messages: List[BaseMessage] = Field(default_factory=list)
@@ -31,39 +39,88 @@ class InMemoryHistory(BaseChatMessageHistory, BaseModel):
     def clear(self) -> None:
         self.messages = []
 
+# Parsed once per process; the chains are built per chat model by the registry.
+data_prompt = static_first_prompt(initial_data_chain_prompt, data_chain_input)
+refine_prompt = static_first_prompt(refine_query_prompt, refine_query_input)
+chains.register('data', lambda llm: data_prompt | llm | RunnablePassthrough())
+# Stateless: the caller passes the session history in and records the turn itself.
+chains.register('refine', lambda llm: refine_prompt | llm | StrOutputParser())
+
+
 class HrTalk:
-    def __init__(self, load_data: LoadHRdata):
+    # Client and chains are process-wide (app/services/chains.py); an HrTalk only
+    # carries conversation state.
+
+    def __init__(self, load_data: LoadHRdata, answer_cache: Optional[SemanticAnswerCache] = None):
         self.current_conversation_id = None
         self.conversations_memory = {}
         self.user_personas = {}
         self.load_data = load_data
-        self.llm = OpenaiConfig.initail_azurechatai_gpt4o()
-        self.output_parser = CommaSeparatedListOutputParser()
-        self.data_chain = self._initial_data_chain()
-        self.chain_memories = ConversationBufferMemory(input_key="input", return_messages=True)
-        refine_query_prompt_template = PromptTemplate(
-            input_variables=["history", "input"],
-            template=refine_query_prompt
+        self.answer_cache = answer_cache
+        self.chain_memories = SummarizingTokenMemory(
+            max_tokens=ChatConfig.history_max_tokens,
+            keep_turns=ChatConfig.history_keep_turns,
+            summary_max_tokens=ChatConfig.history_summary_max_tokens,
         )
+        self.nlu_memory = NLUMemory(max_tokens=ChatConfig.nlu_history_tokens)
+        self.last_timings: Dict[str, float] = {}
+        self.last_prompt_tokens: Dict[str, int] = {}
+        # Bumped on every save to the session store (see ConversationManager).
+        self.revision = 0
 
-        self.conversation_chain = ConversationChain(
-            llm=self.llm,
-            prompt=refine_query_prompt_template,
-            memory=self.chain_memories,
-            input_key = 'input',
-            output_key="output" 
-        )
+    @property
+    def llm(self):
+        return clients.get_chat_llm()
 
-        
+    @property
+    def data_chain(self):
+        return chains.get('data')
 
-    @measure_time
-    def _initial_data_chain(self):
-        data_prompt = ChatPromptTemplate.from_messages([
-            ("system", initial_data_chain_prompt),
-            ("human", "{text}")
-        ])
-        return data_prompt | self.llm | RunnablePassthrough()
+    @property
+    def refine_chain(self):
+        return chains.get('refine')
     
+    def close(self):
+        """Release per-session state when the conversation ends (ConversationManager.end_conversation).
+
+        Evicted sessions are not closed: another request may still be running a turn on them.
+        """
+        # A summary still running in the background must not save the session again.
+        self.chain_memories.on_summary = None
+        self.chain_memories.clear()
+        self.nlu_memory.clear()
+        self.conversations_memory.clear()
+        self.user_personas.clear()
+
+    def to_state(self) -> Dict[str, Any]:
+        """Everything a session needs to continue on another worker, as plain JSON types."""
+        return {
+            'revision': self.revision,
+            'current_conversation_id': self.current_conversation_id,
+            'conversations_memory': self.conversations_memory,
+            'user_personas': {
+                conversation_id: {name: sorted(values) for name, values in persona.items()}
+                for conversation_id, persona in self.user_personas.items()
+            },
+            'chain_memories': self.chain_memories.to_state(),
+            'nlu_memory': self.nlu_memory.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, load_data: LoadHRdata, state: Dict[str, Any],
+                   answer_cache: Optional[SemanticAnswerCache] = None) -> 'HrTalk':
+        talk = cls(load_data, answer_cache=answer_cache)
+        talk.revision = state.get('revision', 0)
+        talk.current_conversation_id = state.get('current_conversation_id')
+        talk.conversations_memory = state.get('conversations_memory', {})
+        talk.user_personas = {
+            conversation_id: {name: set(values) for name, values in persona.items()}
+            for conversation_id, persona in state.get('user_personas', {}).items()
+        }
+        talk.chain_memories.load_state(state.get('chain_memories', {}))
+        talk.nlu_memory.load_state(state.get('nlu_memory', []))
+        return talk
+
     def update_user_persona(self, conversation_id: str, nlu_output: NLUOutput):
         if conversation_id not in self.user_personas:
             self.user_personas[conversation_id] = {
@@ -96,94 +153,471 @@ class HrTalk:
             return result.get('text', '')
         return str(result)
     
-    @measure_time
-    def analyze_chain(self, input_: str, nlu_output: NLUOutput, conversation_id: str, context: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
-        user_persona = self.get_user_persona(conversation_id)
-        search_query = input_
-        
+    def _turn_history(self) -> str:
+        # Rendered once per turn as plain "Human: / AI:" lines for the prompts; the memory
+        # keeps it within ChatConfig.history_max_tokens.
+        history = clients.rewrite_for_llm(get_buffer_string(self.chain_memories.buffer))
+        self.last_prompt_tokens = {'history': count_tokens(history)}
+        return history
+
+    def _prepare_turn(self, input_: str, timings: Dict[str, float], nlu: Any = None) -> Dict[str, Any]:
+        """Everything before data_chain: refine, embed, answer cache lookup and retrieval.
 
-        if self.chain_memories.buffer:
+        ``nlu`` is the turn's NLUOutput, or a future for one still running; its intent
+        and entities become retrieval filters. An UnderstandOutput also carries the
+        refined query, so the refine call is skipped.
+        """
+        history = self._turn_history()
+
+        start = time.perf_counter()
+        if isinstance(nlu, UnderstandOutput):
+            # Refined by the understand call already (timed as 'understand').
+            search_query = nlu.refined_query if history else input_
+        elif history:
             print("will refine you  query with history")
             chain_input = {
-                "input": input_,
-                "history": self.chain_memories.buffer
+                "input": clients.rewrite_for_llm(input_),
+                "history": history
             }
-            search_query = self.conversation_chain.run(chain_input)
+            search_query = self.refine_chain.invoke(chain_input)
+            print(f"analyze_chain - refined query: {search_query}")
+        else:
+            print("This is the first conversation, will not refine.")
+            search_query = input_
+        if not isinstance(nlu, UnderstandOutput):
+            timings['refine'] = time.perf_counter() - start
+        search_query = self._checked_search_query(input_, search_query)
+        # One embedding serves both the answer cache lookup and the retrieval;
+        # short keyword queries go to BM25 alone and skip it.
+        start = time.perf_counter()
+        query_embedding = None
+        if not self.load_data.is_keyword_query(search_query):
+            query_embedding = self.load_data.embed_query(search_query)
+        timings['embed'] = time.perf_counter() - start
+        turn = self._lookup_turn(search_query, history, query_embedding)
+        if turn['cached'] is None:
+            self._search(turn, self._wait_nlu(nlu, timings), timings)
+        return turn
+
+    @staticmethod
+    def _checked_search_query(input_: str, search_query: str) -> str:
+        # Refine and understand answer '' for a disallowed input. Searching for '' finds
+        # nothing useful; search with the input and let data_chain's guardrail answer it.
+        if not search_query.strip():
+            print("refinement returned an empty query; searching with the input")
+            return input_
+        return search_query
+
+    async def _aprepare_turn(self, input_: str, timings: Dict[str, float], nlu: Any = None) -> Dict[str, Any]:
+        history = self._turn_history()
+
+        start = time.perf_counter()
+        if isinstance(nlu, UnderstandOutput):
+            # Refined by the understand call already (timed as 'understand').
+            search_query = nlu.refined_query if history else input_
+        elif history:
+            print("will refine you  query with history")
+            search_query = await self.refine_chain.ainvoke({"input": clients.rewrite_for_llm(input_),
+                                                            "history": history})
             print(f"analyze_chain - refined query: {search_query}")
         else:
             print("This is the first conversation, will not refine.")
-            search_query = search_query
+            search_query = input_
+        if not isinstance(nlu, UnderstandOutput):
+            timings['refine'] = time.perf_counter() - start
+        search_query = self._checked_search_query(input_, search_query)
+        start = time.perf_counter()
+        query_embedding = None
+        if not self.load_data.is_keyword_query(search_query):
+            query_embedding = await self.load_data.aembed_query(search_query)
+        timings['embed'] = time.perf_counter() - start
+        # Lookup and retrieval over the resident index are CPU work; keep them off the event loop.
+        turn = await asyncio.to_thread(self._lookup_turn, search_query, history, query_embedding)
+        if turn['cached'] is None:
+            nlu_output = await self._await_nlu(nlu, timings)
+            await asyncio.to_thread(self._search, turn, nlu_output, timings)
+        return turn
+
+    @staticmethod
+    def _wait_nlu(nlu: Any, timings: Dict[str, float]) -> Optional[NLUOutput]:
+        if nlu is None or isinstance(nlu, NLUOutput):
+            return nlu
+        if not RetrievalConfig.nlu_filters:
+            return None
+        start = time.perf_counter()
+        nlu_output = concurrency.result_within(nlu, RetrievalConfig.nlu_filter_wait)
+        timings['nlu_filter_wait'] = time.perf_counter() - start
+        return nlu_output
+
+    @staticmethod
+    async def _await_nlu(nlu: Any, timings: Dict[str, float]) -> Optional[NLUOutput]:
+        if nlu is None or isinstance(nlu, NLUOutput):
+            return nlu
+        if not RetrievalConfig.nlu_filters:
+            return None
+        start = time.perf_counter()
+        try:
+            # shield: the caller still awaits the NLU result after a timeout here.
+            nlu_output = await asyncio.wait_for(asyncio.shield(nlu), RetrievalConfig.nlu_filter_wait)
+        except asyncio.TimeoutError:
+            nlu_output = None
+        timings['nlu_filter_wait'] = time.perf_counter() - start
+        return nlu_output
+
+    @staticmethod
+    def _tag_groups(search_query: str, nlu_output: Optional[NLUOutput]) -> List[List[str]]:
+        if not RetrievalConfig.nlu_filters:
+            return []
+        if nlu_output is None:
+            # Article numbers in the query still apply without NLU.
+            return query_tag_groups(search_query)
+        entity_types = [entity_type for entity in nlu_output.entities for entity_type in entity.types]
+        return query_tag_groups(search_query, nlu_output.intent, entity_types)
+
+    def _lookup_turn(self, search_query: str, history: str,
+                     query_embedding: Optional[List[float]]) -> Dict[str, Any]:
         print("="*len(search_query)*2)
         print(search_query)
         print("="*len(search_query)*2)
-        search_results = self.load_data.max_marginal_relevance_search(search_query, k=8)
+        index_version = self.load_data.current_index_version()
+        turn = {
+            'search_query': search_query,
+            'history': history,
+            'query_embedding': query_embedding,
+            'index_version': index_version,
+            'cached': None,
+            'search_results': None,
+            'context': None,
+        }
+        if self.answer_cache is not None and query_embedding is not None:
+            turn['cached'] = self.answer_cache.lookup(query_embedding, index_version)
+            if turn['cached'] is not None:
+                print("analyze_chain - answer cache hit")
+        return turn
+
+    def _search(self, turn: Dict[str, Any], nlu_output: Optional[NLUOutput], timings: Dict[str, float]):
+        start = time.perf_counter()
+        tag_groups = self._tag_groups(turn['search_query'], nlu_output)
+        if tag_groups:
+            print(f"analyze_chain - retrieval filters: {tag_groups}")
+        turn['search_results'] = self.load_data.retrieve(turn['search_query'], turn['query_embedding'], k=8,
+                                                         tag_groups=tag_groups)
+        timings['retrieval'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        turn['context'], stats = build_context(turn['search_results'], ChatConfig.context_max_tokens,
+                                               ChatConfig.context_min_block_tokens)
+        timings['context'] = time.perf_counter() - start
+        self.last_prompt_tokens['context'] = stats['tokens']
+        print(f"analyze_chain - context: {stats}")
+
+    @staticmethod
+    def _data_chain_input(input_: str, turn: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'question': clients.rewrite_for_llm(turn['search_query']),
+            'text': turn['context'],
+            'persona': turn['history'],
+            'ori_input': clients.rewrite_for_llm(input_),
+        }
+
+    @staticmethod
+    def _cost_detail(completion_tokens: int, prompt_tokens: int, cached_tokens: int = 0) -> List[Dict[str, Any]]:
+        return [{
+            'function': 'data_chain',
+            'model': 'gpt-4o-2024-05-13', 
+            'usage': {
+                'completion_tokens': completion_tokens,
+                'prompt_tokens': prompt_tokens,
+                'total_tokens': completion_tokens + prompt_tokens,
+                # Prompt tokens served from the provider's prefix cache (billed at a discount).
+                'prompt_tokens_details': {'cached_tokens': cached_tokens}
+            }
+        }]
+
+    def _finish_turn(self, input_: str, turn: Dict[str, Any], answer: str, cost_detail_list: List[Dict[str, Any]]):
+        self.chain_memories.save_context({"input": input_}, {"output": answer})
+        if self.answer_cache is not None and turn['cached'] is None and turn['query_embedding'] is not None:
+            self.answer_cache.store(turn['query_embedding'], turn['index_version'], answer, cost_detail_list)
+
+    @measure_time
+    def analyze_chain(self, input_: str, nlu_output: Any, conversation_id: str, context: Optional[str] = None,
+                      timings: Optional[Dict[str, float]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        timings = {} if timings is None else timings
+        user_persona = self.get_user_persona(conversation_id)
+        turn = self._prepare_turn(input_, timings, nlu_output)
+        if turn['cached'] is not None:
+            answer, cost_detail_list = turn['cached']
+            self._finish_turn(input_, turn, answer, cost_detail_list)
+            return answer, cost_detail_list
 
         try:
-            with get_openai_callback() as cb:
-                result = self.data_chain.invoke({
-                    'question': search_query,
-                    'text': search_results,
-                    'persona': self.chain_memories.buffer,
-                    'ori_input': input_,
-                })
-                cost_detail_list = [{
-                    'function': 'data_chain',
-                    'model': 'gpt-4o-2024-05-13', 
-                    'usage': {
-                        'completion_tokens': cb.completion_tokens,
-                        'prompt_tokens': cb.prompt_tokens,
-                        'total_tokens': cb.total_tokens
-                    }
-                }]
+            start = time.perf_counter()
+            with get_usage_callback() as cb:
+                result = self.data_chain.invoke(self._data_chain_input(input_, turn))
+                cost_detail_list = self._cost_detail(cb.completion_tokens, cb.prompt_tokens, cb.prompt_tokens_cached)
             
-            self.chain_memories.save_context({"input": input_}, {"output": self.extract_content(result)})
-            return self.extract_content(result), cost_detail_list
+            timings['data_chain'] = time.perf_counter() - start
+            self.last_prompt_tokens['data_chain'] = cb.prompt_tokens
+            print(f"analyze_chain - prompt tokens: {self.last_prompt_tokens}")
+            answer = self.extract_content(result)
+            self._finish_turn(input_, turn, answer, cost_detail_list)
+            return answer, cost_detail_list
         except Exception as e:
             return f"Error: {str(e)}", None
-        
+
+    async def aanalyze_chain(self, input_: str, timings: Optional[Dict[str, float]] = None,
+                             nlu_task: Any = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """analyze_chain for the asyncio serving path: the same steps, awaited with ainvoke.
+
+        ``nlu_task`` is the running NLU task, or the turn's UnderstandOutput.
+        """
+        timings = {} if timings is None else timings
+        turn = await self._aprepare_turn(input_, timings, nlu_task)
+        if turn['cached'] is not None:
+            answer, cost_detail_list = turn['cached']
+            self._finish_turn(input_, turn, answer, cost_detail_list)
+            return answer, cost_detail_list
+
+        try:
+            start = time.perf_counter()
+            with get_usage_callback() as cb:
+                result = await self.data_chain.ainvoke(self._data_chain_input(input_, turn))
+                cost_detail_list = self._cost_detail(cb.completion_tokens, cb.prompt_tokens, cb.prompt_tokens_cached)
+            timings['data_chain'] = time.perf_counter() - start
+            self.last_prompt_tokens['data_chain'] = cb.prompt_tokens
+            print(f"aanalyze_chain - prompt tokens: {self.last_prompt_tokens}")
+            answer = self.extract_content(result)
+            self._finish_turn(input_, turn, answer, cost_detail_list)
+            return answer, cost_detail_list
+        except Exception as e:
+            return f"Error: {str(e)}", None
+
+    def stream_analyze_chain(self, input_: str, timings: Optional[Dict[str, float]] = None, nlu: Any = None
+                             ) -> Generator[str, None, Tuple[str, List[Dict[str, Any]]]]:
+        """Like analyze_chain, but yields the answer as data_chain streams it.
+
+        The generator's return value is ``(answer, cost_detail_list)``. The turn is
+        saved to chain_memories (and the answer cache) only after the last chunk, so a
+        client that disconnects mid-answer leaves the session history untouched.
+        """
+        timings = {} if timings is None else timings
+        turn = self._prepare_turn(input_, timings, nlu)
+        if turn['cached'] is not None:
+            answer, cost_detail_list = turn['cached']
+            timings['first_token'] = 0.0
+            yield answer
+            self._finish_turn(input_, turn, answer, cost_detail_list)
+            return answer, cost_detail_list
+
+        chain_input = self._data_chain_input(input_, turn)
+        parts: List[str] = []
+        start = time.perf_counter()
+        with get_usage_callback() as cb:
+            for chunk in self.data_chain.stream(chain_input):
+                delta = chunk.content if isinstance(chunk, BaseMessage) else str(chunk)
+                if not delta:
+                    continue
+                if not parts:
+                    timings['first_token'] = time.perf_counter() - start
+                parts.append(delta)
+                yield delta
+        timings['data_chain'] = time.perf_counter() - start
+        answer = "".join(parts)
+
+        prompt_tokens, completion_tokens = cb.prompt_tokens, cb.completion_tokens
+        if not cb.total_tokens:
+            # api_version 2024-05-01-preview sends no usage on streamed responses; count locally.
+            prompt = get_buffer_string(self.data_chain.first.format_messages(**chain_input))
+            prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(answer)
+        cost_detail_list = self._cost_detail(completion_tokens, prompt_tokens, cb.prompt_tokens_cached)
+        self.last_prompt_tokens['data_chain'] = prompt_tokens
+        print(f"stream_analyze_chain - prompt tokens: {self.last_prompt_tokens}")
+        self._finish_turn(input_, turn, answer, cost_detail_list)
+        return answer, cost_detail_list
+
+    def _timed_nlu(self, input_: str, timings: Dict[str, float]) -> NLUOutput:
+        start = time.perf_counter()
+        nlu_output = NLU_classification(input_, memory=self.nlu_memory)
+        timings['nlu'] = time.perf_counter() - start
+        return nlu_output
+
+    async def _atimed_nlu(self, input_: str, timings: Dict[str, float]) -> NLUOutput:
+        start = time.perf_counter()
+        nlu_output = await aNLU_classification(input_, memory=self.nlu_memory)
+        timings['nlu'] = time.perf_counter() - start
+        return nlu_output
+
+    def _combined_understand(self) -> bool:
+        return ChatConfig.combined_understand and bool(self.chain_memories.buffer)
+
+    def _timed_understand(self, input_: str, timings: Dict[str, float]) -> NLUOutput:
+        start = time.perf_counter()
+        nlu_output = fast_classify(input_, memory=self.nlu_memory)
+        if nlu_output is not None:
+            # Classified locally; _prepare_turn refines with the (smaller) refine call.
+            timings['nlu'] = time.perf_counter() - start
+            return nlu_output
+        understood = understand(input_, get_buffer_string(self.chain_memories.buffer), memory=self.nlu_memory)
+        timings['understand'] = time.perf_counter() - start
+        print(f"understand - refined query: {understood.refined_query}")
+        return understood
+
+    async def _atimed_understand(self, input_: str, timings: Dict[str, float]) -> NLUOutput:
+        start = time.perf_counter()
+        nlu_output = fast_classify(input_, memory=self.nlu_memory)
+        if nlu_output is not None:
+            # Classified locally; _aprepare_turn refines with the (smaller) refine call.
+            timings['nlu'] = time.perf_counter() - start
+            return nlu_output
+        understood = await aunderstand(input_, get_buffer_string(self.chain_memories.buffer), memory=self.nlu_memory)
+        timings['understand'] = time.perf_counter() - start
+        print(f"understand - refined query: {understood.refined_query}")
+        return understood
+
+    def _start_turn(self, request: dict) -> str:
+        self.current_conversation_id = request['current_conversation_id']
+        if self.current_conversation_id not in self.conversations_memory:
+            self.conversations_memory[self.current_conversation_id] = []
+        return request['message']
+
+    def _screen(self, input_: str, timings: Dict[str, float]) -> bool:
+        """Whether the message holds a block term and must not reach the LLM.
+
+        Rewrite terms are left in place here: each prompt gets them rewritten
+        (clients.rewrite_for_llm), while retrieval and history keep the message as written.
+        """
+        if not SensitiveTermConfig.enabled:
+            return False
+        start = time.perf_counter()
+        screened, terms = clients.get_sensitive_filter().screen(input_)
+        timings['screen'] = time.perf_counter() - start
+        if terms:
+            print(f"sensitive terms {terms}: " + ("blocked" if screened is None else "rewritten in prompts"))
+        return screened is None
+
+    def _record_turn(self, input_: str, result_text: str, nlu_output: NLUOutput):
+        self.update_user_persona(self.current_conversation_id, nlu_output)
+        self.conversations_memory[self.current_conversation_id].append({
+            'human': input_,
+            'ai': result_text,
+            'nlu': {
+                'intent': nlu_output.intent.value,
+                'entities': [entity.model_dump() for entity in nlu_output.entities],
+                'keywords': nlu_output.keywords
+            },
+            'timestamp': datetime.now().isoformat()
+        })
+
+    @staticmethod
+    def _error_reply(e: Exception) -> str:
+        error_message = str(e)
+        if isinstance(e, HttpResponseError):
+            print(f"Azure error: {error_message}")
+            if "content filter" in error_message.lower():
+                return sensitive_word_response
+            return "非常抱歉，發生了意外錯誤。請再試一次，如果問題持續存在，請戳右下角的鴨子，聯繫支援團隊。"
+        print(f"Unexpected error in chat_with_follow_up: {error_message}")
+        return sensitive_word_response
+
     @measure_time
-    def chat_with_follow_up(self, request: dict) -> Tuple[str, List[Dict[str, Any]], str]:
+    def chat_with_follow_up(self, request: dict) -> Tuple[str, List[Dict[str, Any]]]:
         try:
-            input_ = request['message']
+            input_ = self._start_turn(request)
             
-            self.current_conversation_id = request['current_conversation_id']
-            if self.current_conversation_id not in self.conversations_memory:
-                self.conversations_memory[self.current_conversation_id] = []
-            
-            nlu_output = NLU_classification(input_)
-            self.update_user_persona(self.current_conversation_id, nlu_output)
-            
-            result_text, cost_detail_list = self.analyze_chain(input_, nlu_output, self.current_conversation_id)
-
-            self.conversations_memory[self.current_conversation_id].append({
-                'human': input_,
-                'ai': result_text,
-                'nlu': {
-                    'intent': nlu_output.intent.value,
-                    'entities': [entity.model_dump() for entity in nlu_output.entities],
-                    'keywords': nlu_output.keywords
-                },
-                'timestamp': datetime.now().isoformat()
-            })
+            timings: Dict[str, float] = {}
+            turn_start = time.perf_counter()
+            if self._screen(input_, timings):
+                # Answered here: the content filter would reject it after a full round trip.
+                return sensitive_word_response, []
+            if self._combined_understand():
+                # One call classifies and refines; retrieval then has its filters up front.
+                nlu_output = self._timed_understand(input_, timings)
+                result_text, cost_detail_list = self.analyze_chain(input_, nlu_output, self.current_conversation_id, timings=timings)
+            elif ChatConfig.concurrent_nlu:
+                # NLU overlaps refinement and embedding; retrieval takes its filters from the
+                # future if it is done in time.
+                nlu_future = concurrency.spawn(self._timed_nlu, input_, timings)
+                result_text, cost_detail_list = self.analyze_chain(input_, nlu_future, self.current_conversation_id, timings=timings)
+                wait_start = time.perf_counter()
+                nlu_output = nlu_future.result()
+                timings['nlu_wait'] = time.perf_counter() - wait_start
+            else:
+                nlu_output = self._timed_nlu(input_, timings)
+                result_text, cost_detail_list = self.analyze_chain(input_, nlu_output, self.current_conversation_id, timings=timings)
+            timings['total'] = time.perf_counter() - turn_start
+            self.last_timings = timings
+            print("turn timings: " + ", ".join(f"{name}={seconds:.3f}s" for name, seconds in timings.items()))
+            self._record_turn(input_, result_text, nlu_output)
 
             # return result_text, cost_detail_list, ""
             return result_text, cost_detail_list
 
-        except HttpResponseError as e:
-            error_message = str(e)
-            if "content filter" in error_message.lower():
-                result_text = sensitive_word_response
+        except Exception as e:
+            return self._error_reply(e), []
+
+    async def achat_with_follow_up(self, request: dict) -> Tuple[str, List[Dict[str, Any]]]:
+        try:
+            input_ = self._start_turn(request)
+            timings: Dict[str, float] = {}
+            turn_start = time.perf_counter()
+            if self._screen(input_, timings):
+                return sensitive_word_response, []
+            if self._combined_understand():
+                nlu_output = await self._atimed_understand(input_, timings)
+                result_text, cost_detail_list = await self.aanalyze_chain(input_, timings=timings, nlu_task=nlu_output)
             else:
-                result_text = "非常抱歉，發生了意外錯誤。請再試一次，如果問題持續存在，請戳右下角的鴨子，聯繫支援團隊。"
-            
-            print(f"Azure error: {error_message}")
-            return result_text, [], error_message
+                nlu_task = asyncio.ensure_future(self._atimed_nlu(input_, timings))
+                result_text, cost_detail_list = await self.aanalyze_chain(input_, timings=timings, nlu_task=nlu_task)
+                wait_start = time.perf_counter()
+                nlu_output = await nlu_task
+                timings['nlu_wait'] = time.perf_counter() - wait_start
+            timings['total'] = time.perf_counter() - turn_start
+            self.last_timings = timings
+            print("turn timings: " + ", ".join(f"{name}={seconds:.3f}s" for name, seconds in timings.items()))
+            self._record_turn(input_, result_text, nlu_output)
+            return result_text, cost_detail_list
+
+        except Exception as e:
+            return self._error_reply(e), []
+
+    def stream_with_follow_up(self, request: dict) -> Generator[Dict[str, Any], None, None]:
+        """Streaming chat_with_follow_up: yields ``{"type": "token", "delta"}`` events, then
+        one ``{"type": "done", "reply", "cost_detail_list"}`` (or ``"error"``) event."""
+        try:
+            input_ = self._start_turn(request)
+            timings: Dict[str, float] = {}
+            turn_start = time.perf_counter()
+            if self._screen(input_, timings):
+                yield {'type': 'done', 'reply': sensitive_word_response, 'cost_detail_list': []}
+                return
+            nlu_future = None
+            if self._combined_understand():
+                # Refinement has to finish before retrieval anyway; classifying in the same call costs no extra wait.
+                nlu_output = self._timed_understand(input_, timings)
+                stream = self.stream_analyze_chain(input_, timings=timings, nlu=nlu_output)
+            else:
+                # NLU overlaps the stream here; waiting for it first would delay the first token.
+                nlu_future = concurrency.spawn(self._timed_nlu, input_, timings)
+                stream = self.stream_analyze_chain(input_, timings=timings, nlu=nlu_future)
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as stop:
+                    result_text, cost_detail_list = stop.value
+                    break
+                yield {'type': 'token', 'delta': delta}
+            if nlu_future is not None:
+                wait_start = time.perf_counter()
+                nlu_output = nlu_future.result()
+                timings['nlu_wait'] = time.perf_counter() - wait_start
+            timings['total'] = time.perf_counter() - turn_start
+            self.last_timings = timings
+            print("turn timings: " + ", ".join(f"{name}={seconds:.3f}s" for name, seconds in timings.items()))
+            self._record_turn(input_, result_text, nlu_output)
+            yield {'type': 'done', 'reply': result_text, 'cost_detail_list': cost_detail_list}
 
         except Exception as e:
-            error_message = str(e)
-            result_text = sensitive_word_response
-            print(f"Unexpected error in chat_with_follow_up: {error_message}")
-            return result_text, [], error_message
+            yield {'type': 'error', 'reply': self._error_reply(e), 'cost_detail_list': [], 'error': str(e)}
 
 def summarize_search_results(search_results: List[Document]) -> str:
     summary = "Search Results Summary:\n"
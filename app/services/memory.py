@@ -0,0 +1,229 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from app.services import chains, clients
+from app.utils import concurrency
+from app.utils.prompts import summarize_history_prompt
+from app.utils.tokens import count_tokens, truncate_to_tokens
+
+# (human, ai, tokens)
+Turn = Tuple[HumanMessage, AIMessage, int]
+# summarizer(previous_summary, turns_to_fold_in) -> new summary
+Summarizer = Callable[[str, List[Turn]], str]
+
+summary_prompt = PromptTemplate.from_template(summarize_history_prompt)
+chains.register('summary', lambda llm: summary_prompt | llm | StrOutputParser())
+
+
+class NLUMemory:
+    """Per-session NLU history bounded by a token budget.
+
+    Each turn keeps the user input and a compact form of the classification. Once the
+    rendered history exceeds ``max_tokens`` the oldest turns are dropped, so the NLU
+    prompt stays the same size however long a session (or a worker) runs.
+    """
+
+    def __init__(self, max_tokens: int = 600):
+        self.max_tokens = max_tokens
+        self._turns: Deque[Tuple[str, int]] = deque()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def save(self, input_text: str, output: str):
+        turn = f"Human: {input_text}\nAI: {output}"
+        tokens = count_tokens(turn) + 1
+        with self._lock:
+            self._turns.append((turn, tokens))
+            self._tokens += tokens
+            while self._tokens > self.max_tokens and self._turns:
+                _, dropped = self._turns.popleft()
+                self._tokens -= dropped
+
+    def history(self) -> str:
+        with self._lock:
+            return "\n".join(turn for turn, _ in self._turns)
+
+    @property
+    def token_count(self) -> int:
+        return self._tokens
+
+    def to_state(self) -> List[str]:
+        with self._lock:
+            return [turn for turn, _ in self._turns]
+
+    def load_state(self, turns: List[str]):
+        self.clear()
+        for turn in turns:
+            tokens = count_tokens(turn) + 1
+            self._turns.append((turn, tokens))
+            self._tokens += tokens
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._tokens = 0
+
+
+def _render_turns(turns: List[Turn]) -> str:
+    return "\n".join(f"Human: {human.content}\nAI: {ai.content}" for human, ai, _ in turns)
+
+
+def llm_summarizer(max_tokens: int) -> Summarizer:
+    def summarize(summary: str, turns: List[Turn]) -> str:
+        return chains.get('summary').invoke({
+            "max_tokens": max_tokens,
+            "summary": summary or "（無）",
+            # Turns are stored as the user wrote them; the prompt gets sensitive terms rewritten.
+            "new_lines": clients.rewrite_for_llm(_render_turns(turns)),
+        })
+    return summarize
+
+
+class SummarizingTokenMemory:
+    """Conversation memory with a hard token budget.
+
+    The last ``keep_turns`` turns are kept verbatim. Older turns are folded into a
+    rolling summary by a background LLM call (greenlet or thread, see
+    app/utils/concurrency.py), so summarization never sits on the request path.
+    Until a turn has been folded in it stays available verbatim if the budget allows.
+    ``buffer`` never renders more than ``max_tokens``: it keeps the newest turns
+    first, then the summary, and cuts the newest turn itself if it alone is too large.
+
+    Drop-in for the ConversationBufferMemory(return_messages=True) HrTalk used:
+    ``buffer`` returns messages and ``save_context`` takes {"input"} / {"output"}.
+    """
+
+    def __init__(self, max_tokens: int = 2000, keep_turns: int = 3, summary_max_tokens: int = 400,
+                 summarizer: Optional[Summarizer] = None):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer or llm_summarizer(summary_max_tokens)
+        self.summary = ""
+        self.last_token_count = 0
+        self._turns: List[Turn] = []
+        self._pending: List[Turn] = []
+        self._summarizing = False
+        self._lock = threading.Lock()
+        # Called from the background worker after pending turns were folded into the summary.
+        self.on_summary: Optional[Callable[[], None]] = None
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, Any]):
+        human = HumanMessage(content=inputs["input"])
+        ai = AIMessage(content=outputs["output"])
+        tokens = count_tokens(human.content) + count_tokens(ai.content)
+        with self._lock:
+            self._turns.append((human, ai, tokens))
+            while len(self._turns) > self.keep_turns:
+                self._pending.append(self._turns.pop(0))
+            start = bool(self._pending) and not self._summarizing
+            if start:
+                self._summarizing = True
+        if start:
+            concurrency.spawn(self._summarize_pending)
+
+    def _summarize_pending(self):
+        folded = False
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.summary
+                if not batch:
+                    self._summarizing = False
+                    break
+            try:
+                new_summary = self.summarizer(summary, batch)
+            except Exception as e:
+                logging.warning(f"History summarization failed, keeping turns verbatim for now: {e}")
+                with self._lock:
+                    self._summarizing = False
+                return
+            with self._lock:
+                self.summary = truncate_to_tokens(new_summary.strip(), self.summary_max_tokens)
+                # Only this batch was folded in; turns that aged out meanwhile stay pending.
+                del self._pending[:len(batch)]
+            folded = True
+        if folded and self.on_summary is not None:
+            try:
+                self.on_summary()
+            except Exception as e:
+                logging.warning(f"on_summary callback failed: {e}")
+
+    def wait_for_summary(self, timeout: float = 30.0):
+        """Block until background summarization is idle (benchmarks and shutdown)."""
+        deadline = time.monotonic() + timeout
+        while self._summarizing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @property
+    def buffer(self) -> List[BaseMessage]:
+        with self._lock:
+            candidates = self._pending + self._turns
+            summary = self.summary
+
+        budget = self.max_tokens
+        selected: List[Turn] = []
+        for human, ai, tokens in reversed(candidates):
+            if tokens <= budget:
+                selected.append((human, ai, tokens))
+                budget -= tokens
+            elif not selected:
+                # The newest turn alone is over budget: cut the answer first, then the question
+                # too if it does not fit on its own.
+                question = truncate_to_tokens(human.content, budget)
+                question_tokens = count_tokens(question)
+                answer = truncate_to_tokens(ai.content, budget - question_tokens)
+                used = question_tokens + count_tokens(answer)
+                selected.append((HumanMessage(content=question), AIMessage(content=answer), used))
+                budget -= used
+            else:
+                break
+
+        messages: List[BaseMessage] = []
+        summary_text = f"先前對話摘要：{summary}"
+        summary_tokens = count_tokens(summary_text)
+        if summary and summary_tokens <= budget:
+            messages.append(SystemMessage(content=summary_text))
+            budget -= summary_tokens
+        for human, ai, _ in reversed(selected):
+            messages.extend((human, ai))
+        self.last_token_count = self.max_tokens - budget
+        return messages
+
+    def to_state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "summary": self.summary,
+                "turns": [[human.content, ai.content, tokens] for human, ai, tokens in self._turns],
+                "pending": [[human.content, ai.content, tokens] for human, ai, tokens in self._pending],
+            }
+
+    def load_state(self, state: Dict[str, Any]):
+        """Restore from to_state(). Turns another worker had not summarized yet are
+        folded in now, in the background."""
+        def turns(rows):
+            return [(HumanMessage(content=human), AIMessage(content=ai), tokens) for human, ai, tokens in rows]
+
+        with self._lock:
+            self.summary = state.get("summary", "")
+            self._turns = turns(state.get("turns", []))
+            self._pending = turns(state.get("pending", []))
+            start = bool(self._pending) and not self._summarizing
+            if start:
+                self._summarizing = True
+        if start:
+            concurrency.spawn(self._summarize_pending)
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._pending.clear()
+            self.summary = ""
+            self.last_token_count = 0
@@ -0,0 +1,151 @@
+"""Bounded registry of live HrTalk sessions in one worker.
+
+Keeps recently used sessions in memory so a follow-up does not pay for rebuilding
+HrTalk from the session store, while capping what a long-running worker holds:
+at most ``max_sessions`` live sessions, least recently used evicted first, and
+sessions idle for ``idle_ttl`` seconds dropped on the next access to the registry.
+An evicted session is handed to ``spill`` (if given) before it is dropped, which is
+how ConversationManager writes sessions back to disk when it is not writing every
+turn through to the store.
+
+Each entry carries an approximate size in bytes (see ``approx_size``), so
+``stats()`` can report what the sessions in a worker actually cost.
+"""
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+def approx_size(obj: Any) -> int:
+    """Rough deep size of JSON-like data (dicts, lists, tuples, sets, strings, numbers)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(key) + approx_size(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(approx_size(item) for item in obj)
+    return size
+
+
+class _Entry:
+    __slots__ = ('talk', 'last_used', 'approx_bytes')
+
+    def __init__(self, talk, approx_bytes: int):
+        self.talk = talk
+        self.last_used = time.monotonic()
+        self.approx_bytes = approx_bytes
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions: int = 2000, idle_ttl: float = 30 * 60,
+                 spill: Optional[Callable[[str, Any], None]] = None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.spill = spill
+        self._sessions: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+        self.spilled = 0
+
+    def get(self, session_id: str):
+        self._evict_idle()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return entry.talk
+
+    def put(self, session_id: str, talk, approx_bytes: int = 0):
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self._bytes -= previous.approx_bytes
+            self._sessions[session_id] = _Entry(talk, approx_bytes)
+            self._bytes += approx_bytes
+            overflow = []
+            while len(self._sessions) > self.max_sessions:
+                overflow.append(self._pop_oldest())
+            self.evicted += len(overflow)
+        self._spill(overflow)
+        self._evict_idle()
+
+    def resize(self, session_id: str, talk, approx_bytes: int):
+        """Update the size of a session that is still live as ``talk``; never revives it."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and entry.talk is talk:
+                self._bytes += approx_bytes - entry.approx_bytes
+                entry.approx_bytes = approx_bytes
+
+    def remove(self, session_id: str):
+        """Drop a session without spilling it (the conversation has ended); returns it, if it was live."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return None
+            self._bytes -= entry.approx_bytes
+            return entry.talk
+
+    def flush(self):
+        """Spill every live session, e.g. when the worker shuts down."""
+        with self._lock:
+            entries = [self._pop_oldest() for _ in range(len(self._sessions))]
+        self._spill(entries)
+
+    def _pop_oldest(self):
+        session_id, entry = self._sessions.popitem(last=False)
+        self._bytes -= entry.approx_bytes
+        return session_id, entry
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        idle = []
+        with self._lock:
+            # Entries are in last-used order, so the idle ones are all at the front.
+            while self._sessions:
+                entry = next(iter(self._sessions.values()))
+                if entry.last_used > deadline:
+                    break
+                idle.append(self._pop_oldest())
+            self.expired += len(idle)
+        self._spill(idle)
+
+    def _spill(self, entries):
+        if self.spill is None:
+            return
+        for session_id, entry in entries:
+            try:
+                self.spill(session_id, entry.talk)
+                self.spilled += 1
+            except Exception as e:
+                logging.warning(f"Failed to spill session {session_id}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live = len(self._sessions)
+            largest = max((entry.approx_bytes for entry in self._sessions.values()), default=0)
+            return {
+                'live_sessions': live,
+                'max_sessions': self.max_sessions,
+                'approx_bytes': self._bytes,
+                'approx_bytes_per_session': self._bytes // live if live else 0,
+                'approx_bytes_largest_session': largest,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evicted': self.evicted,
+                'expired': self.expired,
+                'spilled': self.spilled,
+            }
@@ -0,0 +1,220 @@
+"""Where conversation state lives between requests.
+
+gunicorn runs several workers, so a follow-up question can land on a worker that did
+not serve the previous turn. ConversationManager therefore loads a session's state
+from a SessionStore at the start of every request and saves it at the end. The
+state is an opaque blob: compact JSON from HrTalk.to_state(), zlib-compressed, stored
+with the session's revision so a worker can tell whether its live copy is current
+without fetching the blob.
+
+Backends:
+  memory  per-process LRU with idle TTL; only correct with a single worker
+  sqlite  a WAL-mode SQLite file shared by all workers on the host
+  redis   any Redis-compatible server (needs the optional ``redis`` package)
+"""
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import SessionStoreConfig
+
+
+def dumps_state(state: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def loads_state(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def save(self, session_id: str, data: bytes, revision: int = 0):
+        ...
+
+    @abstractmethod
+    def revision(self, session_id: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, max_entries: int = 10000, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            data, saved_at, _ = entry
+            if time.time() - saved_at > self.ttl:
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return data
+
+    def save(self, session_id: str, data: bytes, revision: int = 0):
+        with self._lock:
+            self._entries[session_id] = (data, time.time(), revision)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def revision(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[2]
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteSessionStore(SessionStore):
+    # Expired rows are purged on every Nth save rather than on each request.
+    purge_every = 500
+
+    def __init__(self, db_path: str, ttl: float = 24 * 3600):
+        self.db_path = db_path
+        self.ttl = ttl
+        # One connection per thread (per greenlet under gevent's patched threading).
+        self._local = threading.local()
+        self._saves = 0
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                revision INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(sessions)')]
+        if 'revision' not in columns:
+            conn.execute('ALTER TABLE sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)')
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            'SELECT data FROM sessions WHERE session_id = ? AND updated_at >= ?',
+            (session_id, time.time() - self.ttl),
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, session_id: str, data: bytes, revision: int = 0):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (session_id, data, updated_at, revision) VALUES (?, ?, ?, ?)',
+                (session_id, sqlite3.Binary(data), time.time(), revision),
+            )
+        self._saves += 1
+        if self._saves % self.purge_every == 0:
+            with conn:
+                purged = conn.execute('DELETE FROM sessions WHERE updated_at < ?', (time.time() - self.ttl,)).rowcount
+            if purged:
+                logging.info(f"Purged {purged} expired sessions from {self.db_path}")
+
+    def revision(self, session_id: str) -> Optional[int]:
+        row = self._connect().execute(
+            'SELECT revision FROM sessions WHERE session_id = ? AND updated_at >= ?',
+            (session_id, time.time() - self.ttl),
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id: str):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+    def count(self) -> int:
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM sessions WHERE updated_at >= ?', (time.time() - self.ttl,)
+        ).fetchone()[0]
+
+
+class RedisSessionStore(SessionStore):
+    def __init__(self, url: str, ttl: float = 24 * 3600, key_prefix: str = 'hr:session:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SessionStoreConfig.backend = 'redis' requires the redis package (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.key_prefix = key_prefix
+
+    def _key(self, session_id: str) -> str:
+        if not session_id:
+            raise ValueError(f"Invalid session_id: {session_id!r}")
+        return self.key_prefix + session_id
+
+    def load(self, session_id: str) -> Optional[bytes]:
+        return self._redis.get(self._key(session_id))
+
+    def save(self, session_id: str, data: bytes, revision: int = 0):
+        key = self._key(session_id)
+        pipe = self._redis.pipeline()
+        pipe.set(key, data, ex=self.ttl)
+        pipe.set(key + ':rev', revision, ex=self.ttl)
+        pipe.execute()
+
+    def revision(self, session_id: str) -> Optional[int]:
+        value = self._redis.get(self._key(session_id) + ':rev')
+        return int(value) if value is not None else None
+
+    def delete(self, session_id: str):
+        key = self._key(session_id)
+        self._redis.delete(key, key + ':rev')
+
+    def count(self) -> int:
+        return sum(1 for key in self._redis.scan_iter(match=self.key_prefix + '*', count=1000)
+                   if not key.endswith(b':rev'))
+
+
+def create_session_store(backend: Optional[str] = None) -> SessionStore:
+    backend = backend or SessionStoreConfig.backend
+    if backend == 'memory':
+        return MemorySessionStore(max_entries=SessionStoreConfig.max_entries, ttl=SessionStoreConfig.ttl_seconds)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(SessionStoreConfig.sqlite_path, ttl=SessionStoreConfig.ttl_seconds)
+    if backend == 'redis':
+        return RedisSessionStore(SessionStoreConfig.redis_url, ttl=SessionStoreConfig.ttl_seconds,
+                                 key_prefix=SessionStoreConfig.key_prefix)
+    raise ValueError(f"Unknown session store backend: {backend}")
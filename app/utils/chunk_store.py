@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from app.utils import faiss_index
+from app.utils.chunk_tags import TagIndex, chunk_tags
+from app.utils.disk_docstore import DiskDocstore, write_docstore
+from app.utils.keyword_index import BM25Index, term_frequencies
+
+# Every chunk ingested before the index was tagged came from Azure ada-002.
+LEGACY_EMBEDDING_MODEL = 'text-embedding-ada-002'
+
+
+class ChunkStore:
+    """Chunk-level vector store in SQLite.
+
+    One row per chunk holds its text, metadata and float32 embedding, keyed back to
+    the source file in ``file_metadata``; ``chunk_terms`` holds each chunk's jieba term
+    frequencies for the BM25 index and ``chunk_tags`` its retrieval filter tags. Writes are per file, so a changed file only
+    replaces its own chunks, and every write bumps the ``index_meta`` version stamp
+    that workers use to decide whether to rebuild their resident index. Each version
+    is exported once to ``index_dir`` as a FAISS index file and an on-disk docstore,
+    which every worker memory-maps; the previous export is removed with the next one.
+    """
+
+    def __init__(self, db_path: str, index_dir: Optional[str] = None):
+        self.db_path = db_path
+        self.index_dir = index_dir or os.path.splitext(db_path)[0] + '_index'
+
+    def init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    embedding BLOB NOT NULL
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_filename ON chunks (filename)")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chunk_terms (
+                    chunk_id INTEGER NOT NULL,
+                    term TEXT NOT NULL,
+                    tf INTEGER NOT NULL
+                )
+            ''')
+            # Unique, so workers backfilling the same chunks at startup cannot double-count terms.
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_chunk_terms ON chunk_terms (chunk_id, term)")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chunk_tags (
+                    chunk_id INTEGER NOT NULL,
+                    tag TEXT NOT NULL
+                )
+            ''')
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_chunk_tags ON chunk_tags (chunk_id, tag)")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS index_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            # Trained indexes used to be stored here; they are files in index_dir now.
+            cursor.execute("DROP TABLE IF EXISTS faiss_indexes")
+            self._migrate_legacy_blob(cursor)
+            self._backfill_terms(cursor)
+            self._backfill_tags(cursor)
+            conn.commit()
+
+    @staticmethod
+    def _migrate_legacy_blob(cursor):
+        # The old store kept one pickled FAISS blob with no link back to files. Forget the
+        # processed-file hashes so pdf_loader re-ingests everything into per-chunk rows.
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'vector_store'")
+        if not cursor.fetchone():
+            return
+        cursor.execute("SELECT COUNT(*) FROM chunks")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("DELETE FROM file_metadata")
+            logging.info("Dropping legacy vector_store blob; all files will be re-ingested.")
+        cursor.execute("DROP TABLE vector_store")
+
+    @staticmethod
+    def _insert_terms(cursor, chunks: Iterable[Tuple[int, str]]):
+        cursor.executemany(
+            "INSERT OR IGNORE INTO chunk_terms (chunk_id, term, tf) VALUES (?, ?, ?)",
+            ((chunk_id, term, tf) for chunk_id, content in chunks for term, tf in term_frequencies(content).items()),
+        )
+
+    @classmethod
+    def _backfill_terms(cls, cursor):
+        # Chunks ingested before the keyword index existed get their terms once, in place.
+        cursor.execute('''
+            SELECT chunk_id, content FROM chunks
+            WHERE chunk_id NOT IN (SELECT DISTINCT chunk_id FROM chunk_terms)
+        ''')
+        missing = cursor.fetchall()
+        if missing:
+            logging.info(f"Tokenizing {len(missing)} chunks for the keyword index")
+            cls._insert_terms(cursor, missing)
+            cls._bump_version(cursor)
+
+    @staticmethod
+    def _insert_tags(cursor, chunks: Iterable[Tuple[int, str, str, str]]):
+        cursor.executemany(
+            "INSERT OR IGNORE INTO chunk_tags (chunk_id, tag) VALUES (?, ?)",
+            ((chunk_id, tag) for chunk_id, filename, content, metadata in chunks
+             for tag in chunk_tags(filename, content, json.loads(metadata))),
+        )
+
+    @classmethod
+    def _backfill_tags(cls, cursor):
+        # Every chunk has at least its source tag, so untagged chunks predate chunk_tags.
+        cursor.execute('''
+            SELECT chunk_id, filename, content, metadata FROM chunks
+            WHERE chunk_id NOT IN (SELECT DISTINCT chunk_id FROM chunk_tags)
+        ''')
+        missing = cursor.fetchall()
+        if missing:
+            logging.info(f"Tagging {len(missing)} chunks for retrieval filters")
+            cls._insert_tags(cursor, missing)
+            cls._bump_version(cursor)
+
+    @staticmethod
+    def _bump_version(cursor) -> int:
+        cursor.execute('''
+            INSERT INTO index_meta (key, value) VALUES ('version', 1)
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        ''')
+        cursor.execute("SELECT value FROM index_meta WHERE key = 'version'")
+        return int(cursor.fetchone()[0])
+
+    def bind_embedding_model(self, model: str):
+        """Tag the index with the embedding ``model``; chunks of any other model are dropped.
+
+        Vectors from different models are not comparable (nor, usually, the same
+        size), so on a model change every file is re-ingested by the next pdf_loader.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            # IMMEDIATE: workers starting together see one consistent check-and-reset.
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM index_meta WHERE key = 'embedding_model'").fetchone()
+            stored = row[0] if row else None
+            if stored is None and conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]:
+                stored = LEGACY_EMBEDDING_MODEL
+            if stored is not None and stored != model:
+                logging.warning(f"Index was embedded with {stored}, now {model}; dropping chunks for re-ingest.")
+                cursor = conn.cursor()
+                for table in ('chunk_terms', 'chunk_tags', 'chunks', 'file_metadata'):
+                    cursor.execute(f"DELETE FROM {table}")
+                self._bump_version(cursor)
+            if stored != model:
+                conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('embedding_model', ?)", (model,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get_embedding_model(self) -> Optional[str]:
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT value FROM index_meta WHERE key = 'embedding_model'").fetchone()
+            return row[0] if row else None
+
+    def get_version(self) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM index_meta WHERE key = 'version'")
+            result = cursor.fetchone()
+            return int(result[0]) if result else 0
+
+    def replace_file(self, filename: str, file_hash: str, documents: Sequence[Document],
+                     vectors: Sequence[Sequence[float]]) -> int:
+        """Atomically swap the chunks of ``filename`` for ``documents`` and record its new hash."""
+        rows = [
+            (filename, file_hash, i, doc.page_content,
+             json.dumps(doc.metadata, ensure_ascii=False, default=str),
+             np.asarray(vector, dtype=np.float32).tobytes())
+            for i, (doc, vector) in enumerate(zip(documents, vectors))
+        ]
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            self._delete_chunks(cursor, filename)
+            cursor.executemany('''
+                INSERT INTO chunks (filename, file_hash, chunk_index, content, metadata, embedding)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.execute("SELECT chunk_id, filename, content, metadata FROM chunks WHERE filename = ?", (filename,))
+            chunks = cursor.fetchall()
+            self._insert_terms(cursor, ((chunk_id, content) for chunk_id, _, content, _ in chunks))
+            self._insert_tags(cursor, chunks)
+            cursor.execute('''
+                INSERT OR REPLACE INTO file_metadata (filename, file_hash, last_processed)
+                VALUES (?, ?, ?)
+            ''', (filename, file_hash, datetime.now()))
+            version = self._bump_version(cursor)
+            conn.commit()
+        return version
+
+    @staticmethod
+    def _delete_chunks(cursor, filename: str):
+        for table in ('chunk_terms', 'chunk_tags'):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE filename = ?)", (filename,)
+            )
+        cursor.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+
+    def delete_file(self, filename: str) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            self._delete_chunks(cursor, filename)
+            cursor.execute("DELETE FROM file_metadata WHERE filename = ?", (filename,))
+            version = self._bump_version(cursor)
+            conn.commit()
+        return version
+
+    def get_indexed_files(self) -> List[str]:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT filename FROM file_metadata")
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_file_documents(self, filename: str) -> List[Document]:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT content, metadata FROM chunks WHERE filename = ? ORDER BY chunk_index", (filename,)
+            )
+            return [Document(page_content=content, metadata=json.loads(metadata))
+                    for content, metadata in cursor.fetchall()]
+
+    def count(self) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM chunks")
+            return cursor.fetchone()[0]
+
+    def build_keyword_index(self, k1: float = 1.5, b: float = 0.75) -> BM25Index:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT chunk_id, term, tf FROM chunk_terms")
+            return BM25Index.from_rows(cursor, k1=k1, b=b)
+
+    def build_tag_index(self) -> TagIndex:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT chunk_id, tag FROM chunk_tags")
+            return TagIndex.from_rows(cursor)
+
+    def _index_base(self, version: int, spec: str) -> str:
+        return os.path.join(self.index_dir, f"v{version}-{spec.replace(',', '_')}")
+
+    def _export(self, version: int, spec: str, rows: List[tuple], dim: int, ef_construction: int,
+                max_train_points: int):
+        """Build the index of ``spec`` over ``rows`` and write it and the docstore for ``version``."""
+        base = self._index_base(version, spec)
+        os.makedirs(self.index_dir, exist_ok=True)
+        # One join, then frombuffer views the joined bytes without another copy.
+        matrix = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.float32).reshape(len(rows), dim)
+        start = time.perf_counter()
+        index = faiss_index.build_index(matrix, spec, ef_construction=ef_construction,
+                                        max_train_points=max_train_points)
+        logging.info(f"Built FAISS {spec} over {len(rows)} chunks in {time.perf_counter() - start:.1f}s")
+        write_docstore(base, ((chunk_id, content, metadata) for chunk_id, content, metadata, _ in rows))
+        # Written last: its presence means the whole version is on disk.
+        faiss_index.write_index(index, base + '.faiss')
+
+        # The previously exported version stays until the next export: a worker that read
+        # its stamp just before this one may not have opened its files yet. Workers still
+        # serving anything older keep their mappings; unlinking does not unmap.
+        versions = {}
+        for name in os.listdir(self.index_dir):
+            stamp = name.split('-', 1)[0]
+            if stamp[:1] == 'v' and stamp[1:].isdigit() and int(stamp[1:]) < version:
+                versions.setdefault(int(stamp[1:]), []).append(name)
+        if versions:
+            del versions[max(versions)]
+        for name in (name for names in versions.values() for name in names):
+            try:
+                os.remove(os.path.join(self.index_dir, name))
+            except OSError:
+                pass
+
+    def build_vector_store(self, embeddings: Embeddings, index_type: str = 'flat', nprobe: int = 16,
+                           ef_search: int = 128, ef_construction: int = 200, max_train_points: int = 100_000,
+                           mmap: bool = True, **spec_options) -> Optional[FAISS]:
+        """Open the FAISS index of ``index_type`` (see faiss_index) for the current version.
+
+        The first process to ask for a version builds (and trains) the index from the
+        chunk rows and exports it to ``index_dir``; every later one only opens the
+        files. With ``mmap`` the index vectors and the docstore stay in the shared
+        page cache; without it both are copied into process memory.
+        ``spec_options`` go to faiss_index.factory_string.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        rows = None
+        try:
+            # One read transaction, so the rows and the version stamp belong together.
+            conn.execute("BEGIN")
+            row = conn.execute("SELECT value FROM index_meta WHERE key = 'version'").fetchone()
+            version = int(row[0]) if row else 0
+            n, size = conn.execute("SELECT COUNT(*), MAX(length(embedding)) FROM chunks").fetchone()
+            if n:
+                dim = size // np.dtype(np.float32).itemsize
+                spec = faiss_index.factory_string(index_type, dim, n, **spec_options)
+                base = self._index_base(version, spec)
+                if not os.path.exists(base + '.faiss'):
+                    rows = conn.execute(
+                        "SELECT chunk_id, content, metadata, embedding FROM chunks ORDER BY chunk_id"
+                    ).fetchall()
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if not n:
+            return None
+        if rows is not None:
+            self._export(version, spec, rows, dim, ef_construction, max_train_points)
+            del rows
+
+        index = faiss_index.tune(faiss_index.read_index(base + '.faiss', mmap=mmap), nprobe=nprobe,
+                                 ef_search=ef_search)
+        docstore = DiskDocstore(base)
+        if mmap:
+            return FAISS(embeddings, index, docstore, docstore.index_to_docstore_id())
+        return FAISS(embeddings, index, InMemoryDocstore(docstore.to_dict()), dict(docstore.index_to_docstore_id()))
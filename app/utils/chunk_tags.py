@@ -0,0 +1,132 @@
+"""Chunk metadata tags and the per-tag ID index used to pre-filter retrieval.
+
+Every chunk is tagged at ingest (``chunk_tags`` in hr_data.db, written per file by
+ChunkStore.replace_file) with its source type, the HR topics it mentions and the
+articles it contains:
+
+    source:csv | source:company_rule | source:law
+    topic:<EntityType category>       e.g. topic:time_management
+    article:第N條
+
+At query time the NLU intent and entity types, plus any article number in the
+query, become tag groups; TagIndex narrows the candidate chunk IDs to the chunks
+that match them before BM25 and FAISS run.
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.keyword_index import article_terms
+from app.utils.utils import EntityType, HRIntentCategory
+
+SOURCE_CSV = 'source:csv'
+SOURCE_COMPANY_RULE = 'source:company_rule'
+SOURCE_LAW = 'source:law'
+
+# Top-level EntityType categories and the words that mark a chunk as being about them.
+TOPIC_KEYWORDS: Dict[EntityType, Tuple[str, ...]] = {
+    EntityType.COMPENSATION: ('薪資', '薪水', '工資', '津貼', '獎金', '加給', '福利', '報支', '補助', '費用'),
+    EntityType.PERFORMANCE: ('績效', '考績', '考核', 'kpi', '目標'),
+    EntityType.TIME_MANAGEMENT: ('請假', '假', '出勤', '工時', '工作時間', '加班', '休假', '打卡', '遲到'),
+    EntityType.CAREER_DEVELOPMENT: ('晉升', '升遷', '培訓', '訓練', '職涯', '進修'),
+    EntityType.RECRUITMENT: ('招募', '招聘', '面試', '錄用', '試用', '報到', '到職'),
+    EntityType.EMPLOYEE_RELATIONS: ('申訴', '性騷擾', '溝通', '獎懲', '懲戒', '員工關係'),
+    EntityType.ORGANIZATION: ('部門', '職等', '職級', '職位', '組織', '主管'),
+    EntityType.COMPLIANCE: ('法令', '法規', '政策', '保密', '道德', '違反', '罰'),
+    EntityType.HEALTH_SAFETY: ('健康', '安全', '職業災害', '醫療', '檢查'),
+    EntityType.OFFBOARDING: ('離職', '資遣', '解僱', '終止', '退休'),
+}
+# time_* and career_* entity types live under time_management and career_development.
+_TOPIC_ALIASES = {'time': EntityType.TIME_MANAGEMENT, 'career': EntityType.CAREER_DEVELOPMENT}
+
+# Intents that only make sense against some source types.
+INTENT_SOURCES: Dict[HRIntentCategory, Tuple[str, ...]] = {
+    HRIntentCategory.QUERY_POLICY: (SOURCE_COMPANY_RULE, SOURCE_LAW),
+    HRIntentCategory.PROCESS: (SOURCE_COMPANY_RULE, SOURCE_CSV),
+    HRIntentCategory.PROCESS_INITIATE: (SOURCE_COMPANY_RULE, SOURCE_CSV),
+    HRIntentCategory.PROCESS_UPDATE: (SOURCE_COMPANY_RULE, SOURCE_CSV),
+    HRIntentCategory.PROCESS_COMPLETE: (SOURCE_COMPANY_RULE, SOURCE_CSV),
+    HRIntentCategory.REQUEST_APPROVAL: (SOURCE_COMPANY_RULE, SOURCE_CSV),
+    HRIntentCategory.REQUEST_DOCUMENT: (SOURCE_COMPANY_RULE, SOURCE_CSV),
+}
+ENTITY_SOURCES: Dict[EntityType, Tuple[str, ...]] = {
+    EntityType.COMPLIANCE_REGULATION: (SOURCE_LAW,),
+}
+
+
+def source_tag(filename: str, metadata: Optional[dict] = None) -> str:
+    if (metadata or {}).get('source_type') == 'csv' or os.path.splitext(filename)[1].lower() == '.csv':
+        return SOURCE_CSV
+    if '法令規定' in filename:
+        return SOURCE_LAW
+    return SOURCE_COMPANY_RULE
+
+
+def topic_of(entity_type: EntityType) -> Optional[EntityType]:
+    """The top-level category of an entity type (time_leave -> time_management)."""
+    for topic in TOPIC_KEYWORDS:
+        if entity_type.value.startswith(topic.value):
+            return topic
+    return _TOPIC_ALIASES.get(entity_type.value.split('_')[0])
+
+
+def chunk_tags(filename: str, content: str, metadata: Optional[dict] = None) -> List[str]:
+    tags = [source_tag(filename, metadata)]
+    lowered = content.lower()
+    tags.extend(f'topic:{topic.value}' for topic, words in TOPIC_KEYWORDS.items()
+                if any(word in lowered for word in words))
+    tags.extend(dict.fromkeys(f'article:{term}' for term in article_terms(content)))
+    return tags
+
+
+def query_tag_groups(query: str, intent: Optional[HRIntentCategory] = None,
+                     entity_types: Iterable[EntityType] = ()) -> List[List[str]]:
+    """Tag groups for a query, most specific first; a chunk matches a group if it has any of its tags."""
+    entity_types = list(entity_types)
+    articles = [f'article:{term}' for term in dict.fromkeys(article_terms(query))]
+    topics = dict.fromkeys(f'topic:{topic.value}' for topic in map(topic_of, entity_types) if topic is not None)
+    sources = dict.fromkeys(INTENT_SOURCES.get(intent, ()))
+    for entity_type in entity_types:
+        sources.update(dict.fromkeys(ENTITY_SOURCES.get(entity_type, ())))
+    return [list(group) for group in (articles, topics, sources) if group]
+
+
+class TagIndex:
+    def __init__(self):
+        self._ids: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, str]]) -> 'TagIndex':
+        """Build from ``(chunk_id, tag)`` rows, as stored in ``chunk_tags``."""
+        ids: Dict[str, List[int]] = {}
+        for chunk_id, tag in rows:
+            ids.setdefault(tag, []).append(chunk_id)
+        index = cls()
+        index._ids = {tag: np.unique(np.asarray(chunk_ids, dtype=np.int64)) for tag, chunk_ids in ids.items()}
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def ids(self, tags: Sequence[str]) -> np.ndarray:
+        """Sorted IDs of the chunks carrying any of ``tags``."""
+        arrays = [self._ids[tag] for tag in tags if tag in self._ids]
+        if not arrays:
+            return np.zeros(0, dtype=np.int64)
+        return arrays[0] if len(arrays) == 1 else np.unique(np.concatenate(arrays))
+
+    def candidates(self, groups: Sequence[Sequence[str]], min_size: int = 1) -> Optional[np.ndarray]:
+        """Chunk IDs matching the tag ``groups``, or None for no restriction.
+
+        Groups are applied in order and intersected; a group that would leave fewer
+        than ``min_size`` chunks is skipped, so a wrong or over-narrow NLU guess
+        falls back to a wider search instead of an empty one.
+        """
+        allowed = None
+        for group in groups:
+            ids = self.ids(group)
+            narrowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+            if len(narrowed) >= min_size:
+                allowed = narrowed
+        return allowed
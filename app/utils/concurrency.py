@@ -0,0 +1,55 @@
+"""Run blocking work (LLM round trips) next to the request without blocking it.
+
+Under gunicorn's gevent worker this spawns a greenlet; otherwise, e.g. under the
+Flask dev server or in benchmarks, it uses a small shared thread pool. Either way
+the caller gets an object with ``result(timeout=None)`` that raises
+concurrent.futures.TimeoutError when the timeout expires.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable
+
+from config import ChatConfig
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _gevent_active() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+class _GreenletFuture:
+    def __init__(self, greenlet):
+        self._greenlet = greenlet
+
+    def result(self, timeout: float = None) -> Any:
+        from gevent import Timeout
+        try:
+            return self._greenlet.get(timeout=timeout)
+        except Timeout:
+            raise TimeoutError() from None
+
+
+def spawn(fn: Callable, *args, **kwargs):
+    global _executor
+    if _gevent_active():
+        import gevent
+        return _GreenletFuture(gevent.spawn(fn, *args, **kwargs))
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ChatConfig.background_workers, thread_name_prefix="hr-bg")
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def result_within(future, timeout: float, default: Any = None) -> Any:
+    """The future's result if it arrives within ``timeout`` seconds, else ``default``."""
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        return default
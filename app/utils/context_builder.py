@@ -0,0 +1,123 @@
+"""Pack retrieved chunks into the ``{text}`` slot of data_chain within a token budget.
+
+Retrieval returns up to 8 overlapping chunks (the splitter uses 50% overlap) whose
+Document reprs carry metadata noise. build_context groups them by file and page,
+merges chunks that overlap or repeat, orders the blocks by the knowledge-source
+priority of initial_data_chain_prompt (csv, then company rules, then law) and
+renders each block under one short header: file path, page or row, articles.
+Blocks that no longer fit the budget are cut or dropped, lowest priority first.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from app.utils.chunk_tags import SOURCE_COMPANY_RULE, SOURCE_CSV, SOURCE_LAW, source_tag
+from app.utils.keyword_index import article_terms
+from app.utils.tokens import count_tokens, truncate_to_tokens
+
+SOURCE_PRIORITY = {SOURCE_CSV: 0, SOURCE_COMPANY_RULE: 1, SOURCE_LAW: 2}
+# Shortest suffix/prefix match treated as splitter overlap rather than coincidence.
+MIN_OVERLAP_CHARS = 20
+_SPACES = re.compile(r'[ \t　]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+
+
+def _merge(first: str, second: str) -> Optional[str]:
+    """``first`` followed by ``second`` if a suffix of ``first`` is a prefix of ``second``."""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    position = first.find(probe, max(0, len(first) - len(second)))
+    while position != -1:
+        overlap = len(first) - position
+        if overlap >= MIN_OVERLAP_CHARS and second.startswith(first[position:]):
+            return first + second[overlap:]
+        position = first.find(probe, position + 1)
+    return None
+
+
+def merge_overlapping(texts: Sequence[str]) -> List[str]:
+    """Drop repeated or contained texts and join the ones that overlap end to start."""
+    pieces: List[str] = []
+    for text in texts:
+        if any(text in piece for piece in pieces):
+            continue
+        pieces = [piece for piece in pieces if piece not in text]
+        pieces.append(text)
+        # A new piece can bridge two older ones; keep joining until nothing overlaps.
+        joined = True
+        while joined:
+            joined = False
+            for i in range(len(pieces)):
+                for j in range(len(pieces)):
+                    merged = _merge(pieces[i], pieces[j]) if i != j else None
+                    if merged is not None:
+                        pieces = [p for k, p in enumerate(pieces) if k not in (i, j)] + [merged]
+                        joined = True
+                        break
+                if joined:
+                    break
+    return pieces
+
+
+def _location(metadata: dict) -> str:
+    # CSVLoader rows are 0-based; pages are already 1-based (ingest_pipeline.parse_file).
+    if 'row' in metadata:
+        return f"第{int(metadata['row']) + 1}列"
+    if 'page' in metadata:
+        return f"第{int(metadata['page'])}頁"
+    return ""
+
+
+def _compact(text: str) -> str:
+    return _BLANK_LINES.sub('\n', _SPACES.sub(' ', text)).strip()
+
+
+def _articles(text: str) -> str:
+    articles = list(dict.fromkeys(article_terms(text)))
+    if len(articles) > 2:
+        return f"{articles[0]}～{articles[-1]}"
+    return '、'.join(articles)
+
+
+def _render(source: str, metadata: dict, text: str) -> str:
+    header = " ".join(part for part in (source, _location(metadata), _articles(text)) if part)
+    return f"[{header}]\n{_compact(text)}"
+
+
+def build_context(documents: Sequence[Document], max_tokens: int,
+                  min_block_tokens: int = 80) -> Tuple[str, Dict[str, int]]:
+    """The packed context for data_chain and its stats.
+
+    Stats: ``chunks`` retrieved, ``blocks`` after merging, ``kept`` blocks in the
+    context (the last may be cut), ``tokens`` of the context.
+    """
+    groups: Dict[Tuple[str, str], List[Document]] = {}
+    for doc in documents:
+        source = str(doc.metadata.get('source', 'Unknown'))
+        groups.setdefault((source, _location(doc.metadata)), []).append(doc)
+
+    blocks = []
+    for rank, ((source, _), docs) in enumerate(groups.items()):
+        priority = SOURCE_PRIORITY.get(source_tag(os.path.basename(source), docs[0].metadata), len(SOURCE_PRIORITY))
+        for text in merge_overlapping([doc.page_content for doc in docs]):
+            blocks.append((priority, rank, _render(source, docs[0].metadata, text)))
+    blocks.sort(key=lambda block: block[:2])
+
+    parts: List[str] = []
+    used = 0
+    for _, _, block in blocks:
+        remaining = max_tokens - used
+        tokens = count_tokens(block)
+        if tokens > remaining:
+            if remaining >= min_block_tokens:
+                parts.append(truncate_to_tokens(block, remaining))
+            break
+        parts.append(block)
+        used += tokens + 1
+
+    context = "\n\n".join(parts)
+    return context, {'chunks': len(documents), 'blocks': len(blocks), 'kept': len(parts),
+                     'tokens': count_tokens(context)}
@@ -0,0 +1,91 @@
+"""Read-only docstore of chunk texts in memory-mapped files, read lazily by chunk id.
+
+Written once per index version next to the FAISS index file. ``<base>.docs`` holds
+each chunk as a compact JSON ``[page_content, metadata]`` record, back to back, in
+FAISS position order; ``<base>.ids.npy`` holds the chunk id at each position
+(ascending) and ``<base>.offsets.npy`` the record boundaries. Every worker maps the
+same files, so the texts sit once in the OS page cache instead of once per worker,
+and a record is decoded only when retrieval returns its chunk.
+"""
+import json
+import mmap
+import os
+from typing import Iterable, Iterator, Mapping, Tuple, Union
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+DOCS_SUFFIX = '.docs'
+IDS_SUFFIX = '.ids.npy'
+OFFSETS_SUFFIX = '.offsets.npy'
+
+
+def write_docstore(base: str, rows: Iterable[Tuple[int, str, str]]):
+    """Write ``(chunk_id, content, metadata_json)`` rows, in position order, under ``base``."""
+    ids, offsets = [], [0]
+    tmp = f"{base}.{os.getpid()}.tmp"
+    with open(tmp + DOCS_SUFFIX, 'wb') as f:
+        for chunk_id, content, metadata in rows:
+            record = f'[{json.dumps(content, ensure_ascii=False)},{metadata}]'.encode('utf-8')
+            f.write(record)
+            ids.append(chunk_id)
+            offsets.append(offsets[-1] + len(record))
+    np.save(tmp + IDS_SUFFIX, np.asarray(ids, dtype=np.int64))
+    np.save(tmp + OFFSETS_SUFFIX, np.asarray(offsets, dtype=np.int64))
+    for suffix in (DOCS_SUFFIX, IDS_SUFFIX, OFFSETS_SUFFIX):
+        os.replace(tmp + suffix, base + suffix)
+
+
+class PositionIds(Mapping):
+    """FAISS position -> docstore id, as LangChain's FAISS expects, over the mapped ids array."""
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self.ids):
+            raise KeyError(position)
+        return str(int(self.ids[position]))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.ids)))
+
+
+class DiskDocstore(Docstore):
+    def __init__(self, base: str):
+        self.base = base
+        self.ids = np.load(base + IDS_SUFFIX, mmap_mode='r')
+        self.offsets = np.load(base + OFFSETS_SUFFIX, mmap_mode='r')
+        with open(base + DOCS_SUFFIX, 'rb') as f:
+            # mmap rejects empty files; an empty corpus never gets a docstore.
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index_to_docstore_id(self) -> PositionIds:
+        return PositionIds(self.ids)
+
+    def document_at(self, position: int) -> Document:
+        record = self._data[int(self.offsets[position]):int(self.offsets[position + 1])]
+        content, metadata = json.loads(record)
+        return Document(page_content=content, metadata=metadata)
+
+    def search(self, search: str) -> Union[str, Document]:
+        try:
+            chunk_id = int(search)
+        except ValueError:
+            return f"ID {search} not found."
+        position = int(np.searchsorted(self.ids, chunk_id))
+        if position == len(self.ids) or self.ids[position] != chunk_id:
+            return f"ID {search} not found."
+        return self.document_at(position)
+
+    def to_dict(self) -> dict:
+        """Every document by docstore id, for an InMemoryDocstore."""
+        return {str(int(chunk_id)): self.document_at(position) for position, chunk_id in enumerate(self.ids)}
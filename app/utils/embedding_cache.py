@@ -0,0 +1,177 @@
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+
+_SQLITE_MAX_VARS = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with a persistent cache keyed by (model, sha256(text)).
+
+    Vectors are kept as float32 BLOBs in the ``embedding_cache`` table of hr_data.db,
+    so unchanged chunks of a re-ingested file are never sent to the API again, and an
+    in-memory LRU in front of it answers repeated chat queries without touching SQLite.
+    """
+
+    def __init__(self, embeddings: Embeddings, db_path: str, model: Optional[str] = None, lru_size: int = 2048):
+        self.embeddings = embeddings
+        self.db_path = db_path
+        self.model = model or getattr(embeddings, 'model', None) or type(embeddings).__name__
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {
+            f'{kind}_{name}': 0
+            for kind in ('query', 'document')
+            for name in ('memory_hits', 'disk_hits', 'misses', 'api_calls', 'api_seconds')
+        }
+        self.init_db()
+
+    def init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+            ''')
+            conn.commit()
+
+    def _lru_get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+            return vector
+
+    def _lru_put(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _disk_get(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with sqlite3.connect(self.db_path) as conn:
+            for offset in range(0, len(keys), _SQLITE_MAX_VARS):
+                batch = keys[offset:offset + _SQLITE_MAX_VARS]
+                cursor = conn.execute(
+                    f"SELECT text_hash, embedding FROM embedding_cache WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    (self.model, *batch),
+                )
+                for key, blob in cursor.fetchall():
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _disk_put(self, items: Dict[str, np.ndarray]):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding) VALUES (?, ?, ?)",
+                    [(self.model, key, vector.tobytes()) for key, vector in items.items()],
+                )
+                conn.commit()
+        except sqlite3.OperationalError as e:
+            # The cache is best effort; a locked DB must not fail ingest or a chat turn.
+            logging.warning(f"Embedding cache write skipped: {e}")
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def _lookup(self, keys: List[str]) -> Tuple[Dict[str, np.ndarray], int, int]:
+        vectors: Dict[str, np.ndarray] = {}
+        for key in set(keys):
+            vector = self._lru_get(key)
+            if vector is not None:
+                vectors[key] = vector
+        memory_hits = len(vectors)
+
+        missing = [key for key in set(keys) if key not in vectors]
+        disk = self._disk_get(missing) if missing else {}
+        for key, vector in disk.items():
+            vectors[key] = vector
+            self._lru_put(key, vector)
+        return vectors, memory_hits, len(disk)
+
+    def _remember(self, vectors: Dict[str, np.ndarray], keys: List[str], fresh: List[List[float]]):
+        new_items = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(keys, fresh)}
+        self._disk_put(new_items)
+        for key, vector in new_items.items():
+            vectors[key] = vector
+            self._lru_put(key, vector)
+
+    def _embed(self, texts: List[str], kind: str) -> List[np.ndarray]:
+        keys = [text_hash(text) for text in texts]
+        vectors, memory_hits, disk_hits = self._lookup(keys)
+
+        to_embed = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                to_embed.setdefault(key, text)
+        if to_embed:
+            start = time.perf_counter()
+            if kind == 'query':
+                fresh = [self.embeddings.embed_query(next(iter(to_embed.values())))]
+            else:
+                fresh = self.embeddings.embed_documents(list(to_embed.values()))
+            self._count(**{f'{kind}_api_calls': 1, f'{kind}_api_seconds': time.perf_counter() - start})
+            self._remember(vectors, list(to_embed), fresh)
+
+        self._count(**{
+            f'{kind}_memory_hits': memory_hits, f'{kind}_disk_hits': disk_hits, f'{kind}_misses': len(to_embed),
+        })
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self._embed(list(texts), 'document')]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], 'query')[0].tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Cache lookups stay synchronous (LRU dict, one indexed SQLite read); only a miss awaits the API.
+        key = text_hash(text)
+        vectors, memory_hits, disk_hits = self._lookup([key])
+        misses = 0 if key in vectors else 1
+        if misses:
+            start = time.perf_counter()
+            fresh = [await self.embeddings.aembed_query(text)]
+            self._count(query_api_calls=1, query_api_seconds=time.perf_counter() - start)
+            self._remember(vectors, [key], fresh)
+        self._count(query_memory_hits=memory_hits, query_disk_hits=disk_hits, query_misses=misses)
+        return vectors[key].tolist()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.counters)
+        total_hits = total_lookups = 0
+        stats['saved_seconds'] = 0.0
+        for kind in ('query', 'document'):
+            hits = stats[f'{kind}_memory_hits'] + stats[f'{kind}_disk_hits']
+            lookups = hits + stats[f'{kind}_misses']
+            stats[f'{kind}_hit_rate'] = hits / lookups if lookups else 0.0
+            # API time avoided, at the observed cost of one query call / one document text.
+            unit = stats[f'{kind}_api_calls'] if kind == 'query' else stats[f'{kind}_misses']
+            stats['saved_seconds'] += hits * (stats[f'{kind}_api_seconds'] / unit if unit else 0.0)
+            total_hits += hits
+            total_lookups += lookups
+        stats['hit_rate'] = total_hits / total_lookups if total_lookups else 0.0
+        return stats
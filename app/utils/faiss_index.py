@@ -0,0 +1,145 @@
+"""FAISS index types for the chunk vectors: exact flat, IVF-Flat, HNSW, IVF-PQ and IVF-SQ8.
+
+Flat is exact but its memory and search time grow with every chunk. The approximate
+types trade a little recall for speed (IVF probes ``nprobe`` of ``nlist`` clusters,
+HNSW walks a graph with ``efSearch`` candidates) and the compressed ones also for
+memory: IVF-PQ keeps ``pq_m`` bytes per vector and IVF-SQ8 one byte per dimension,
+against 4 bytes per dimension for flat (6 KB per ada-002 vector).
+
+IVF types are trained on the corpus and HNSW builds a graph, both too slow to redo
+in every worker, so ChunkStore writes the built index to a file per index version
+and workers open it (see ChunkStore.build_vector_store). IVF inverted lists are
+memory-mapped from that file, so the vectors are shared by all workers through the
+page cache. FAISS copies IndexFlat and HNSW into process memory even when mapped,
+so the exact index is stored as a single-list IVF-Flat: the same exhaustive search
+over the same vectors, but mappable. Search-time parameters (nprobe, efSearch) are
+applied after loading and can change without a rebuild.
+"""
+import logging
+import math
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq', 'ivf_sq8')
+# FAISS wants at least this many training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+# Exact search whose vectors read_index can memory-map (see above).
+EXACT_SPEC = 'IVF1,Flat'
+
+
+def factory_string(index_type: str, dim: int, n: int, nlist: Optional[int] = None, hnsw_m: int = 32,
+                   pq_m: Optional[int] = None, pq_nbits: int = 8, min_points: int = 2000) -> str:
+    """The ``faiss.index_factory`` description for ``n`` vectors of ``dim`` dimensions.
+
+    Corpora smaller than ``min_points`` (or too small to train the requested type)
+    get the exact index: it is fast at that size and needs no real training.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {index_type!r}; expected one of {INDEX_TYPES}")
+    if index_type == 'flat' or n < min_points:
+        return EXACT_SPEC
+    if index_type == 'hnsw':
+        return f'HNSW{hnsw_m}'
+
+    nlist = min(nlist or int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID)
+    if nlist < 1:
+        return EXACT_SPEC
+    if index_type == 'ivf_flat':
+        return f'IVF{nlist},Flat'
+    if index_type == 'ivf_pq':
+        pq_m = pq_m or _default_pq_m(dim)
+        if dim % pq_m == 0 and n >= MIN_POINTS_PER_CENTROID * 2 ** pq_nbits:
+            return f'IVF{nlist},PQ{pq_m}x{pq_nbits}'
+        logging.warning(f"IVF-PQ needs dim divisible by pq_m and {MIN_POINTS_PER_CENTROID * 2 ** pq_nbits} "
+                        f"training vectors (dim={dim}, pq_m={pq_m}, n={n}); using IVF-SQ8.")
+    return f'IVF{nlist},SQ8'
+
+
+def _default_pq_m(dim: int) -> int:
+    # About 16 dimensions per sub-quantizer, i.e. 96 bytes per ada-002 vector.
+    for m in range(max(1, dim // 16), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def build_index(matrix: np.ndarray, spec: str, ef_construction: int = 200, max_train_points: int = 100_000,
+                seed: int = 1234) -> faiss.Index:
+    """An index of ``spec`` (see factory_string) holding the rows of ``matrix``, trained if needed."""
+    index = faiss.index_factory(matrix.shape[1], spec)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        hnsw.efConstruction = ef_construction
+    if not index.is_trained:
+        sample = matrix
+        if len(matrix) > max_train_points:
+            rng = np.random.default_rng(seed)
+            sample = matrix[np.sort(rng.choice(len(matrix), max_train_points, replace=False))]
+        index.train(sample)
+    index.add(matrix)
+    ivf = _ivf(index)
+    if ivf is not None:
+        # reconstruct() (MMR re-scoring) needs the position -> inverted list map.
+        ivf.make_direct_map()
+    return index
+
+
+def tune(index: faiss.Index, nprobe: int = 16, ef_search: int = 128) -> faiss.Index:
+    """Apply the search-time parameters, which are not part of the persisted index."""
+    ivf = _ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+    return index
+
+
+def search_parameters(index: faiss.Index, selector: Optional[faiss.IDSelector] = None, selectivity: float = 1.0):
+    """SearchParameters restricting ``index.search`` to ``selector``, carrying the tuned nprobe/efSearch.
+
+    A parameters object overrides the index's own settings, so it has to repeat them,
+    and IVF and HNSW indexes only accept their own parameter classes. A selector that
+    admits only ``selectivity`` of the vectors leaves most probed clusters or graph
+    candidates filtered out, so the search is widened by 1 / selectivity to keep recall.
+    """
+    widen = 1.0 / max(selectivity, 1e-6)
+    ivf = _ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, math.ceil(ivf.nprobe * widen)))
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        ef_search = min(max(index.ntotal, hnsw.efSearch), math.ceil(hnsw.efSearch * widen))
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+
+def write_index(index: faiss.Index, path: str):
+    """Write ``index`` to ``path`` atomically, so concurrent readers see the old file or the new one."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
+def read_index(path: str, mmap: bool = True) -> faiss.Index:
+    """Open an index written by write_index, memory-mapping its inverted lists if ``mmap``."""
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(path, flags)
+    ivf = _ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index
+
+
+def _ivf(index: faiss.Index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def _hnsw(index: faiss.Index):
+    return getattr(faiss.downcast_index(index), 'hnsw', None)
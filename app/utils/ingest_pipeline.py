@@ -0,0 +1,215 @@
+import time
+import queue
+import random
+import logging
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from langchain.text_splitter import SpacyTextSplitter
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.document_loaders import PDFPlumberLoader
+
+from app.utils.csv_process import CSVLoader
+
+# (file_name, file_path, file_hash)
+FileTask = Tuple[str, str, str]
+# on_file_done(file_name, file_hash, documents, vectors)
+FileDone = Callable[[str, str, List[Document], List[List[float]]], None]
+
+_STOP = object()
+
+
+def parse_file(file_path: str, size: int, overlap: int) -> List[Document]:
+    """Load and split one data file. Module-level so it can run in a worker process."""
+    if file_path.endswith('.pdf'):
+        documents = PDFPlumberLoader(file_path).load()
+        docs = SpacyTextSplitter(chunk_size=size).split_documents(documents)
+    elif file_path.endswith('.csv'):
+        documents = CSVLoader(file_path).load()
+        docs = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap).split_documents(documents)
+    else:
+        return []
+
+    for doc in docs:
+        if 'page' in doc.metadata:
+            doc.metadata['page'] += 1
+    return docs
+
+
+def _timed_parse(file_path: str, size: int, overlap: int) -> Tuple[List[Document], float]:
+    start = time.perf_counter()
+    docs = parse_file(file_path, size, overlap)
+    return docs, time.perf_counter() - start
+
+
+def _mp_context():
+    # Parse workers are never forked from this process: the embed threads (or, under
+    # gunicorn's gevent worker, the hub and patched sockets) would be copied mid-flight,
+    # and a lock one of them holds (logging, the HTTP client, tokenizers) stays held in
+    # the child. forkserver forks them from a clean server process that has this module
+    # imported already; spawn under gevent and where forkserver is unavailable.
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('os'):
+            return multiprocessing.get_context("spawn")
+    except ImportError:
+        pass
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Only takes effect before the server starts, i.e. on the first ingest.
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class IngestPipeline:
+    """Staged ingestion: parse/split in a process pool, embed in batches, write per file.
+
+    Parsed chunks are cut into batches of ``embed_batch_size`` and pushed onto a bounded
+    queue, so parsing stalls instead of buffering the whole corpus when the embedding
+    API falls behind. ``embed_concurrency`` threads drain the queue, retrying failed
+    batches with exponential backoff. A file is handed to ``on_file_done`` as soon as
+    all of its batches are embedded.
+    """
+
+    def __init__(self, embeddings: Embeddings, size: int = 1200, overlap: int = 600,
+                 parse_workers: int = 4, embed_batch_size: int = 64, embed_concurrency: int = 4,
+                 queue_size: int = 8, max_retries: int = 5, backoff_base: float = 1.0):
+        self.embeddings = embeddings
+        self.size = size
+        self.overlap = overlap
+        self.parse_workers = parse_workers
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+    def _embed_with_retry(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts), attempt
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+                logging.warning(f"Embedding batch failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _parse_stage(self, files: Sequence[FileTask]):
+        """Yield (file_name, docs, seconds) as files finish parsing."""
+        if self.parse_workers <= 0 or len(files) <= 1:
+            for file_name, file_path, _ in files:
+                try:
+                    yield (file_name, *_timed_parse(file_path, self.size, self.overlap))
+                except Exception as e:
+                    logging.error(f"Error processing {file_name}: {str(e)}")
+            return
+
+        with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=_mp_context()) as pool:
+            futures = {
+                pool.submit(_timed_parse, file_path, self.size, self.overlap): file_name
+                for file_name, file_path, _ in files
+            }
+            for future in as_completed(futures):
+                file_name = futures[future]
+                try:
+                    yield (file_name, *future.result())
+                except Exception as e:
+                    logging.error(f"Error processing {file_name}: {str(e)}")
+
+    def run(self, files: Sequence[FileTask], on_file_done: FileDone) -> Dict[str, float]:
+        timings: Dict[str, float] = defaultdict(float)
+        if not files:
+            return timings
+
+        wall_start = time.perf_counter()
+        hashes = {file_name: file_hash for file_name, _, file_hash in files}
+        batches: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        lock = threading.Lock()
+        pending: Dict[str, int] = {}
+        docs_by_file: Dict[str, List[Document]] = {}
+        vectors_by_file: Dict[str, Dict[int, List[List[float]]]] = defaultdict(dict)
+        failed = set()
+
+        def finish(file_name: str):
+            docs = docs_by_file.pop(file_name)
+            parts = vectors_by_file.pop(file_name, {})
+            vectors = [vector for i in sorted(parts) for vector in parts[i]]
+            start = time.perf_counter()
+            try:
+                on_file_done(file_name, hashes[file_name], docs, vectors)
+            except Exception as e:
+                logging.error(f"Error storing {file_name}: {str(e)}")
+            timings['write'] += time.perf_counter() - start
+
+        def embed_worker():
+            while True:
+                item = batches.get()
+                if item is _STOP:
+                    return
+                file_name, batch_index, texts = item
+                start = time.perf_counter()
+                vectors, retries = None, 0
+                if file_name not in failed:
+                    try:
+                        vectors, retries = self._embed_with_retry(texts)
+                    except Exception as e:
+                        logging.error(f"Giving up embedding {file_name}: {str(e)}")
+                with lock:
+                    timings['embed'] += time.perf_counter() - start
+                    timings['embed_batches'] += 1
+                    timings['embed_retries'] += retries
+                    if vectors is None:
+                        failed.add(file_name)
+                    else:
+                        vectors_by_file[file_name][batch_index] = vectors
+                    pending[file_name] -= 1
+                    if pending[file_name] == 0:
+                        if file_name in failed:
+                            docs_by_file.pop(file_name, None)
+                            vectors_by_file.pop(file_name, None)
+                        else:
+                            finish(file_name)
+
+        workers = [threading.Thread(target=embed_worker, daemon=True) for _ in range(self.embed_concurrency)]
+        for worker in workers:
+            worker.start()
+
+        parse_start = time.perf_counter()
+        for file_name, docs, seconds in self._parse_stage(files):
+            timings['parse_cpu'] += seconds
+            timings['chunks'] += len(docs)
+            if not docs:
+                docs_by_file[file_name] = []
+                with lock:
+                    finish(file_name)
+                continue
+            texts = [doc.page_content for doc in docs]
+            batch_starts = range(0, len(texts), self.embed_batch_size)
+            with lock:
+                docs_by_file[file_name] = docs
+                pending[file_name] = len(batch_starts)
+            for batch_index, offset in enumerate(batch_starts):
+                batches.put((file_name, batch_index, texts[offset:offset + self.embed_batch_size]))
+        timings['parse_wall'] = time.perf_counter() - parse_start
+
+        for _ in workers:
+            batches.put(_STOP)
+        for worker in workers:
+            worker.join()
+
+        timings['files'] = len(files)
+        timings['failed_files'] = len(failed)
+        timings['total'] = time.perf_counter() - wall_start
+        logging.info(
+            "Ingest: {files:.0f} files, {chunks:.0f} chunks in {total:.2f}s | parse wall {parse_wall:.2f}s "
+            "(cpu {parse_cpu:.2f}s) | embed {embed:.2f}s over {embed_batches:.0f} batches, "
+            "{embed_retries:.0f} retries | write {write:.2f}s | failed {failed_files:.0f}".format_map(timings)
+        )
+        return timings
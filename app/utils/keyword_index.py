@@ -0,0 +1,171 @@
+"""BM25 keyword index over the chunk store, for hybrid retrieval.
+
+Dense retrieval over ada-002 embeddings often misses exact terms: article numbers
+(第N條), leave types, allowance names. Chunks are tokenized with jieba at ingest and
+their term frequencies stored next to the vectors (``chunk_terms`` in hr_data.db,
+written per file by ChunkStore.replace_file); each worker builds this in-memory index
+from those rows whenever it reloads its FAISS index.
+"""
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_ARTICLE = re.compile(r'第\s*([0-9０-９零〇一二兩三四五六七八九十百千]+)\s*條')
+_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '兩': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_UNITS = {'十': 10, '百': 100, '千': 1000}
+# Punctuation, whitespace and single Latin letters carry no retrieval signal. NOISE,
+# STOPWORDS and get_jieba are shared with the NLU fast path (app/utils/nlu_rules.py).
+NOISE = re.compile(r'^[\W_]+$|^[a-z]$')
+STOPWORDS = {
+    '的', '了', '是', '在', '和', '與', '及', '或', '並', '之', '其', '者', '等', '於', '為', '以', '如', '而',
+    '我', '你', '他', '我們', '請問', '請', '問', '想', '要', '會', '能', '可以', '怎麼', '如何', '什麼',
+    '哪些', '幾', '多少', '嗎', '呢', '吧', '啊', '有', '沒有', '這', '那', '個', '一下',
+}
+
+_jieba = None
+_jieba_lock = threading.Lock()
+
+
+def get_jieba():
+    # jieba loads its dictionary (~1 s) on first use; do it once per process.
+    global _jieba
+    if _jieba is None:
+        with _jieba_lock:
+            if _jieba is None:
+                import jieba
+                jieba.setLogLevel('WARNING')
+                jieba.initialize()
+                _jieba = jieba
+    return _jieba
+
+
+def _chinese_number(text: str) -> Optional[int]:
+    text = text.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
+    if text.isdigit():
+        return int(text)
+    total, digit = 0, None
+    for char in text:
+        if char in _DIGITS:
+            digit = _DIGITS[char]
+        elif char in _UNITS:
+            total += (1 if digit is None else digit) * _UNITS[char]
+            digit = None
+        else:
+            return None
+    return total + (digit or 0)
+
+
+def article_terms(text: str) -> List[str]:
+    """Article references normalized to one term each: 第十二條 / 第 12 條 -> 第12條."""
+    terms = []
+    for match in _ARTICLE.finditer(text):
+        number = _chinese_number(match.group(1))
+        if number is not None:
+            terms.append(f'第{number}條')
+    return terms
+
+
+def tokenize(text: str) -> List[str]:
+    terms = article_terms(text)
+    for word in get_jieba().lcut_for_search(text):
+        word = word.strip().lower()
+        if word and word not in STOPWORDS and not NOISE.match(word):
+            terms.append(word)
+    return terms
+
+
+def term_frequencies(text: str) -> Dict[str, int]:
+    return dict(Counter(tokenize(text)))
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunk_ids = np.zeros(0, dtype=np.int64)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._norm = np.zeros(0, dtype=np.float32)
+        self._idf: Dict[str, float] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, str, int]], k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        """Build from ``(chunk_id, term, tf)`` rows, as stored in ``chunk_terms``."""
+        index = cls(k1=k1, b=b)
+        positions: Dict[int, int] = {}
+        lengths: List[int] = []
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for chunk_id, term, tf in rows:
+            position = positions.get(chunk_id)
+            if position is None:
+                position = positions[chunk_id] = len(lengths)
+                lengths.append(0)
+            lengths[position] += tf
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = ([], [])
+            entry[0].append(position)
+            entry[1].append(tf)
+
+        count = len(lengths)
+        index.chunk_ids = np.fromiter(positions.keys(), dtype=np.int64, count=count)
+        length_array = np.asarray(lengths, dtype=np.float32)
+        average = float(length_array.mean()) if count else 0.0
+        # Per-chunk part of the BM25 denominator, precomputed once.
+        index._norm = k1 * (1 - b + b * length_array / average) if count else length_array
+        for term, (term_positions, tfs) in postings.items():
+            index._postings[term] = (np.asarray(term_positions, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            df = len(term_positions)
+            index._idf[term] = float(np.log(1 + (count - df + 0.5) / (df + 0.5)))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._postings
+
+    def covers(self, terms: Sequence[str]) -> bool:
+        """True if some chunk contains every one of ``terms``."""
+        if not terms:
+            return False
+        common = None
+        for term in set(terms):
+            posting = self._postings.get(term)
+            if posting is None:
+                return False
+            common = posting[0] if common is None else np.intersect1d(common, posting[0], assume_unique=True)
+            if not len(common):
+                return False
+        return True
+
+    def search(self, terms: Sequence[str], k: int = 20,
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top ``k`` ``(chunk_id, score)`` pairs for the query ``terms``, among ``allowed`` IDs if given."""
+        if not len(self.chunk_ids):
+            return []
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        for term, query_tf in Counter(terms).items():
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            positions, tfs = posting
+            scores[positions] += query_tf * self._idf[term] * tfs * (self.k1 + 1) / (tfs + self._norm[positions])
+        if allowed is not None:
+            scores[~np.isin(self.chunk_ids, allowed)] = 0
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return [(int(self.chunk_ids[position]), float(scores[position])) for position in hits]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Merge ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
@@ -1,29 +1,61 @@
 import os
 import sys
-import pickle
+import time
 import logging
+import threading
 from datetime import datetime
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, Sequence
 
 import hashlib
 import sqlite3
 
+import faiss
+import numpy as np
+
 from langchain.text_splitter import SpacyTextSplitter
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-from langchain_openai.embeddings.azure import AzureOpenAIEmbeddings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain_community.document_loaders import PDFPlumberLoader
 
 # sys.path.append(r'/app')
-from config import OpenaiConfig
+from config import VectorStoreConfig, IngestConfig, RetrievalConfig, RerankConfig
 from app.utils.csv_process import CSVLoader
+from app.utils.chunk_store import ChunkStore
+from app.utils.faiss_index import search_parameters
+from app.utils.chunk_tags import TagIndex
+from app.utils.disk_docstore import PositionIds
+from app.utils.keyword_index import BM25Index, reciprocal_rank_fusion, tokenize
+from app.utils.ingest_pipeline import IngestPipeline
 from app.utils.utils import measure_time
+from app.services import clients
 
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
+
+class ResidentIndex(NamedTuple):
+    """One loaded version of the index: the FAISS store and the side indexes built with it.
+
+    Replaced as a whole on reload, so a query that takes it once never pairs the FAISS
+    positions of one version with the chunk IDs or BM25 postings of another.
+    """
+    vector_store: Optional[FAISS]
+    keyword_index: Optional[BM25Index]
+    tag_index: Optional[TagIndex]
+    # Chunk ID at each FAISS position, for turning tag filters into an IDSelector.
+    position_chunk_ids: np.ndarray
+    version: Optional[int]
+
+
+_NO_INDEX = ResidentIndex(None, None, None, np.zeros(0, dtype=np.int64), None)
+
+
 class LoadHRdata:
-    def __init__(self, size: int = 1200, overlap: int = 600, data_dir: str = 'data_files', db_path: str = 'hr_data.db'):
+    def __init__(self, size: int = 1200, overlap: int = 600, data_dir: str = 'data_files', db_path: str = 'hr_data.db',
+                 embeddings: Optional[Embeddings] = None):
         
         base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         
@@ -32,7 +64,15 @@ class LoadHRdata:
         
         self.size = size
         self.overlap = overlap
-        self.embeddings = self.initial_openaiembed()
+        self.embeddings = embeddings or self.initial_openaiembed(self.db_path)
+
+        # Process-resident index, reloaded only when the version stamp in the DB moves.
+        self._resident = _NO_INDEX
+        self.version_check_interval = VectorStoreConfig.version_check_interval
+        self._last_version_check = 0.0
+        self._reload_lock = threading.Lock()
+
+        self.chunk_store = ChunkStore(self.db_path)
         self.init_db()
         logging.basicConfig(level=logging.INFO)
     
@@ -46,23 +86,20 @@ class LoadHRdata:
                     last_processed TIMESTAMP
                 )
             ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS vector_store (
-                    id TEXT PRIMARY KEY,
-                    data BLOB
-                )
-            ''')
             conn.commit()
+        self.chunk_store.init_db()
+        self.chunk_store.bind_embedding_model(self.embedding_model)
+
+    @property
+    def embedding_model(self) -> str:
+        # The same name CachedEmbeddings keys its cache by.
+        return getattr(self.embeddings, 'model', None) or type(self.embeddings).__name__
 
     @staticmethod
-    def initial_openaiembed():
-        return AzureOpenAIEmbeddings(
-            deployment="embeddings",
-            model="text-embedding-ada-002",
-            azure_endpoint=OpenaiConfig.endpoint,
-            openai_api_type="azure",
-            openai_api_key=OpenaiConfig.token
-        )
+    def initial_openaiembed(db_path: str):
+        # Azure or local per EmbeddingConfig.provider; shared per process and cached by
+        # (model, sha256(text)) in hr_data.db, see app/utils/embedding_cache.py
+        return clients.get_embeddings(db_path)
     
     def load_pdf(self, file_path):
         try:
@@ -121,32 +158,68 @@ class LoadHRdata:
             conn.commit()
             
     def get_vector_store(self) -> Optional[FAISS]:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT data FROM vector_store WHERE id = 'main'")
-            result = cursor.fetchone()
-            if result:
-                return FAISS.deserialize_from_bytes(
-                # return FAISS.from_documents(
-                    pickle.loads(result[0]), 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True  # Add this parameter
-                )
-        return None
-    
-    def update_vector_store(self, vector_store: FAISS):
-        try:
-            serialized_data = pickle.dumps(vector_store.serialize_to_bytes())
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO vector_store (id, data)
-                    VALUES (?, ?)
-                ''', ('main', serialized_data))
-                conn.commit()
-        except Exception as e:
-            print(f"Exception : {e}")
-            raise
+        return self.chunk_store.build_vector_store(self.embeddings, **VectorStoreConfig.index_options())
+
+    def get_index_version(self) -> int:
+        return self.chunk_store.get_version()
+
+    def get_keyword_index(self) -> BM25Index:
+        return self.chunk_store.build_keyword_index(k1=RetrievalConfig.bm25_k1, b=RetrievalConfig.bm25_b)
+
+    def _load_resident(self, vector_store: Optional[FAISS], version: int) -> ResidentIndex:
+        # The keyword and tag indexes always follow the FAISS index they sit next to.
+        mapping = vector_store.index_to_docstore_id if vector_store is not None else {}
+        if isinstance(mapping, PositionIds):
+            # The memory-mapped ids of the on-disk docstore, no per-worker copy.
+            position_chunk_ids = mapping.ids
+        else:
+            position_chunk_ids = np.fromiter((int(mapping[i]) for i in range(len(mapping))),
+                                             dtype=np.int64, count=len(mapping))
+        return ResidentIndex(vector_store, self.get_keyword_index(), self.chunk_store.build_tag_index(),
+                             position_chunk_ids, version)
+
+    @property
+    def vector_store(self) -> Optional[FAISS]:
+        return self._resident.vector_store
+
+    @property
+    def keyword_index(self) -> Optional[BM25Index]:
+        return self._resident.keyword_index
+
+    @property
+    def tag_index(self) -> Optional[TagIndex]:
+        return self._resident.tag_index
+
+    @property
+    def index_version(self) -> Optional[int]:
+        return self._resident.version
+
+    def set_resident_vector_store(self, vector_store: Optional[FAISS], version: Optional[int] = None):
+        resident = self._load_resident(vector_store, self.get_index_version() if version is None else version)
+        # One assignment publishes the store and its side indexes together.
+        self._resident = resident
+        self._last_version_check = time.monotonic()
+
+    def get_resident_index(self) -> ResidentIndex:
+        """Return the in-process index, reloading it only if another process wrote a newer version.
+
+        Take it once per query and read every part from that snapshot.
+        """
+        now = time.monotonic()
+        resident = self._resident
+        if resident.vector_store is not None and now - self._last_version_check < self.version_check_interval:
+            return resident
+
+        with self._reload_lock:
+            self._last_version_check = now
+            version = self.get_index_version()
+            if version != self._resident.version:
+                logging.info(f"Loading vector store version {version} (resident: {self._resident.version})")
+                self._resident = self._load_resident(self.get_vector_store(), version)
+            return self._resident
+
+    def get_resident_vector_store(self) -> Optional[FAISS]:
+        return self.get_resident_index().vector_store
 
     def get_last_update(self) -> Optional[datetime]:
         with sqlite3.connect(self.db_path) as conn:
@@ -155,57 +228,58 @@ class LoadHRdata:
             result = cursor.fetchone()
             return datetime.fromisoformat(result[0]) if result[0] else None
         
+    def build_ingest_pipeline(self) -> IngestPipeline:
+        return IngestPipeline(
+            self.embeddings,
+            size=self.size,
+            overlap=self.overlap,
+            parse_workers=IngestConfig.parse_workers,
+            embed_batch_size=IngestConfig.embed_batch_size,
+            embed_concurrency=IngestConfig.embed_concurrency,
+            queue_size=IngestConfig.queue_size,
+            max_retries=IngestConfig.max_retries,
+            backoff_base=IngestConfig.backoff_base,
+        )
+
     @measure_time
-    def pdf_loader(self) -> FAISS:
-        all_docs = []
+    def pdf_loader(self) -> Optional[FAISS]:
         updated = False
+        current_files = set(os.listdir(self.hr_rawdata_path))
 
-        for file_name in os.listdir(self.hr_rawdata_path):
+        changed_files = []
+        for file_name in sorted(current_files):
             
             file_path = os.path.join(self.hr_rawdata_path, file_name)
             file_hash = self.calculate_file_hash(file_path)
             file_meta = self.get_file_metadata(file_name)
             if not file_meta or file_meta[1] != file_hash:
                 logging.info(f"Processing {file_name}")
-                try:
-                    if file_name.endswith('.pdf'):
-                        doc = self.load_pdf(file_path)
-                        new_doc = self.split_documents_semantic(doc)
-                    elif file_name.endswith('.csv'):
-                        doc = self.load_csv(file_path)
-                        new_doc = self.split_documents_recursive(doc)
-
-                    
-                    all_docs.extend(new_doc)
-                    self.update_file_metadata(file_name, file_hash)
-                    updated = True
-                except Exception as e:
-                    logging.error(f"Error processing {file_name}: {str(e)}")
+                changed_files.append((file_name, file_path, file_hash))
             else:
                 continue
                     # logging.info(f"Skipping {file_name} (unchanged)")
 
-        vector_store = self.get_vector_store()
-        
-        if updated:
-            for doc in all_docs:
-                if 'page' in doc.metadata:
-                    doc.metadata['page'] += 1
+        if changed_files:
+            # Each file replaces only its own chunks, so re-ingesting a changed file leaves no stale duplicates.
+            self.build_ingest_pipeline().run(changed_files, on_file_done=self.chunk_store.replace_file)
+            updated = True
 
-            if vector_store:
-                vector_store.add_documents(all_docs)
-            else:
-                vector_store = FAISS.from_documents(all_docs, self.embeddings)
-
-            self.update_vector_store(vector_store)
-            logging.info("Vector store updated and saved to database.")
-        elif vector_store is None:
-            vector_store = FAISS.from_documents([], self.embeddings)
-            self.update_vector_store(vector_store)
-            logging.info("Created an empty vector store.")
+        for file_name in set(self.chunk_store.get_indexed_files()) - current_files:
+            logging.info(f"Purging chunks of deleted file {file_name}")
+            self.chunk_store.delete_file(file_name)
+            updated = True
+
+        if updated:
+            logging.info("Vector store updated in database.")
+            if hasattr(self.embeddings, 'stats'):
+                logging.info(f"Embedding cache: {self.embeddings.stats()}")
         else:
             logging.info("Using existing vector store from database.")
 
+        version = self.get_index_version()
+        # Trains an approximate index (VectorStoreConfig.index_type) and stores it for the other workers.
+        vector_store = self.get_vector_store()
+        self.set_resident_vector_store(vector_store, version)
         return vector_store
     
     def get_data_path(self) -> str:
@@ -219,7 +293,7 @@ class LoadHRdata:
 
     def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5):
         
-        vector_store = self.get_vector_store()
+        vector_store = self.get_resident_vector_store()
         if vector_store is None:
             logging.error("Vector store is not initialized.")
             return []
@@ -233,39 +307,136 @@ class LoadHRdata:
             # Fallback to regular similarity search if MMR fails
             return vector_store.similarity_search(query, k=k)
 
+    def embed_query(self, query: str) -> List[float]:
+        return self.embeddings.embed_query(query)
 
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self.embeddings.aembed_query(query)
 
-if __name__ == '__main__':
-    load_data = LoadHRdata(data_dir='data_files', db_path='hr_data.db')
-    print(load_data)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def current_index_version(self) -> Optional[int]:
+        return self.get_resident_index().version
 
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5):
+        
+        vector_store = self.get_resident_vector_store()
+        if vector_store is None:
+            logging.error("Vector store is not initialized.")
+            return []
+        
+        try:
+            return vector_store.max_marginal_relevance_search_by_vector(
+                embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult
+            )
+        except TypeError as e:
+            logging.error(f"Error in max_marginal_relevance_search_by_vector: {e}")
+            return vector_store.similarity_search_by_vector(embedding, k=k)
+
+
+    def is_keyword_query(self, query: str) -> bool:
+        """Short queries whose terms all occur together in some chunk need no embedding."""
+        if not RetrievalConfig.hybrid or len(query.strip()) > RetrievalConfig.keyword_query_max_chars:
+            return False
+        keyword_index = self.get_resident_index().keyword_index
+        return keyword_index is not None and keyword_index.covers(tokenize(query))
+
+    def filter_candidates(self, tag_groups: Sequence[Sequence[str]],
+                          resident: Optional[ResidentIndex] = None) -> Optional[np.ndarray]:
+        """Chunk IDs allowed by ``tag_groups`` (see chunk_tags.query_tag_groups), or None for all."""
+        tag_index = (resident or self.get_resident_index()).tag_index
+        if not tag_groups or tag_index is None:
+            return None
+        return tag_index.candidates(tag_groups, min_size=RetrievalConfig.filter_min_candidates)
+
+    def retrieve(self, query: str, embedding: Optional[List[float]], k: int = 8,
+                 tag_groups: Sequence[Sequence[str]] = ()) -> List[Document]:
+        # Filters, dense and keyword search all read the same loaded version.
+        resident = self.get_resident_index()
+        allowed = self.filter_candidates(tag_groups, resident)
+        if allowed is not None:
+            # A filtered candidate set is on topic already; fewer chunks go to the model.
+            k = min(k, RetrievalConfig.filtered_k)
+        if RerankConfig.enabled:
+            documents = self._first_stage(resident, query, embedding, max(k, RerankConfig.candidates), allowed)
+            return clients.get_reranker().rerank(query, documents, top_k=min(k, RerankConfig.top_k))
+        return self._first_stage(resident, query, embedding, k, allowed)
+
+    def _first_stage(self, resident: ResidentIndex, query: str, embedding: Optional[List[float]], k: int,
+                     allowed: Optional[np.ndarray]) -> List[Document]:
+        if RetrievalConfig.hybrid:
+            return self.hybrid_search(query, embedding, k=k, allowed=allowed, resident=resident)
+        if allowed is None:
+            return self.max_marginal_relevance_search_by_vector(embedding, k=k, fetch_k=max(20, 2 * k))
+        return self._filtered_mmr_search(resident, embedding, allowed, k=k, fetch_k=max(20, 2 * k))
 
+    @staticmethod
+    def _dense_search(resident: ResidentIndex, embedding: List[float], n: int,
+                      allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """FAISS positions of the ``n`` nearest chunks, restricted to ``allowed`` chunk IDs if given."""
+        vector_store = resident.vector_store
+        params = None
+        if allowed is not None:
+            positions = np.flatnonzero(np.isin(resident.position_chunk_ids, allowed)).astype(np.int64)
+            params = search_parameters(vector_store.index, faiss.IDSelectorBatch(positions),
+                                       selectivity=len(positions) / max(1, vector_store.index.ntotal))
+            n = min(n, len(positions))
+        n = min(n, vector_store.index.ntotal)
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64)
+        query_vector = np.asarray([embedding], dtype=np.float32)
+        _, found = vector_store.index.search(query_vector, n, params=params)
+        return found[0][found[0] >= 0]
+
+    def _filtered_mmr_search(self, resident: ResidentIndex, embedding: List[float], allowed: np.ndarray,
+                             k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Document]:
+        vector_store = resident.vector_store
+        if vector_store is None:
+            logging.error("Vector store is not initialized.")
+            return []
+        positions = self._dense_search(resident, embedding, fetch_k, allowed)
+        if not len(positions):
+            return []
+        vectors = np.vstack([vector_store.index.reconstruct(int(p)) for p in positions])
+        selected = maximal_marginal_relevance(np.asarray(embedding, dtype=np.float32), vectors,
+                                              k=k, lambda_mult=lambda_mult)
+        return [vector_store.docstore.search(vector_store.index_to_docstore_id[int(positions[i])]) for i in selected]
+
+    def hybrid_search(self, query: str, embedding: Optional[List[float]] = None, k: int = 8,
+                      candidates: Optional[int] = None, allowed: Optional[np.ndarray] = None,
+                      resident: Optional[ResidentIndex] = None) -> List[Document]:
+        """BM25 and FAISS rankings fused by reciprocal rank; BM25 alone when ``embedding`` is None.
+
+        ``allowed`` restricts both rankings to those chunk IDs (see filter_candidates) and
+        must come from the same ``resident`` index.
+        """
+        resident = resident or self.get_resident_index()
+        vector_store = resident.vector_store
+        if vector_store is None:
+            logging.error("Vector store is not initialized.")
+            return []
+        candidates = candidates or max(k, RetrievalConfig.candidates)
+
+        rankings = []
+        if embedding is not None:
+            positions = self._dense_search(resident, embedding, candidates, allowed)
+            rankings.append([vector_store.index_to_docstore_id[int(p)] for p in positions])
+        if resident.keyword_index is not None:
+            hits = resident.keyword_index.search(tokenize(query), candidates, allowed=allowed)
+            rankings.append([str(chunk_id) for chunk_id, _ in hits])
+
+        # The BM25 and tag indexes are read from the DB just after the FAISS export is opened;
+        # if another worker ingested in between, they can name chunks this docstore does not
+        # hold. Skip those.
+        documents = []
+        for docstore_id in reciprocal_rank_fusion(rankings, k=RetrievalConfig.rrf_k):
+            document = vector_store.docstore.search(docstore_id)
+            if isinstance(document, Document):
+                documents.append(document)
+                if len(documents) == k:
+                    break
+        return documents
 
 
+if __name__ == '__main__':
+    load_data = LoadHRdata(data_dir='data_files', db_path='hr_data.db')
+    print(load_data)
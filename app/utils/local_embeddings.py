@@ -0,0 +1,94 @@
+"""sentence-transformers embeddings on CPU, a drop-in for AzureOpenAIEmbeddings.
+
+Selected with EmbeddingConfig.provider = 'local'. Queries skip the network round
+trip and ingest is bounded by local CPU rather than the API rate limit. Documents are
+encoded in batches spread over a small thread pool (torch releases the GIL inside
+its kernels), with torch's own threads capped so the pool does not oversubscribe
+the cores. ``backend='onnx'`` runs the model on onnxruntime instead of torch
+(sentence-transformers >= 3.2); ``quantize='int8'`` uses the model's int8 ONNX
+export, or dynamic int8 quantization of the Linear layers on the torch backend.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+
+# Int8 export shipped in the ``onnx/`` folder of sentence-transformers models on the Hub.
+ONNX_INT8_FILE = 'onnx/model_qint8_avx512_vnni.onnx'
+
+
+class LocalEmbeddings(Embeddings):
+    def __init__(self, model_name: str, backend: str = 'torch', quantize: Optional[str] = None,
+                 batch_size: int = 32, workers: int = 2, max_threads: int = 4, normalize: bool = True):
+        if backend not in ('torch', 'onnx'):
+            raise ValueError(f"Unknown local embedding backend {backend!r}")
+        if quantize not in (None, 'int8'):
+            raise ValueError(f"Unknown quantization {quantize!r}")
+        self.model_name = model_name
+        self.backend = backend
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_threads = max_threads
+        self.normalize = normalize
+        # Tags the index and the embedding cache, so vectors of different backends never mix.
+        tag = ['local', model_name]
+        if backend == 'onnx':
+            tag.append('onnx')
+        if quantize:
+            tag.append(quantize)
+        self.model = ':'.join(tag)
+        self._model = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        start = time.perf_counter()
+        if self.backend == 'onnx':
+            model_kwargs = {'file_name': ONNX_INT8_FILE} if self.quantize == 'int8' else None
+            model = SentenceTransformer(self.model_name, device='cpu', backend='onnx', model_kwargs=model_kwargs)
+        else:
+            import torch
+            torch.set_num_threads(self.max_threads)
+            model = SentenceTransformer(self.model_name, device='cpu')
+            if self.quantize == 'int8':
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logging.info(f"Loaded embedding model {self.model} in {time.perf_counter() - start:.1f}s")
+        return model
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="local-embed")
+        return self._model
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self._get_model().encode(texts, batch_size=self.batch_size, normalize_embeddings=self.normalize,
+                                           convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        self._get_model()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._encode(texts) if texts else []
+        return [vector for batch in self._executor.map(self._encode, batches) for vector in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
@@ -0,0 +1,217 @@
+"""Local NLU fast path in front of the GPT-4o classifier (NLU.NLU_classification).
+
+Short keyword questions ("特休", "加班費", "生小孩") make up much of the traffic and
+are classified the same way every time. FastNLU tokenizes the input with jieba,
+with every alias of ENTITY_ALIASES added to its dictionary, and maps the aliases
+it finds to entity types. The intent comes from a TF-IDF + logistic regression
+model trained on logged LLM classifications (train_intent_model; needs
+scikit-learn) when one is loaded, and from INTENT_CUES otherwise. A result is
+returned only when every content word of the input is accounted for and the
+intent confidence reaches the threshold; anything else goes to the LLM.
+
+When NLUFastPathConfig.log_path is set (opt-in; the log holds raw employee input),
+the LLM path appends its classifications there, size-bounded. That is the training
+data: ``python -m app.utils.nlu_rules <log.jsonl> <model.pkl>``.
+"""
+import json
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.utils.keyword_index import NOISE, STOPWORDS, get_jieba
+from app.utils.utils import EntityType, HRIntentCategory
+
+# Words and phrasings employees use for each entity type. An alias may carry several types.
+ENTITY_ALIASES: Dict[EntityType, Tuple[str, ...]] = {
+    EntityType.COMPENSATION_SALARY: ('薪資', '薪水', '工資', '月薪', '底薪', '調薪', '加薪', '薪資單'),
+    EntityType.COMPENSATION_ALLOWANCE: ('津貼', '補助', '加給', '交通費', '出差費', '差旅費', '伙食費', '報支', '出差'),
+    EntityType.COMPENSATION_BONUS: ('獎金', '年終', '年終獎金', '績效獎金', '三節獎金', '分紅'),
+    EntityType.COMPENSATION_BENEFITS: ('福利', '員工福利', '團保', '勞保', '健保', '勞健保', '勞退', '退休金',
+                                       '員工旅遊', '育嬰假', '產假'),
+    EntityType.PERFORMANCE_REVIEW: ('考績', '考核', '績效', '績效考核', '績效評估', '打考績'),
+    EntityType.PERFORMANCE_GOAL: ('目標設定', 'okr'),
+    EntityType.PERFORMANCE_KPI: ('kpi', '績效指標'),
+    EntityType.TIME_ATTENDANCE: ('出勤', '打卡', '遲到', '早退', '曠職', '忘記打卡', '上班時間', '工時', '彈性上班'),
+    EntityType.TIME_LEAVE: ('請假', '假別', '特休', '特別休假', '年假', '病假', '事假', '婚假', '喪假', '產假', '陪產假',
+                            '產檢假', '育嬰假', '育嬰留停', '育嬰留職停薪', '生理假', '家庭照顧假', '公假', '補休',
+                            '生小孩', '懷孕', '休假', '留職停薪'),
+    EntityType.TIME_OVERTIME: ('加班', '加班費', '延長工時', '假日加班'),
+    EntityType.CAREER_PROMOTION: ('升遷', '晉升', '升職'),
+    EntityType.CAREER_TRAINING: ('培訓', '訓練', '教育訓練', '進修', '課程'),
+    EntityType.RECRUITMENT_JOB_POSTING: ('職缺', '內部轉調', '招募', '內推'),
+    EntityType.RECRUITMENT_INTERVIEW: ('面試',),
+    EntityType.RECRUITMENT_ONBOARDING: ('報到', '到職', '新人', '試用期', '入職'),
+    EntityType.EMPLOYEE_RELATIONS_CONFLICT: ('申訴', '性騷擾', '霸凌', '職場霸凌', '糾紛'),
+    EntityType.ORGANIZATION_DEPARTMENT: ('部門', '人資', '人資部'),
+    EntityType.ORGANIZATION_POSITION_LEVEL: ('職等', '職級'),
+    EntityType.COMPLIANCE_REGULATION: ('勞基法', '勞動基準法', '性平法', '性別平等工作法', '法規'),
+    EntityType.COMPLIANCE_POLICY: ('公司規定', '規章', '辦法'),
+    EntityType.COMPLIANCE_ETHICS: ('保密', '利益衝突', '兼職'),
+    EntityType.HEALTH_SAFETY_WORKPLACE: ('職災', '職業災害', '工傷'),
+    EntityType.HEALTH_SAFETY_WELLNESS: ('健康檢查', '健檢'),
+    EntityType.OFFBOARDING_RESIGNATION: ('離職', '辭職', '提離職', '預告期'),
+    EntityType.OFFBOARDING_TERMINATION: ('資遣', '解僱', '資遣費', '裁員'),
+    EntityType.OFFBOARDING_EXIT_INTERVIEW: ('離職面談',),
+}
+
+# Words that decide the intent when no model is loaded; a query of entity words alone
+# asks what the rule is (QUERY_POLICY).
+INTENT_CUES: Dict[HRIntentCategory, Tuple[str, ...]] = {
+    HRIntentCategory.PROCESS: ('申請', '流程', '手續', '辦理', '步驟', '怎麼請', '如何請'),
+    HRIntentCategory.REQUEST_DOCUMENT: ('證明', '表單', '申請書', '下載', '範本'),
+    HRIntentCategory.SYSTEM_ACCESS: ('系統', '登入', '密碼', '帳號'),
+    HRIntentCategory.QUERY_POLICY: ('規定', '幾天', '怎麼算', '計算', '資格', '條件', '上限', '天數', '多久',
+                                    '什麼時候', '發放', '發', '請什麼假'),
+}
+RULE_CONFIDENCE = 0.9
+# Question particles and fillers that carry no meaning for the classification.
+_FILLERS = STOPWORDS | {'?', '？', '嗎', '呢', '怎樣', '哪裡', '有沒有', '可不可以', '能不能', '是否', '公司', '我剛', '剛'}
+
+
+def train_intent_model(records: Iterable[dict]):
+    """TF-IDF over character n-grams + logistic regression, fit on ``{"input", "intent"}`` records."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    texts, intents = [], []
+    for record in records:
+        if record.get('input') and record.get('intent'):
+            texts.append(record['input'])
+            intents.append(record['intent'])
+    model = make_pipeline(TfidfVectorizer(analyzer='char_wb', ngram_range=(1, 3), sublinear_tf=True),
+                          LogisticRegression(max_iter=1000, C=4.0))
+    model.fit(texts, intents)
+    return model
+
+
+class FastNLU:
+    def __init__(self, threshold: float = 0.8, max_chars: int = 16, model=None,
+                 aliases: Dict[EntityType, Sequence[str]] = ENTITY_ALIASES):
+        self.threshold = threshold
+        self.max_chars = max_chars
+        # Anything with predict_proba(texts) and classes_, e.g. the pipeline of train_intent_model.
+        self.model = model
+        self.alias_types: Dict[str, List[EntityType]] = {}
+        for entity_type, words in aliases.items():
+            for word in words:
+                self.alias_types.setdefault(word.lower(), []).append(entity_type)
+        self.cues = {cue: intent for intent, cues in INTENT_CUES.items() for cue in cues}
+        self._tokenizer = None
+        self._tokenizer_lock = threading.Lock()
+        self.counters: Dict[str, float] = {'hits': 0, 'misses': 0, 'seconds': 0.0}
+
+    @classmethod
+    def from_path(cls, model_path: Optional[str], **kwargs) -> 'FastNLU':
+        model = None
+        if model_path:
+            try:
+                with open(model_path, 'rb') as f:
+                    model = pickle.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning(f"Could not load NLU intent model {model_path}: {e}; using intent rules.")
+        return cls(model=model, **kwargs)
+
+    def _get_tokenizer(self):
+        if self._tokenizer is None:
+            with self._tokenizer_lock:
+                if self._tokenizer is None:
+                    # A private jieba Tokenizer, so the aliases do not change how chunks are tokenized.
+                    jieba = get_jieba()
+                    tokenizer = jieba.Tokenizer()
+                    tokenizer.initialize()
+                    for word in list(self.alias_types) + list(self.cues):
+                        tokenizer.add_word(word, freq=200000)
+                    self._tokenizer = tokenizer
+        return self._tokenizer
+
+    def _intent(self, text: str, words: List[str]) -> Tuple[HRIntentCategory, float]:
+        if self.model is not None:
+            probabilities = self.model.predict_proba([text])[0]
+            best = int(probabilities.argmax())
+            try:
+                return HRIntentCategory(self.model.classes_[best]), float(probabilities[best])
+            except ValueError:
+                return HRIntentCategory.OTHER, 0.0
+        intents = {self.cues[word] for word in words if word in self.cues}
+        if len(intents) > 1:
+            return HRIntentCategory.OTHER, 0.0
+        return (intents.pop() if intents else HRIntentCategory.QUERY_POLICY), RULE_CONFIDENCE
+
+    def classify(self, text: str) -> Optional[dict]:
+        """The classification of ``text`` in the LLM's JSON shape, or None to ask the LLM."""
+        start = time.perf_counter()
+        result = self._classify(text.strip())
+        self.counters['seconds'] += time.perf_counter() - start
+        self.counters['hits' if result is not None else 'misses'] += 1
+        return result
+
+    def _classify(self, text: str) -> Optional[dict]:
+        if not text or len(text) > self.max_chars:
+            return None
+        words = [word.lower() for word in self._get_tokenizer().lcut(text)]
+        words = [word for word in words if word.strip() and not NOISE.match(word) and word not in _FILLERS]
+        entities = [word for word in dict.fromkeys(words) if word in self.alias_types]
+        # Every content word must be an entity alias or an intent cue; anything else may
+        # change the meaning in ways only the LLM can tell.
+        if not entities or any(word not in self.alias_types and word not in self.cues for word in words):
+            return None
+        intent, confidence = self._intent(text, words)
+        if confidence < self.threshold:
+            return None
+        return {
+            'intent': intent.name,
+            'entities': [{'value': word, 'types': [t.name for t in self.alias_types[word]]} for word in entities],
+            'keywords': entities,
+        }
+
+    def stats(self) -> Dict[str, float]:
+        total = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters, hit_rate=self.counters['hits'] / total if total else 0.0)
+
+
+def log_classification(log_path: str, input_text: str, output, max_bytes: Optional[int] = None) -> None:
+    """Append an LLM classification (an NLUOutput) to the training log.
+
+    Once the log reaches ``max_bytes`` it is moved to ``<log_path>.1``, replacing the
+    previous one, so at most about twice ``max_bytes`` is kept.
+    """
+    record = {
+        'input': input_text,
+        'intent': output.intent.value,
+        'entities': [{'value': entity.value, 'types': [t.value for t in entity.types]} for entity in output.entities],
+        'keywords': output.keywords,
+    }
+    try:
+        if max_bytes and os.path.getsize(log_path) >= max_bytes:
+            # Workers racing here at worst rotate twice; lines are never split.
+            os.replace(log_path, log_path + '.1')
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Could not rotate NLU log {log_path}: {e}")
+    try:
+        # One short line per write; O_APPEND keeps lines from concurrent workers whole.
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    except OSError as e:
+        logging.warning(f"Could not log NLU output to {log_path}: {e}")
+
+
+def train_from_log(log_path: str, model_path: str):
+    with open(log_path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    model = train_intent_model(records)
+    with open(model_path, 'wb') as f:
+        pickle.dump(model, f)
+    print(f"Trained intent model on {len(records)} logged classifications -> {model_path}")
+
+
+if __name__ == '__main__':
+    train_from_log(*sys.argv[1:3])
@@ -0,0 +1,75 @@
+"""Prompt layout for the provider's prompt-prefix cache, and cached-token accounting.
+
+Azure OpenAI reuses the computation for the longest prompt prefix it has seen
+recently (from 1024 tokens, in steps of 128) and bills those tokens as cached. A
+prefix only matches if it is byte-identical, so every chain here puts its static
+instructions first, in a system message rendered once per process, and the
+per-request content (history, retrieved context, the user input) last, in the
+human message. Turns of one session then also share the history that came before.
+
+get_usage_callback works like langchain's get_openai_callback and additionally sums
+the cached prompt tokens the API reports (usage.prompt_tokens_details.cached_tokens).
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+from langchain_core.messages import SystemMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tracers.context import register_configure_hook
+
+
+def static_first_prompt(instructions: str, variable_template: str, **static_values: Any) -> ChatPromptTemplate:
+    """A system message of ``instructions`` with ``static_values`` filled in now, then
+    ``variable_template`` as the human message filled in per request."""
+    # A literal SystemMessage is passed through as is by format_messages.
+    return ChatPromptTemplate.from_messages([
+        SystemMessage(content=instructions.format(**static_values)),
+        ("human", variable_template),
+    ])
+
+
+def _cached_tokens(response: LLMResult) -> int:
+    token_usage = (response.llm_output or {}).get('token_usage') or {}
+    cached = (token_usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+    if cached is None:
+        # Newer langchain-openai versions report it on the message instead.
+        try:
+            generation = response.generations[0][0]
+        except IndexError:
+            return 0
+        if isinstance(generation, ChatGeneration):
+            usage_metadata = getattr(generation.message, 'usage_metadata', None) or {}
+            cached = (usage_metadata.get('input_token_details') or {}).get('cache_read')
+    return cached or 0
+
+
+class UsageCallbackHandler(OpenAICallbackHandler):
+    """OpenAICallbackHandler that also counts cached prompt tokens."""
+
+    prompt_tokens_cached: int = 0
+
+    def __init__(self):
+        super().__init__()
+        self._cached_lock = threading.Lock()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        cached = _cached_tokens(response)
+        with self._cached_lock:
+            self.prompt_tokens_cached += cached
+        super().on_llm_end(response, **kwargs)
+
+
+_usage_callback_var: ContextVar[Optional[UsageCallbackHandler]] = ContextVar('usage_callback', default=None)
+register_configure_hook(_usage_callback_var, True)
+
+
+@contextmanager
+def get_usage_callback() -> Iterator[UsageCallbackHandler]:
+    cb = UsageCallbackHandler()
+    _usage_callback_var.set(cb)
+    yield cb
+    _usage_callback_var.set(None)
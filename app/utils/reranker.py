@@ -0,0 +1,93 @@
+"""Local cross-encoder reranking of retrieved chunks on CPU.
+
+Retrieval fetches a wide candidate set (RerankConfig.candidates) and a small
+sentence-transformers CrossEncoder scores each (query, chunk) pair, so only the top
+few chunks go to GPT-4o. The model loads on first use; pairs are scored in batches
+with torch capped at RerankConfig.max_threads and at most max_concurrent batches
+running per process, so reranking cannot starve the other requests of a worker.
+Scores are cached per (query, chunk) in an in-memory LRU.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from app.utils.embedding_cache import text_hash
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str, max_length: int = 256, batch_size: int = 16, max_threads: int = 2,
+                 max_concurrent: int = 1, cache_size: int = 8192, model=None):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.max_threads = max_threads
+        self.cache_size = cache_size
+        # Anything with CrossEncoder.predict(pairs, batch_size=...) can be passed in, e.g. the benchmarks' FakeCrossEncoder.
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._inference = threading.BoundedSemaphore(max_concurrent)
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.counters: Dict[str, float] = {'pairs_scored': 0, 'cache_hits': 0, 'batches': 0, 'seconds': 0.0}
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    import torch
+                    from sentence_transformers import CrossEncoder
+                    torch.set_num_threads(self.max_threads)
+                    start = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device='cpu')
+                    logging.info(f"Loaded reranker {self.model_name} in {time.perf_counter() - start:.1f}s")
+        return self._model
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _remember(self, scores: Dict[Tuple[str, str], float]):
+        with self._cache_lock:
+            self._cache.update(scores)
+            for key in scores:
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        keys = [(query, text_hash(text)) for text in texts]
+        scores = [self._cached(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        self.counters['cache_hits'] += len(texts) - len(missing)
+        if missing:
+            model = self._get_model()
+            pairs = [(query, texts[i]) for i in missing]
+            start = time.perf_counter()
+            with self._inference:
+                predicted = model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            self.counters['seconds'] += time.perf_counter() - start
+            self.counters['pairs_scored'] += len(pairs)
+            self.counters['batches'] += -(-len(pairs) // self.batch_size)
+            fresh = {keys[i]: float(score) for i, score in zip(missing, predicted)}
+            self._remember(fresh)
+            for i in missing:
+                scores[i] = fresh[keys[i]]
+        return scores
+
+    def rerank(self, query: str, documents: Sequence[Document], top_k: int) -> List[Document]:
+        """The ``top_k`` documents by cross-encoder score, best first."""
+        if not documents:
+            return []
+        scores = self.score(query, [doc.page_content for doc in documents])
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        return [documents[i] for i in order[:top_k]]
+
+    def stats(self) -> Dict[str, float]:
+        return dict(self.counters, cached_pairs=len(self._cache))
@@ -0,0 +1,203 @@
+"""Sensitive-term screening of the raw user input, before any LLM call.
+
+Azure's content filter rejects prompts that contain some words ("性騷擾") even in
+a legitimate HR question, and the turn then ends in an HttpResponseError after a
+full round trip. SensitiveTermFilter finds every lexicon term in the input in one
+pass of an Aho–Corasick automaton (pyahocorasick when installed, otherwise the
+pure-Python _Automaton below). A block term ends the turn, which is then answered
+with prompts.sensitive_word_response; a rewrite term is replaced by a neutral
+phrasing in the prompts sent to the LLM (clients.rewrite_for_llm), while retrieval
+and the session history keep the text as the user wrote it.
+
+The input is matched after NFKC normalisation and casefolding, and separators
+between characters are skipped, so "性 騷 擾" and "性.騷.擾" match 性騷擾. Terms
+written in an alphabetic script only match whole words by default ("he" does not
+match in "the hero"); an entry's "whole_word" overrides that. Any block term
+blocks the input, even where it overlaps a longer rewrite term.
+Traditional and simplified forms are matched through each entry's variants, and
+generated with OpenCC when it is installed.
+
+Lexicon files (SensitiveTermConfig.lexicon_path) are JSON lists of entries:
+
+    {"term": "性騷擾", "action": "rewrite", "replacement": "越矩的肢體碰觸行為",
+     "variants": ["性骚扰"]}
+    {"term": "...", "action": "block"}
+"""
+import json
+import logging
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+REWRITE = 'rewrite'
+BLOCK = 'block'
+
+# The terms the NLU step used to replace in extracted keywords; lexicon files add to these.
+DEFAULT_LEXICON: List[dict] = [
+    {'term': '性騷擾', 'action': REWRITE, 'replacement': '越矩的肢體碰觸行為', 'variants': ['性骚扰']},
+]
+_SEPARATOR_CATEGORIES = ('Z', 'P', 'S', 'C')
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def _is_separator(char: str) -> bool:
+    return unicodedata.category(char)[0] in _SEPARATOR_CATEGORIES
+
+
+def _is_word_char(char: str) -> bool:
+    # Letters and digits of alphabetic scripts; CJK text has no word boundaries to respect.
+    return char.isalnum() and ord(char) < 0x2E80
+
+
+def _opencc_variants(term: str) -> List[str]:
+    try:
+        import opencc
+    except ImportError:
+        return []
+    return [opencc.OpenCC(config).convert(term) for config in ('s2t', 't2s', 's2tw', 'tw2s')]
+
+
+class _Automaton:
+    """The subset of ahocorasick.Automaton used here: add_word, make_automaton and iter."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]
+
+    def add_word(self, key: str, value) -> None:
+        state = 0
+        for char in key:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._out[state].append((len(key), value))
+
+    def make_automaton(self) -> None:
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def iter(self, text: str) -> Iterator[Tuple[int, object]]:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for _, value in out[state]:
+                yield end, value
+
+
+def _new_automaton():
+    try:
+        import ahocorasick
+    except ImportError:
+        return _Automaton()
+    return ahocorasick.Automaton()
+
+
+def load_lexicon(path: Optional[str]) -> List[dict]:
+    entries = list(DEFAULT_LEXICON)
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries.extend(json.load(f))
+        except FileNotFoundError:
+            logging.warning(f"Sensitive-term lexicon {path} not found; using the built-in terms only.")
+    return entries
+
+
+class SensitiveTermFilter:
+    def __init__(self, entries: Iterable[dict]):
+        automaton = _new_automaton()
+        self.terms = 0
+        for entry in entries:
+            action = entry.get('action', REWRITE)
+            if action not in (REWRITE, BLOCK):
+                raise ValueError(f"Unknown action {action!r} for sensitive term {entry['term']!r}")
+            if action == REWRITE and not entry.get('replacement'):
+                raise ValueError(f"Sensitive term {entry['term']!r} needs a replacement to be rewritten")
+            forms = [entry['term'], *entry.get('variants', ()), *_opencc_variants(entry['term'])]
+            for form in dict.fromkeys(_normalize(form) for form in forms):
+                # Separators are skipped in the input, so they are dropped from the keys too.
+                key = ''.join(char for char in form if not _is_separator(char))
+                if key:
+                    whole_word = entry.get('whole_word', all(_is_word_char(char) for char in key))
+                    automaton.add_word(key, (len(key), (entry['term'], action, entry.get('replacement', ''),
+                                                        whole_word)))
+                    self.terms += 1
+        if self.terms:
+            automaton.make_automaton()
+        self._automaton = automaton
+
+    def _found(self, text: str) -> List[Tuple[int, int, str, str, str]]:
+        """Every ``(start, end, term, action, replacement)`` in ``text``, overlapping ones included."""
+        if not self.terms:
+            return []
+        # The searched string holds only non-separator characters; positions maps it back to text.
+        normalized = _normalize(text)
+        if len(normalized) != len(text):
+            # NFKC changed the length (e.g. ligatures); fall back to per-character normalisation.
+            normalized = ''.join(_normalize(char)[:1] or char for char in text)
+        positions = [i for i, char in enumerate(normalized) if not _is_separator(char)]
+        compact = ''.join(normalized[i] for i in positions)
+        found = []
+        for end, (length, (term, action, replacement, whole_word)) in self._automaton.iter(compact):
+            start, end = positions[end - length + 1], positions[end] + 1
+            if whole_word and ((start > 0 and _is_word_char(normalized[start - 1]))
+                               or (end < len(normalized) and _is_word_char(normalized[end]))):
+                continue
+            found.append((start, end, term, action, replacement))
+        return sorted(found, key=lambda match: (match[0], -match[1]))
+
+    @staticmethod
+    def _leftmost_longest(found: List[Tuple[int, int, str, str, str]]) -> List[Tuple[int, int, str, str, str]]:
+        matches, covered = [], 0
+        for match in found:
+            if match[0] >= covered:
+                matches.append(match)
+                covered = match[1]
+        return matches
+
+    def matches(self, text: str) -> List[Tuple[int, int, str, str, str]]:
+        """Non-overlapping ``(start, end, term, action, replacement)`` in ``text``, leftmost-longest first."""
+        return self._leftmost_longest(self._found(text))
+
+    @staticmethod
+    def _replace(text: str, matches: List[Tuple[int, int, str, str, str]]) -> str:
+        parts, last = [], 0
+        for start, end, _, _, replacement in matches:
+            parts.append(text[last:start])
+            parts.append(replacement)
+            last = end
+        parts.append(text[last:])
+        return ''.join(parts)
+
+    def screen(self, text: str) -> Tuple[Optional[str], List[str]]:
+        """``text`` with rewrite terms replaced, or None when a block term occurs; and the terms found."""
+        found = self._found(text)
+        # Any block term blocks, even one overlapping a longer rewrite term.
+        blocked = [term for _, _, term, action, _ in found if action == BLOCK]
+        if blocked:
+            return None, list(dict.fromkeys(blocked))
+        matches = self._leftmost_longest(found)
+        return self._replace(text, matches), [term for _, _, term, _, _ in matches]
+
+    def rewrite(self, text: str) -> str:
+        """``text`` with rewrite terms replaced; block terms are left as they are."""
+        return self._replace(text, self._leftmost_longest(
+            [match for match in self._found(text) if match[3] == REWRITE]))
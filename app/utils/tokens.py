@@ -0,0 +1,56 @@
+"""Token counting for prompt budgets.
+
+Uses tiktoken's encoding for gpt-4o. tiktoken downloads its BPE file on first use,
+so when that fails (offline containers) we fall back to an estimate: one token per
+CJK character plus one per four other characters.
+"""
+import re
+import logging
+import threading
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_CJK = re.compile(r'[\u3000-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.encoding_for_model("gpt-4o")
+                except Exception as e:
+                    logging.warning(f"tiktoken unavailable ({e}); estimating token counts")
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` so that it fits in ``max_tokens``, keeping the beginning."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
@@ -0,0 +1,63 @@
+"""Synthetic HR corpus shared by the benchmarks, so they run without data_files or Azure."""
+import os
+import random
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from benchmarks._fakes import FakeEmbeddings
+from app.utils.load_data import LoadHRdata
+
+SOURCES = [
+    ("福利與津貼.csv", "csv"),
+    ("員工請假辦法_【公司規定】.pdf", "pdf"),
+    ("薪資與獎金辦法_【公司規定】.pdf", "pdf"),
+    ("差旅費用報支辦法_【公司規定】.pdf", "pdf"),
+    ("勞動基準法_【法令規定】.pdf", "pdf"),
+    ("性別平等工作法_【法令規定】.pdf", "pdf"),
+]
+
+CLAUSES = [
+    "員工分娩前後，應停止工作，給予產假八星期；妊娠三個月以上流產者，給予產假四星期。",
+    "受僱者任職滿六個月後，於每一子女滿三歲前，得申請育嬰留職停薪。",
+    "勞工在同一雇主繼續工作滿一定期間者，應依規定給予特別休假。",
+    "延長工作時間在二小時以內者，按平日每小時工資額加給三分之一以上。",
+    "員工結婚者給予婚假八日，工資照給。",
+    "員工因公出差，得依職等核實報支交通費、住宿費及膳雜費。",
+    "年終獎金依公司營運狀況及個人年度考績發給，考績甲等以上者另加發績效獎金。",
+    "員工每年得享健康檢查一次，費用由公司全額負擔。",
+    "員工離職應於三十日前以書面提出，並完成業務交接及離職面談。",
+    "性騷擾申訴應於知悉後立即向人資部門提出，公司應於七日內展開調查。",
+]
+
+QUERIES = ["生小孩", "育嬰留停怎麼申請", "特休有幾天", "加班費怎麼算", "婚假", "出差津貼",
+           "年終獎金", "健康檢查", "離職流程", "產假薪水照給嗎", "第8條 產假", "勞基法 加班"]
+
+
+def synthetic_documents(n_chunks: int, seed: int = 0) -> Dict[str, List[Document]]:
+    rng = random.Random(seed)
+    docs: Dict[str, List[Document]] = {name: [] for name, _ in SOURCES}
+    for i in range(n_chunks):
+        name, kind = SOURCES[i % len(SOURCES)]
+        article = len(docs[name]) + 1
+        body = "".join(rng.sample(CLAUSES, 3))
+        if kind == "csv":
+            content = f"項目: 福利{article}\n說明: {body}"
+            metadata = {"source": f"data_files/{name}", "row": article - 1, "source_type": "csv"}
+        else:
+            content = f"第{article}條 {body}" * 4
+            metadata = {"source": f"data_files/{name}", "page": article // 3 + 1}
+        docs[name].append(Document(page_content=content, metadata=metadata))
+    return docs
+
+
+def build_load_data(directory: str, n_chunks: int = 600, embeddings: Optional[Embeddings] = None) -> LoadHRdata:
+    """A LoadHRdata over a temp DB holding ``n_chunks`` synthetic chunks, index resident."""
+    embeddings = embeddings or FakeEmbeddings()
+    load_data = LoadHRdata(data_dir=directory, db_path=os.path.join(directory, 'bench.db'), embeddings=embeddings)
+    for name, docs in synthetic_documents(n_chunks).items():
+        vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+        load_data.chunk_store.replace_file(name, name, docs, vectors)
+    load_data.set_resident_vector_store(load_data.get_vector_store())
+    return load_data
@@ -0,0 +1,210 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_NLU_RESPONSE = (
+    '{"intent": "query_policy", '
+    '"entities": [{"value": "育嬰假", "types": ["time_leave", "compensation_benefits"]}], '
+    '"keywords": ["育嬰假", "生小孩"], "position": null}'
+)
+FAKE_REFINED_QUERY = "我剛生小孩，請問可以請哪些假？薪水怎麼算？"
+FAKE_UNDERSTAND_RESPONSE = FAKE_NLU_RESPONSE[:-1] + f', "refined_query": "{FAKE_REFINED_QUERY}"}}'
+FAKE_SUMMARY = "員工詢問生育相關假別，已說明產假八星期與育嬰留職停薪的資格。"
+FAKE_ANSWER = (
+    "依據[員工請假辦法第8條](data_files/請假辦法_【公司規定】.pdf)，員工分娩前後可請產假八星期，"
+    "工資照給；育嬰留職停薪期間最長至子女滿三歲止。建議先向直屬主管與人資部提出申請。"
+)
+
+
+class FakeEmbeddings(Embeddings):
+    """Offline stand-in for AzureOpenAIEmbeddings.
+
+    Vectors are derived from a hash of the text, so the same text always embeds the
+    same way. ``latency`` / ``per_text_latency`` simulate the API round trip and
+    ``failure_rate`` makes a fraction of calls raise, to exercise retry paths.
+    """
+
+    def __init__(self, size: int = 1536, latency: float = 0.0, per_text_latency: float = 0.0,
+                 failure_rate: float = 0.0, seed: int = 0):
+        self.size = size
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.failure_rate = failure_rate
+        self.model = f"fake-{size}"
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _call(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        if fail:
+            raise RuntimeError("FakeEmbeddings: simulated rate limit")
+        with self._lock:
+            self.texts_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call([text])[0]
+
+
+class FakeCrossEncoder:
+    """Offline stand-in for sentence_transformers.CrossEncoder.
+
+    Scores a (query, text) pair by the share of the query's character bigrams found in
+    the text, which is enough to rank keyword matches first. ``per_pair_latency``
+    simulates CPU inference time.
+    """
+
+    def __init__(self, per_pair_latency: float = 0.0):
+        self.per_pair_latency = per_pair_latency
+        self.pairs_scored = 0
+
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def predict(self, pairs, batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        time.sleep(self.per_pair_latency * len(pairs))
+        self.pairs_scored += len(pairs)
+        scores = []
+        for query, text in pairs:
+            grams = self._bigrams(query)
+            scores.append(sum(gram in text for gram in grams) / len(grams) if grams else 0.0)
+        return np.asarray(scores, dtype=np.float32)
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline stand-in for AzureChatOpenAI with configurable latency.
+
+    The first ``replies`` marker found in the prompt picks the reply (understand JSON,
+    NLU JSON, refined query, history summary); any other prompt gets ``response``.
+    ``latency`` is the time to first token and ``token_latency`` the delay between
+    streamed chunks, so both blocking and streaming paths can be timed. Usage is
+    reported like the OpenAI client so get_openai_callback picks it up, and summed
+    in ``calls`` / ``prompt_tokens``. With ``prefix_cache`` the prompt's longest
+    common prefix with an earlier prompt is reported as cached tokens, under the
+    provider's rules (at least 1024 tokens, then in steps of 128).
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    response: str = FAKE_ANSWER
+    replies: Dict[str, str] = {
+        "refined_query": FAKE_UNDERSTAND_RESPONSE,
+        "JSON": FAKE_NLU_RESPONSE,
+        "僅產出1個": FAKE_REFINED_QUERY,
+        "新的摘要": FAKE_SUMMARY,
+    }
+    chunk_size: int = 4
+    calls: int = 0
+    prompt_tokens: int = 0
+    prefix_cache: bool = False
+    cached_tokens: int = 0
+    seen_prompts: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        prompt = "".join(str(message.content) for message in messages)
+        for marker, reply in self.replies.items():
+            if marker in prompt:
+                return reply
+        return self.response
+
+    def _cached(self, prompt: str) -> int:
+        if not self.prefix_cache:
+            return 0
+        longest = 0
+        for seen in self.seen_prompts:
+            common = os.path.commonprefix([seen, prompt])
+            longest = max(longest, len(common))
+        self.seen_prompts.append(prompt)
+        return 0 if longest < 1024 else 1024 + (longest - 1024) // 128 * 128
+
+    def _usage(self, messages: List[BaseMessage], reply: str):
+        # Roughly one token per CJK character; good enough for relative comparisons.
+        prompt = "".join(str(message.content) for message in messages)
+        prompt_tokens = len(prompt)
+        # Called once per request, blocking or streamed.
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        cached = self._cached(prompt)
+        self.cached_tokens += cached
+        return {"input_tokens": prompt_tokens, "output_tokens": len(reply),
+                "total_tokens": prompt_tokens + len(reply)}, cached
+
+    def _chunks(self, reply: str) -> List[str]:
+        return [reply[i:i + self.chunk_size] for i in range(0, len(reply), self.chunk_size)]
+
+    def _result(self, messages: List[BaseMessage], reply: str) -> ChatResult:
+        usage, cached = self._usage(messages, reply)
+        message = AIMessage(content=reply, usage_metadata=usage,
+                            response_metadata={"model_name": "gpt-4o-2024-05-13"})
+        # langchain-openai 0.2 passes the API's usage block on as llm_output["token_usage"].
+        token_usage = {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"],
+                       "total_tokens": usage["total_tokens"], "prompt_tokens_details": {"cached_tokens": cached}}
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": token_usage, "model_name": "gpt-4o-2024-05-13"})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        time.sleep(self.latency + self.token_latency * len(self._chunks(reply)))
+        return self._result(messages, reply)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(self._chunks(reply)))
+        return self._result(messages, reply)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        time.sleep(self.latency)
+        for piece in self._chunks(reply):
+            time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=self._usage(messages, reply)[0],
+            response_metadata={"model_name": "gpt-4o-2024-05-13"}))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        for piece in self._chunks(reply):
+            await asyncio.sleep(self.token_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=self._usage(messages, reply)[0],
+            response_metadata={"model_name": "gpt-4o-2024-05-13"}))
@@ -0,0 +1,60 @@
+"""Servers for bench_asgi_vs_gevent: the chat API over the synthetic corpus, with the
+real AzureChatOpenAI client pointed at benchmarks.mock_llm_server.
+
+    python -m benchmarks._load_test_app gevent <port> <mock_llm_url>
+    python -m benchmarks._load_test_app asgi <port> <mock_llm_url>
+
+``gevent`` serves the Flask app the way one gunicorn gevent worker does (monkey
+patched, gevent WSGIServer); ``asgi`` serves the Starlette app under uvicorn.
+"""
+import sys
+import tempfile
+
+
+def _point_llm_at(url: str):
+    from app.services import clients
+    from config import AnswerCacheConfig, OpenaiConfig
+    OpenaiConfig.endpoint = url
+    OpenaiConfig.token = 'mock'
+    # Every client asks the same few questions; measure the LLM path, not the cache.
+    AnswerCacheConfig.enabled = False
+    clients.reset()
+
+
+def _conversation_manager(tmp: str):
+    from app.services.conversation_manager import ConversationManager
+    from app.services.session_store import MemorySessionStore
+    from benchmarks._corpus import build_load_data
+    return ConversationManager(build_load_data(tmp, n_chunks=300), session_store=MemorySessionStore())
+
+
+def serve_gevent(port: int, url: str):
+    from gevent import monkey
+    monkey.patch_all()
+    from gevent.pywsgi import WSGIServer
+    from flask import Flask
+
+    _point_llm_at(url)
+    from app.routes import chat_routes
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.conversation_manager = _conversation_manager(tmp)
+        app.register_blueprint(chat_routes.bp)
+        WSGIServer(('127.0.0.1', port), app, log=None).serve_forever()
+
+
+def serve_asgi(port: int, url: str):
+    import uvicorn
+    from starlette.applications import Starlette
+
+    _point_llm_at(url)
+    from app.routes import asgi_routes
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Starlette(routes=asgi_routes.routes)
+        app.state.conversation_manager = _conversation_manager(tmp)
+        uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+
+if __name__ == '__main__':
+    mode, port, url = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+    {'gevent': serve_gevent, 'asgi': serve_asgi}[mode](port, url)
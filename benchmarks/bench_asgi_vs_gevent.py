@@ -0,0 +1,93 @@
+"""Load test: concurrent chat turns on one gevent worker vs. one ASGI (uvicorn) worker.
+
+Starts benchmarks.mock_llm_server (fixed latency per LLM call) and each server from
+benchmarks._load_test_app in turn, then runs ``concurrency`` simulated users, each
+starting a conversation and asking ``turns`` questions. Reports completed turns per
+second and turn latency percentiles for each concurrency level.
+
+Usage: python -m benchmarks.bench_asgi_vs_gevent [llm_latency_seconds] [turns] [concurrency ...]
+"""
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+import statistics
+
+import httpx
+
+from benchmarks._corpus import QUERIES
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start(args, port: int, timeout: float = 120.0) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, '-m', *args], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(args)} exited with {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{' '.join(args)} did not start listening on {port}")
+
+
+async def _user(client: httpx.AsyncClient, base: str, user: int, turns: int, latencies):
+    session_id = f"load-{user}-{time.monotonic_ns()}"
+    await client.post(f"{base}/start_conversation", json={'conversation_id': session_id})
+    for turn in range(turns):
+        start = time.perf_counter()
+        response = await client.post(f"{base}/api/chat/hr", json={
+            'conversation_id': session_id, 'message': QUERIES[(user + turn) % len(QUERIES)],
+        })
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    await client.post(f"{base}/end_conversation", json={'session_id': session_id})
+
+
+async def _run(base: str, concurrency: int, turns: int):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(_user(client, base, user, turns, latencies) for user in range(concurrency)))
+        wall = time.perf_counter() - start
+    latencies.sort()
+    return len(latencies) / wall, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main(latency: float = 0.5, turns: int = 3, *levels: int):
+    levels = levels or (8, 32, 128)
+    mock_port = _free_port()
+    mock = _start(['benchmarks.mock_llm_server', str(mock_port), str(latency)], mock_port)
+    url = f"http://127.0.0.1:{mock_port}"
+    try:
+        for mode in ('gevent', 'asgi'):
+            port = _free_port()
+            server = _start(['benchmarks._load_test_app', mode, str(port), url], port)
+            try:
+                base = f"http://127.0.0.1:{port}"
+                asyncio.run(_run(base, 2, 1))  # warm up clients and lazy chains
+                for concurrency in levels:
+                    rate, p50, p95 = asyncio.run(_run(base, concurrency, turns))
+                    print(f"{mode:<7} users {concurrency:>4}  {rate:6.1f} turns/s  "
+                          f"p50 {p50:6.2f}s  p95 {p95:6.2f}s")
+            finally:
+                server.terminate()
+                server.wait()
+        print(f"mock LLM requests: {httpx.get(url + '/stats').json()['requests']}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == '__main__':
+    main(*(float(a) for a in sys.argv[1:2]), *(int(a) for a in sys.argv[2:]))
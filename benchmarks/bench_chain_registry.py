@@ -0,0 +1,86 @@
+"""Session creation and per-turn prompt formatting: per-session chains vs. the chain registry.
+
+"per session" is what HrTalk.__init__ and the NLU chain used to do, with the shared
+chat model (client construction is bench_session_start's subject): build the
+data_chain and refine prompts and chains and a ConversationChain for every
+session, and format prompts whose system template holds the variables, with the
+EntityType / HRIntentCategory listings joined again on every NLU call.
+"registry" creates an HrTalk, whose chains come from app/services/chains.py, and
+formats the precompiled static-first prompts.
+
+Usage: python -m benchmarks.bench_chain_registry [iterations]
+"""
+import sys
+import time
+
+from langchain.chains import ConversationChain
+from langchain.memory import ConversationBufferMemory
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.runnables import RunnablePassthrough
+
+from app.services import chains, clients
+from benchmarks._fakes import FakeChatModel
+from app.utils.utils import EntityType, HRIntentCategory
+
+HISTORY = "Human: 我剛生小孩可以請什麼假\nAI: 可請產假八星期，工資照給。\n" * 3
+CONTEXT = "第8條 女性員工分娩前後，應停止工作，給予產假八星期。" * 40
+QUESTION = "我剛生小孩，育嬰留停期間的勞健保怎麼辦？"
+
+
+def _us(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations: int = 2000):
+    llm = FakeChatModel()
+    clients.set_chat_llm(llm)
+    from app.services import NLU
+    from app.services.llm import HrTalk
+    from app.utils.prompts import NLU_prompt, data_chain_input, initial_data_chain_prompt, refine_query_input, \
+        refine_query_prompt
+
+    old_data_template = data_chain_input + initial_data_chain_prompt
+    old_refine_template = refine_query_prompt + refine_query_input
+    old_nlu_prompt = ChatPromptTemplate.from_messages([("system", NLU_prompt + "\n之前的對話摘要：\n{history}")])
+
+    def per_session():
+        data_chain = ChatPromptTemplate.from_messages([
+            ("system", old_data_template), ("human", "{text}")
+        ]) | llm | RunnablePassthrough()
+        refine_chain = PromptTemplate(input_variables=["history", "input"], template=old_refine_template) \
+            | llm | StrOutputParser()
+        memory = ConversationBufferMemory(input_key="input", return_messages=True)
+        ConversationChain(llm=llm, memory=memory, input_key='input', output_key="output",
+                          prompt=PromptTemplate(input_variables=["history", "input"], template=old_refine_template))
+        return data_chain, refine_chain
+
+    old_data_chain, old_refine_chain = per_session()
+
+    def per_session_turn():
+        old_nlu_prompt.format_messages(
+            input=QUESTION, history=HISTORY,
+            entity_types=", ".join([f"{e.name}: {e.value}" for e in EntityType]),
+            intent_categories="\n".join([f"{i.name}: {i.value}" for i in HRIntentCategory]))
+        old_refine_chain.first.format_prompt(input=QUESTION, history=HISTORY)
+        old_data_chain.first.format_messages(question=QUESTION, text=CONTEXT, persona=HISTORY, ori_input=QUESTION)
+
+    def registry_turn():
+        NLU.get_nlu_chain().first.format_messages(input=QUESTION, history=HISTORY)
+        talk.refine_chain.first.format_messages(input=QUESTION, history=HISTORY)
+        talk.data_chain.first.format_messages(question=QUESTION, text=CONTEXT, persona=HISTORY, ori_input=QUESTION)
+
+    chains.get('data'), chains.get('refine'), chains.get('nlu')
+    talk = HrTalk(load_data=None)
+    print(f"{iterations} iterations\n")
+    print(f"{'':<12} {'session us':>11} {'turn format us':>15}")
+    print(f"{'per session':<12} {_us(per_session, iterations // 10):11.1f} {_us(per_session_turn, iterations):15.1f}")
+    print(f"{'registry':<12} {_us(lambda: HrTalk(load_data=None), iterations):11.1f} "
+          f"{_us(registry_turn, iterations):15.1f}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,80 @@
+"""Tokens in data_chain's ``{text}`` slot: raw List[Document] vs. build_context.
+
+Pages of synthetic rules are split the way ingest splits them (1200 chars, 600
+overlap), so retrieved neighbours overlap like they do on the real data files.
+For each query the k=8 retrieved chunks are rendered raw, merged and compacted
+without a budget, and packed into the budget; a run of 8 adjacent chunks shows
+the overlap merging on its own.
+
+Usage: python -m benchmarks.bench_context_packing [pages_per_file] [max_tokens]
+"""
+import os
+import sys
+import random
+import tempfile
+import statistics
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from app.utils.context_builder import build_context
+from benchmarks._fakes import FakeEmbeddings
+from app.utils.load_data import LoadHRdata
+from app.utils.tokens import count_tokens
+from benchmarks._corpus import CLAUSES, QUERIES, SOURCES
+from config import ChatConfig, RetrievalConfig
+
+
+def _pages(name: str, kind: str, n_pages: int, rng: random.Random):
+    for page in range(n_pages):
+        if kind == 'csv':
+            body = "".join(rng.sample(CLAUSES, 2))
+            yield Document(page_content=f"項目: 福利{page + 1}\n說明: {body}",
+                           metadata={'source': f"data_files/{name}", 'row': page, 'source_type': 'csv'})
+            continue
+        articles = "\n".join(f"第{page * 10 + i + 1}條　{''.join(rng.sample(CLAUSES, 5))}" for i in range(10))
+        yield Document(page_content=articles, metadata={'source': f"data_files/{name}", 'page': page})
+
+
+def main(pages_per_file: int = 40, max_tokens: int = ChatConfig.context_max_tokens):
+    rng = random.Random(0)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=600)
+    embeddings = FakeEmbeddings()
+    RetrievalConfig.nlu_filters = False
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = LoadHRdata(data_dir=tmp, db_path=os.path.join(tmp, 'bench.db'), embeddings=embeddings)
+        for name, kind in SOURCES:
+            docs = splitter.split_documents(list(_pages(name, kind, pages_per_file, rng)))
+            vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+            load_data.chunk_store.replace_file(name, name, docs, vectors)
+        load_data.set_resident_vector_store(load_data.get_vector_store())
+        print(f"{load_data.chunk_store.count()} chunks, budget {max_tokens} tokens\n")
+
+        print(f"{'query':<12} {'raw tokens':>10} {'merged':>7} {'packed':>7} {'chunks':>7} {'blocks':>7} {'kept':>5}")
+        raw_totals, merged_totals, packed_totals = [], [], []
+        for query in QUERIES:
+            docs = load_data.retrieve(query, load_data.embed_query(query), k=8)
+            raw = count_tokens(str(docs))
+            merged = build_context(docs, sys.maxsize)[1]['tokens']
+            _, stats = build_context(docs, max_tokens)
+            raw_totals.append(raw)
+            merged_totals.append(merged)
+            packed_totals.append(stats['tokens'])
+            print(f"{query[:10]:<12} {raw:>10} {merged:>7} {stats['tokens']:>7} {stats['chunks']:>7} "
+                  f"{stats['blocks']:>7} {stats['kept']:>5}")
+
+        # Worst case for overlap: 8 consecutive chunks of the same file, as a broad query on one topic retrieves.
+        store = load_data.vector_store
+        window = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(40, 48)]
+        _, stats = build_context(window, sys.maxsize)
+        print(f"{'8 adjacent':<12} {count_tokens(str(window)):>10} {stats['tokens']:>7} {'':>7} "
+              f"{stats['chunks']:>7} {stats['blocks']:>7} {stats['kept']:>5}")
+
+        print(f"\nmean {{text}} tokens: raw {statistics.mean(raw_totals):.0f}, "
+              f"merged and compacted {statistics.mean(merged_totals):.0f}, "
+              f"packed {statistics.mean(packed_totals):.0f} "
+              f"({1 - sum(packed_totals) / sum(raw_totals):.0%} fewer)")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,56 @@
+"""Embedding traffic with and without CachedEmbeddings.
+
+Simulates re-ingesting a file where only a few chunks changed, then a stream of
+repetitive chat queries, against FakeEmbeddings with simulated API latency.
+
+Usage: python -m benchmarks.bench_embedding_cache [n_chunks] [n_queries]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+from benchmarks._fakes import FakeEmbeddings
+from app.utils.embedding_cache import CachedEmbeddings
+
+FAQ = ["生小孩", "特休", "加班費", "婚假", "喪假", "年終獎金", "健康檢查", "育嬰留停", "出差津貼", "離職流程"]
+
+
+def _workload(embeddings, chunks, changed, queries):
+    start = time.perf_counter()
+    embeddings.embed_documents(chunks)
+    embeddings.embed_documents(changed)
+    for query in queries:
+        embeddings.embed_query(query)
+    return time.perf_counter() - start
+
+
+def main(n_chunks: int = 500, n_queries: int = 300):
+    rng = random.Random(0)
+    chunks = [f"第{i}條 員工請假與津貼規定 {i}" for i in range(n_chunks)]
+    changed = list(chunks)
+    for i in rng.sample(range(n_chunks), n_chunks // 20):
+        changed[i] += " (修訂)"
+    # Zipf-like: a handful of FAQ questions dominate.
+    queries = [FAQ[min(int(rng.paretovariate(1.2)) - 1, len(FAQ) - 1)] for _ in range(n_queries)]
+
+    plain = FakeEmbeddings(latency=0.05, per_text_latency=0.0005)
+    plain_seconds = _workload(plain, chunks, changed, queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inner = FakeEmbeddings(latency=0.05, per_text_latency=0.0005)
+        cached = CachedEmbeddings(inner, os.path.join(tmp, 'cache.db'), lru_size=256)
+        cached_seconds = _workload(cached, chunks, changed, queries)
+        stats = cached.stats()
+
+    print(f"uncached: {plain.calls} API calls, {plain.texts_embedded} texts, {plain_seconds:.2f}s")
+    print(f"cached:   {inner.calls} API calls, {inner.texts_embedded} texts, {cached_seconds:.2f}s")
+    for kind in ('document', 'query'):
+        print(f"  {kind:<9} memory hits {stats[f'{kind}_memory_hits']:.0f}, disk hits {stats[f'{kind}_disk_hits']:.0f}, "
+              f"misses {stats[f'{kind}_misses']:.0f}, hit rate {stats[f'{kind}_hit_rate']:.1%}")
+    print(f"  estimated API time saved {stats['saved_seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
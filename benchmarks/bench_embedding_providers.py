@@ -0,0 +1,97 @@
+"""Embedding providers compared on a labelled HR corpus: ingest time, query latency, recall.
+
+Each chunk states one of the corpus CLAUSES; each query is labelled with the clause
+that answers it. For every provider the corpus is embedded into a fresh index and
+the queries are answered by dense search only, reporting ingest seconds, query
+embedding + search latency, hit@k and precision@k.
+
+Providers: azure (needs the Azure endpoint), local, local-int8, local-onnx,
+local-onnx-int8 (need sentence-transformers and the model; see EmbeddingConfig) and
+simulated-api (FakeEmbeddings with an API-like round trip; its vectors carry no
+meaning, so its recall is the chance level). Unavailable providers are skipped.
+
+Usage: python -m benchmarks.bench_embedding_providers [n_chunks] [k] [provider ...]
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+from langchain_core.documents import Document
+
+from benchmarks._fakes import FakeEmbeddings
+from app.utils.load_data import LoadHRdata
+from benchmarks._corpus import CLAUSES
+from config import EmbeddingConfig, OpenaiConfig
+
+LABELLED = [
+    ("生小孩可以請幾天假", 0), ("產假薪水照給嗎", 0), ("育嬰留停怎麼申請", 1), ("特休有幾天", 2),
+    ("加班費怎麼算", 3), ("結婚可以請假嗎", 4), ("出差住宿可以報嗎", 5), ("年終獎金怎麼發", 6),
+    ("健康檢查要自費嗎", 7), ("離職要提前多久說", 8), ("被性騷擾要找誰", 9),
+]
+FILLERS = ["本辦法經核定後施行，修正時亦同。", "各單位主管應督導所屬確實遵守。", "未盡事宜依相關法令辦理。"]
+
+
+def _provider(name: str):
+    if name == 'simulated-api':
+        return FakeEmbeddings(latency=0.08, per_text_latency=0.0005)
+    if name == 'azure':
+        return OpenaiConfig.initail_azureopenai_embeddings(os.path.join(tempfile.gettempdir(), 'bench_azure_cache.db'))
+    from app.utils.local_embeddings import LocalEmbeddings
+    backend = 'onnx' if 'onnx' in name else 'torch'
+    quantize = 'int8' if name.endswith('int8') else None
+    embeddings = LocalEmbeddings(EmbeddingConfig.local_model, backend=backend, quantize=quantize,
+                                 batch_size=EmbeddingConfig.local_batch_size, workers=EmbeddingConfig.local_workers,
+                                 max_threads=EmbeddingConfig.local_max_threads)
+    embeddings.embed_query("warm up")
+    return embeddings
+
+
+def _corpus(n_chunks: int):
+    docs = []
+    for i in range(n_chunks):
+        clause = i % len(CLAUSES)
+        content = f"第{i // len(CLAUSES) + 1}條 {CLAUSES[clause]}{FILLERS[i % len(FILLERS)]}"
+        docs.append(Document(page_content=content, metadata={'source': 'data_files/bench.pdf', 'clause': clause}))
+    return docs
+
+
+def _measure(embeddings, docs, k: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = LoadHRdata(data_dir=tmp, db_path=os.path.join(tmp, 'bench.db'), embeddings=embeddings)
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+        ingest = time.perf_counter() - start
+        load_data.chunk_store.replace_file('bench.pdf', 'bench', docs, vectors)
+        load_data.set_resident_vector_store(load_data.get_vector_store())
+
+        latencies, hits, precision = [], 0, []
+        for query, clause in LABELLED * 3:
+            start = time.perf_counter()
+            found = load_data.vector_store.similarity_search_by_vector(load_data.embed_query(query), k=k)
+            latencies.append(time.perf_counter() - start)
+            relevant = [doc.metadata['clause'] == clause for doc in found]
+            hits += any(relevant)
+            precision.append(sum(relevant) / k)
+    latencies.sort()
+    return (ingest, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1],
+            hits / len(latencies), statistics.mean(precision))
+
+
+def main(n_chunks: int = 2000, k: int = 4, *providers: str):
+    providers = providers or ('simulated-api', 'local', 'local-int8', 'local-onnx-int8', 'azure')
+    docs = _corpus(n_chunks)
+    print(f"{n_chunks} chunks, {len(LABELLED)} labelled queries, k={k}\n")
+    print(f"{'provider':<16} {'ingest s':>9} {'query p50 ms':>13} {'p95 ms':>8} {'hit@k':>6} {'prec@k':>7}")
+    for name in providers:
+        try:
+            ingest, p50, p95, hit_rate, precision = _measure(_provider(name), docs, k)
+        except Exception as e:
+            print(f"{name:<16} skipped: {type(e).__name__}: {str(e)[:80]}")
+            continue
+        print(f"{name:<16} {ingest:9.2f} {p50 * 1000:13.1f} {p95 * 1000:8.1f} {hit_rate:6.2f} {precision:7.2f}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]), *sys.argv[3:])
@@ -0,0 +1,84 @@
+"""FAISS index types at 10x corpus volume: recall@k against the exact index vs. latency and size.
+
+Vectors are synthetic 1536-d (ada-002 sized) points around topic centroids, so the
+nearest neighbours are as clustered as in the chunk corpus. Each index type in
+app/utils/faiss_index.py is built over the same vectors and queried with the same
+perturbed corpus vectors; recall@k is the share of the exact (flat) top k it returns.
+Build includes training; load is opening the exported index file, which is what
+every worker but the first does. Size is the index file: without memory mapping it
+is what the index adds to each worker's RSS, with it the page cache holds it once.
+The exact reference is flat's single-list IVF (faiss_index.EXACT_SPEC).
+
+Usage: python -m benchmarks.bench_faiss_index_types [n_vectors] [n_queries] [k]
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+import numpy as np
+
+from app.utils import faiss_index
+
+DIM = 1536
+SWEEPS = {'ivf_flat': ('nprobe', (4, 16, 64)), 'ivf_pq': ('nprobe', (4, 16, 64)),
+          'ivf_sq8': ('nprobe', (4, 16, 64)), 'hnsw': ('ef_search', (32, 128, 256))}
+
+
+def _vectors(n: int, n_queries: int, n_topics: int = 300, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(n_topics, DIM)).astype(np.float32)
+    matrix = centroids[rng.integers(0, n_topics, n)] + 0.6 * rng.normal(size=(n, DIM)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    queries = matrix[rng.choice(n, n_queries, replace=False)] + 0.02 * rng.normal(size=(n_queries, DIM)).astype(np.float32)
+    return np.ascontiguousarray(matrix, dtype=np.float32), np.ascontiguousarray(queries, dtype=np.float32)
+
+
+def _search(index, queries, k):
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    return statistics.median(latencies), np.vstack(found)
+
+
+def _recall(found, exact):
+    return statistics.mean(len(set(f) & set(e)) / len(e) for f, e in zip(found, exact))
+
+
+def main(n_vectors: int = 30000, n_queries: int = 200, k: int = 8):
+    matrix, queries = _vectors(n_vectors, n_queries)
+    print(f"{n_vectors} vectors x {DIM} dims, {n_queries} queries, recall@{k} against flat\n")
+    print(f"{'index':<22} {'param':<14} {'build s':>8} {'load ms':>8} {'size MB':>8} {'p50 ms':>7} {'recall':>7}")
+
+    exact = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for index_type in faiss_index.INDEX_TYPES:
+            spec = faiss_index.factory_string(index_type, DIM, n_vectors)
+            start = time.perf_counter()
+            index = faiss_index.build_index(matrix, spec)
+            build = time.perf_counter() - start
+            path = os.path.join(tmp, 'bench.faiss')
+            faiss_index.write_index(index, path)
+            size = os.path.getsize(path)
+            start = time.perf_counter()
+            index = faiss_index.read_index(path, mmap=False)
+            load = time.perf_counter() - start
+
+            name, values = SWEEPS.get(index_type, ('', (None,)))
+            for value in values:
+                if value is not None:
+                    faiss_index.tune(index, **{name: value})
+                p50, found = _search(index, queries, k)
+                if exact is None:
+                    exact = found
+                param = f"{name}={value}" if value is not None else "exact"
+                print(f"{spec:<22} {param:<14} {build:8.2f} {load * 1000:8.1f} {size / 2 ** 20:8.1f} "
+                      f"{p50 * 1000:7.3f} {_recall(found, exact):7.3f}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:4]))
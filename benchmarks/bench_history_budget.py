@@ -0,0 +1,48 @@
+"""Per-turn prompt tokens over a long conversation: unbounded buffer vs. SummarizingTokenMemory.
+
+Usage: python -m benchmarks.bench_history_budget [turns]
+"""
+import sys
+import tempfile
+
+from langchain.memory import ConversationBufferMemory
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+
+
+def _conversation(talk, turns, queries):
+    rows = []
+    for i in range(turns):
+        talk.chat_with_follow_up({'message': queries[i % len(queries)], 'current_conversation_id': 'bench'})
+        if hasattr(talk.chain_memories, 'wait_for_summary'):
+            talk.chain_memories.wait_for_summary()
+        rows.append(dict(talk.last_prompt_tokens))
+    return rows
+
+
+def main(turns: int = 30):
+    clients.set_chat_llm(FakeChatModel(response="依據公司規定辦理。" * 120))
+    from app.services.llm import HrTalk
+    from benchmarks._corpus import QUERIES, build_load_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = build_load_data(tmp)
+
+        unbounded = HrTalk(load_data)
+        unbounded.chain_memories = ConversationBufferMemory(input_key="input", return_messages=True)
+        before = _conversation(unbounded, turns, QUERIES)
+
+        after = _conversation(HrTalk(load_data), turns, QUERIES)
+
+    print(f"{'turn':>4} | {'history':>8} {'data_chain':>10} (unbounded) | {'history':>8} {'data_chain':>10} (budgeted)")
+    for turn in range(0, turns, max(1, turns // 10)):
+        b, a = before[turn], after[turn]
+        print(f"{turn + 1:>4} | {b['history']:>8} {b.get('data_chain', 0):>10}             | "
+              f"{a['history']:>8} {a.get('data_chain', 0):>10}")
+    print(f"max history tokens: unbounded {max(r['history'] for r in before)}, "
+          f"budgeted {max(r['history'] for r in after)}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,69 @@
+"""Retrieval quality and latency: FAISS MMR alone vs. BM25 + FAISS fused by RRF.
+
+Builds the synthetic corpus, then asks for article numbers ("第N條 ...", which dense
+retrieval over ada-002 often misses) and the FAQ-style QUERIES. FakeEmbeddings
+vectors carry no meaning, so the dense hit rate here is the floor of a real index;
+the point is how much the BM25 side recovers and how many embedding calls the
+keyword-only path saves. Embeddings have simulated API latency.
+
+Usage: python -m benchmarks.bench_hybrid_retrieval [n_chunks] [embed_latency_seconds]
+"""
+import sys
+import time
+import random
+import tempfile
+import statistics
+
+from benchmarks._fakes import FakeEmbeddings
+from benchmarks._corpus import QUERIES, build_load_data
+from config import RetrievalConfig
+
+
+def _dense(load_data, query):
+    return load_data.max_marginal_relevance_search_by_vector(load_data.embed_query(query), k=8)
+
+
+def _hybrid(load_data, query):
+    embedding = None if load_data.is_keyword_query(query) else load_data.embed_query(query)
+    return load_data.retrieve(query, embedding, k=8)
+
+
+def _run(load_data, search, queries):
+    hits, latencies = 0, []
+    calls = load_data.embeddings.calls
+    for query, article in queries:
+        start = time.perf_counter()
+        docs = search(load_data, query)
+        latencies.append(time.perf_counter() - start)
+        if article is not None:
+            hits += any(doc.page_content.startswith(f"第{article}條 ") for doc in docs)
+    return hits, statistics.mean(latencies), load_data.embeddings.calls - calls
+
+
+def main(n_chunks: int = 3000, latency: float = 0.05):
+    rng = random.Random(0)
+    per_file = n_chunks // 6
+    articles = [rng.randint(1, per_file) for _ in range(100)]
+    queries = [(f"第{n}條 規定", n) for n in articles] + [(query, None) for query in QUERIES * 5]
+
+    embeddings = FakeEmbeddings(latency=latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        load_data = build_load_data(tmp, n_chunks=n_chunks, embeddings=embeddings)
+        print(f"{n_chunks} chunks indexed in {time.perf_counter() - start:.1f}s "
+              f"({len(load_data.keyword_index)} in the keyword index)")
+        _hybrid(load_data, "warm up")
+
+        for name, search in (("dense (MMR)", _dense), ("hybrid (BM25+RRF)", _hybrid)):
+            hits, mean, calls = _run(load_data, search, queries)
+            print(f"{name:<20} article hits {hits:>3}/{len(articles)}  "
+                  f"mean {mean * 1000:7.1f} ms  embedding calls {calls:>3}/{len(queries)}")
+
+        RetrievalConfig.keyword_query_max_chars = 0
+        hits, mean, calls = _run(load_data, _hybrid, queries)
+        print(f"{'hybrid, always embed':<20} article hits {hits:>3}/{len(articles)}  "
+              f"mean {mean * 1000:7.1f} ms  embedding calls {calls:>3}/{len(queries)}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]), *(float(a) for a in sys.argv[2:3]))
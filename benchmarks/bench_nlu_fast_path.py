@@ -0,0 +1,94 @@
+"""NLU latency and LLM calls with and without the local fast path (app/utils/nlu_rules.py).
+
+Runs a labelled set of employee questions, short keyword queries and full
+sentences in roughly the mix seen in the chat logs, through NLU_classification.
+FakeChatModel stands in for GPT-4o and answers after ``latency`` seconds. For the
+fast path it reports the hit rate, how often a hit agrees with the hand label
+(intent and every labelled entity type), and the latency distribution of hits and
+of the whole set. The jieba dictionary is loaded before timing.
+
+Usage: python -m benchmarks.bench_nlu_fast_path [llm_latency_seconds]
+"""
+import sys
+import time
+import statistics
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+
+# (query, intent, entity types)
+LABELLED = [
+    ("特休", 'QUERY_POLICY', {'TIME_LEAVE'}),
+    ("婚假", 'QUERY_POLICY', {'TIME_LEAVE'}),
+    ("加班費怎麼算", 'QUERY_POLICY', {'TIME_OVERTIME'}),
+    ("病假怎麼申請", 'PROCESS', {'TIME_LEAVE'}),
+    ("離職流程", 'PROCESS', {'OFFBOARDING_RESIGNATION'}),
+    ("勞保", 'QUERY_POLICY', {'COMPENSATION_BENEFITS'}),
+    ("年終獎金什麼時候發", 'QUERY_POLICY', {'COMPENSATION_BONUS'}),
+    ("請問公司特休有幾天？", 'QUERY_POLICY', {'TIME_LEAVE'}),
+    ("生小孩可以請什麼假", 'QUERY_POLICY', {'TIME_LEAVE'}),
+    ("產假幾天", 'QUERY_POLICY', {'TIME_LEAVE'}),
+    ("忘記打卡", 'QUERY_POLICY', {'TIME_ATTENDANCE'}),
+    ("出差費報支", 'PROCESS', {'COMPENSATION_ALLOWANCE'}),
+    ("育嬰留停申請", 'PROCESS', {'TIME_LEAVE'}),
+    ("資遣費怎麼算", 'QUERY_POLICY', {'OFFBOARDING_TERMINATION'}),
+    ("在職證明", 'REQUEST_DOCUMENT', set()),
+    ("薪資系統密碼忘了", 'SYSTEM_ACCESS', {'COMPENSATION_SALARY'}),
+    ("那薪水照給嗎", 'QUERY_POLICY', {'COMPENSATION_SALARY'}),
+    ("我下個月要結婚，婚假可以分開請嗎？還是一定要連續請完？", 'QUERY_POLICY', {'TIME_LEAVE'}),
+    ("主管要求我假日加班但不給加班費，這樣合法嗎", 'QUERY_POLICY', {'TIME_OVERTIME', 'COMPLIANCE_REGULATION'}),
+    ("如果我在試用期內離職，需要提前多久告知公司？", 'QUERY_POLICY', {'OFFBOARDING_RESIGNATION'}),
+    ("我想了解一下今年的績效考核標準跟去年有什麼不同", 'QUERY_POLICY', {'PERFORMANCE_REVIEW'}),
+    ("同事一直對我講一些不舒服的話，我該找誰處理", 'PROCESS', {'EMPLOYEE_RELATIONS_CONFLICT'}),
+    ("育嬰留職停薪期間的勞健保要自己付嗎", 'QUERY_POLICY', {'TIME_LEAVE', 'COMPENSATION_BENEFITS'}),
+    ("請問可以幫我查一下我還剩幾天特休嗎", 'QUERY_POLICY', {'TIME_LEAVE'}),
+]
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return f"{pick(0.5) * 1000:9.2f} {pick(0.95) * 1000:9.2f} {pick(0.99) * 1000:9.2f}"
+
+
+def main(latency: float = 0.5):
+    llm = FakeChatModel(latency=latency)
+    clients.set_chat_llm(llm)
+    from app.services.NLU import NLU_classification
+    from config import NLUFastPathConfig
+
+    NLUFastPathConfig.log_path = None
+    fast_nlu = clients.get_fast_nlu()
+    fast_nlu.classify("特休")
+
+    print(f"{len(LABELLED)} labelled queries, {latency}s per LLM call, "
+          f"intent {'model' if fast_nlu.model is not None else 'rules'}\n")
+    hits, agree, hit_seconds = 0, 0, []
+    for query, intent, entity_types in LABELLED:
+        start = time.perf_counter()
+        result = fast_nlu.classify(query)
+        seconds = time.perf_counter() - start
+        if result is None:
+            continue
+        hits += 1
+        hit_seconds.append(seconds)
+        types = {t for entity in result['entities'] for t in entity['types']}
+        agree += result['intent'] == intent and entity_types <= types
+    print(f"fast path hits {hits}/{len(LABELLED)} ({hits / len(LABELLED):.0%}), "
+          f"agreeing with the label {agree}/{hits}")
+    print(f"fast path classify ms: p50/p95/p99 {_percentiles(hit_seconds)}\n")
+
+    print(f"{'mode':<10} {'LLM calls':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for enabled in (False, True):
+        NLUFastPathConfig.enabled = enabled
+        calls, seconds = llm.calls, []
+        for query, _, _ in LABELLED:
+            start = time.perf_counter()
+            NLU_classification(query)
+            seconds.append(time.perf_counter() - start)
+        print(f"{'fast path' if enabled else 'LLM only':<10} {llm.calls - calls:10d} {_percentiles(seconds)} "
+              f"{statistics.mean(seconds) * 1000:9.2f}")
+
+
+if __name__ == '__main__':
+    main(*(float(a) for a in sys.argv[1:2]))
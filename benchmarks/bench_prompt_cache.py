@@ -0,0 +1,79 @@
+"""Prompt tokens eligible for the provider's prefix cache: variable-first vs. static-first prompts.
+
+Replays the follow-up conversation of bench_understand, opened by a different
+employee in each session, through HrTalk.chat_with_follow_up. FakeChatModel
+(prefix_cache=True) reports as cached the longest prefix each prompt shares with
+an earlier one (>= 1024 tokens, steps of 128, as Azure OpenAI does). "variable first" rebuilds the NLU, understand,
+refine and data_chain prompts with the per-request content ahead of the static
+instructions, as the prompts were before; "static first" is the current layout.
+The data_chain column is what cost_detail_list reported.
+
+Usage: python -m benchmarks.bench_prompt_cache [sessions]
+"""
+import sys
+import tempfile
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.services import chains, clients
+from benchmarks._fakes import FakeChatModel
+
+CONVERSATION = ["我剛生小孩可以請什麼假", "那薪水照給嗎", "育嬰留停要多久前申請", "期間的勞健保怎麼辦", "可以提早復職嗎"]
+ROLES = ["業務部的專員", "資訊部的工程師", "財務部的主管", "客服中心的組長", "人資部的新人", "行銷部的經理"]
+# The registered (static-first) builders while the variable-first ones are installed.
+_original = {}
+
+
+def _variable_first(name: str):
+    def build(llm):
+        prompt, *rest = _original[name](llm).steps
+        system, human = prompt.messages
+        chain = ChatPromptTemplate.from_messages([("human", human.prompt.template), system])
+        for step in rest:
+            chain = chain | step
+        return chain
+    return build
+
+
+def _install(layout: str):
+    from app.services import NLU, llm  # noqa: F401  (registers the chains)
+
+    for name in ('nlu', 'understand', 'refine', 'data'):
+        if layout == 'variable first':
+            _original[name] = chains.register(name, _variable_first(name))
+        elif name in _original:
+            chains.register(name, _original.pop(name))
+
+
+def main(sessions: int = 4):
+    from config import AnswerCacheConfig
+
+    AnswerCacheConfig.enabled = False
+    from app.services.llm import HrTalk
+    from benchmarks._corpus import build_load_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = build_load_data(tmp)
+        print(f"{sessions} sessions x {len(CONVERSATION)} turns\n")
+        print(f"{'layout':<16} {'prompt tokens':>14} {'cached':>8} {'share':>6} {'data_chain cached':>18}")
+        for layout in ('variable first', 'static first'):
+            llm = FakeChatModel(prefix_cache=True)
+            clients.set_chat_llm(llm)
+            _install(layout)
+            data_cached = 0
+            for session in range(sessions):
+                talk = HrTalk(load_data)
+                # Sessions differ from the first message on, as real ones do.
+                for turn, message in enumerate(CONVERSATION):
+                    if turn == 0:
+                        message = f"我是{ROLES[session % len(ROLES)]}，{message}"
+                    _, cost_detail_list = talk.chat_with_follow_up(
+                        {'message': message, 'current_conversation_id': f'bench-{session}'})
+                    data_cached += sum(detail['usage']['prompt_tokens_details']['cached_tokens']
+                                       for detail in cost_detail_list)
+            print(f"{layout:<16} {llm.prompt_tokens:14d} {llm.cached_tokens:8d} "
+                  f"{llm.cached_tokens / llm.prompt_tokens:6.0%} {data_cached:18d}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,58 @@
+"""Cross-encoder reranking: retrieval latency vs. data_chain prompt tokens.
+
+Without reranking, k=8 chunks go to data_chain; with it, RerankConfig.candidates
+are scored by the cross-encoder and RerankConfig.top_k are kept. FakeCrossEncoder
+stands in for the sentence-transformers model (no torch here) with a simulated
+per-pair CPU cost. The query set is run twice to show the (query, chunk) score cache.
+
+Usage: python -m benchmarks.bench_rerank [n_chunks] [per_pair_ms]
+"""
+import sys
+import time
+import tempfile
+import statistics
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel, FakeCrossEncoder
+from app.utils.reranker import CrossEncoderReranker
+
+
+def _run(talk, queries):
+    retrieval, tokens = [], []
+    for query in queries:
+        talk.chain_memories.clear()
+        talk.analyze_chain(query, None, 'bench', timings=talk.last_timings)
+        retrieval.append(talk.last_timings['retrieval'])
+        tokens.append(talk.last_prompt_tokens['data_chain'])
+    return statistics.mean(retrieval), statistics.mean(tokens)
+
+
+def main(n_chunks: int = 3000, per_pair_ms: float = 1.0):
+    clients.set_chat_llm(FakeChatModel())
+    encoder = FakeCrossEncoder(per_pair_latency=per_pair_ms / 1000)
+    reranker = CrossEncoderReranker('fake', model=encoder)
+    clients.set_reranker(reranker)
+    from app.services.llm import HrTalk
+    from benchmarks._corpus import QUERIES, build_load_data
+    from config import RerankConfig, RetrievalConfig
+
+    RetrievalConfig.nlu_filters = False
+    with tempfile.TemporaryDirectory() as tmp:
+        talk = HrTalk(build_load_data(tmp, n_chunks=n_chunks))
+        print(f"{n_chunks} chunks, {len(QUERIES)} queries, {per_pair_ms} ms per scored pair\n")
+
+        rows = []
+        RerankConfig.enabled = False
+        rows.append(("k=8, no rerank", *_run(talk, QUERIES)))
+        RerankConfig.enabled = True
+        rows.append((f"rerank {RerankConfig.candidates}->{RerankConfig.top_k}", *_run(talk, QUERIES)))
+        rows.append(("rerank, cached", *_run(talk, QUERIES)))
+
+        print(f"{'':<18} {'retrieval ms':>12} {'prompt tokens':>14}")
+        for name, retrieval, tokens in rows:
+            print(f"{name:<18} {retrieval * 1000:12.1f} {tokens:14.0f}")
+        print(f"\nreranker: {reranker.stats()}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]), *(float(a) for a in sys.argv[2:3]))
@@ -0,0 +1,52 @@
+"""Per-query latency: rebuilding the index from SQLite on every query vs. the resident index.
+
+Usage: python -m benchmarks.bench_resident_index [n_chunks] [n_queries]
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+
+from app.utils.load_data import LoadHRdata
+
+
+def _report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<24} mean {statistics.mean(samples) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms")
+
+
+def main(n_chunks: int = 3000, n_queries: int = 50):
+    embeddings = DeterministicFakeEmbedding(size=1536)
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = LoadHRdata(data_dir=tmp, db_path=os.path.join(tmp, 'bench.db'), embeddings=embeddings)
+        docs = [Document(page_content=f"第{i}條 員工請假規定 範例內容 {i}" * 20, metadata={'source': 'bench.pdf'})
+                for i in range(n_chunks)]
+        load_data.chunk_store.replace_file('bench.pdf', 'hash', docs,
+                                           embeddings.embed_documents([d.page_content for d in docs]))
+
+        queries = [f"請假 {i}" for i in range(n_queries)]
+
+        before = []
+        for q in queries:
+            start = time.perf_counter()
+            load_data.get_vector_store().max_marginal_relevance_search(q, k=8, fetch_k=20)
+            before.append(time.perf_counter() - start)
+
+        after = []
+        for q in queries:
+            start = time.perf_counter()
+            load_data.max_marginal_relevance_search(q, k=8, fetch_k=20)
+            after.append(time.perf_counter() - start)
+
+        print(f"{n_chunks} chunks, {n_queries} queries")
+        _report("load per query", before)
+        _report("resident index", after)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,88 @@
+"""Retrieval with and without NLU tag pre-filters, over a recorded query set.
+
+Each query comes with the NLU classification it was recorded with, so the run needs
+no NLU call. For every query the unfiltered and the filtered retrieval are timed,
+and data_chain is run through HrTalk with FakeChatModel to count the prompt tokens
+each sends to GPT-4o. Reports candidate set size, chunks in the prompt, retrieval
+latency and data_chain prompt tokens.
+
+Usage: python -m benchmarks.bench_retrieval_filters [n_chunks] [repeats]
+"""
+import sys
+import time
+import tempfile
+import statistics
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+from app.utils.utils import EntityType as E, HRIntentCategory as I
+
+RECORDED = [
+    ("產假有幾天", I.QUERY_POLICY, [E.TIME_LEAVE]),
+    ("第8條 產假", I.QUERY_POLICY, [E.TIME_LEAVE, E.COMPLIANCE_POLICY]),
+    ("勞基法 加班費怎麼算", I.QUERY_POLICY, [E.TIME_OVERTIME, E.COMPLIANCE_REGULATION]),
+    ("出差津貼可以報支哪些", I.QUERY_INFORMATION, [E.COMPENSATION_ALLOWANCE]),
+    ("育嬰留停怎麼申請", I.PROCESS_INITIATE, [E.TIME_LEAVE]),
+    ("性別平等工作法 第12條", I.QUERY_POLICY, [E.COMPLIANCE_REGULATION]),
+    ("年終獎金怎麼發", I.QUERY_INFORMATION, [E.COMPENSATION_BONUS, E.PERFORMANCE_REVIEW]),
+    ("離職要提前多久", I.PROCESS_INITIATE, [E.OFFBOARDING_RESIGNATION]),
+    ("健康檢查費用", I.QUERY_INFORMATION, [E.HEALTH_SAFETY_WELLNESS, E.COMPENSATION_BENEFITS]),
+    ("性騷擾申訴流程", I.PROCESS_INITIATE, [E.EMPLOYEE_RELATIONS_CONFLICT]),
+]
+
+
+def _nlu(intent, entity_types):
+    from app.services.NLU import Entity, NLUOutput
+    return NLUOutput(intent=intent, entities=[Entity(value=t.value, types=[t]) for t in entity_types], keywords=[])
+
+
+def main(n_chunks: int = 3000, repeats: int = 20):
+    clients.set_chat_llm(FakeChatModel())
+    from app.services.llm import HrTalk
+    from benchmarks._corpus import build_load_data
+    from config import RetrievalConfig
+
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = build_load_data(tmp, n_chunks=n_chunks)
+        talk = HrTalk(load_data)
+        print(f"{n_chunks} chunks, {len(load_data.tag_index)} tags, {len(RECORDED)} recorded queries\n")
+        print(f"{'query':<14} {'candidates':>10} {'chunks':>7} {'retrieval ms':>17} {'prompt tokens':>15}")
+        print(f"{'':<14} {'':>10} {'':>7} {'all':>8} {'filt':>8} {'all':>7} {'filt':>7}")
+
+        totals = {'all': [], 'filtered': [], 'tokens_all': 0, 'tokens_filtered': 0}
+        for query, intent, entity_types in RECORDED:
+            nlu_output = _nlu(intent, entity_types)
+            embedding = load_data.embed_query(query)
+            tag_groups = HrTalk._tag_groups(query, nlu_output)
+            allowed = load_data.filter_candidates(tag_groups)
+
+            row = {}
+            for name, groups in (('all', ()), ('filtered', tag_groups)):
+                samples = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    docs = load_data.retrieve(query, embedding, k=8, tag_groups=groups)
+                    samples.append(time.perf_counter() - start)
+                row[name] = (statistics.median(samples), len(docs))
+                totals[name].append(row[name][0])
+
+                RetrievalConfig.nlu_filters = name == 'filtered'
+                talk.chain_memories.clear()
+                talk.analyze_chain(query, nlu_output, 'bench')
+                row['tokens_' + name] = talk.last_prompt_tokens['data_chain']
+                totals['tokens_' + name] += row['tokens_' + name]
+            RetrievalConfig.nlu_filters = True
+
+            candidates = n_chunks if allowed is None else len(allowed)
+            print(f"{query[:12]:<14} {candidates:>10} {row['all'][1]:>3}->{row['filtered'][1]:<3} "
+                  f"{row['all'][0] * 1000:8.2f} {row['filtered'][0] * 1000:8.2f} "
+                  f"{row['tokens_all']:>7} {row['tokens_filtered']:>7}")
+
+        print(f"\nmean retrieval: {statistics.mean(totals['all']) * 1000:.2f} ms unfiltered, "
+              f"{statistics.mean(totals['filtered']) * 1000:.2f} ms filtered")
+        print(f"data_chain prompt tokens: {totals['tokens_all']} unfiltered, {totals['tokens_filtered']} filtered "
+              f"({1 - totals['tokens_filtered'] / totals['tokens_all']:.0%} fewer)")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,84 @@
+"""Throughput of sensitive-term screening over a large lexicon.
+
+Builds a synthetic lexicon of ``n_terms`` 2-5 character CJK terms, each with a
+variant, plus the built-in terms, and screens a set of HR questions of 10-60
+characters, about one in ten containing a lexicon term. Compares a linear
+``term in text`` scan over every form (what a growing sensitive_word_set check
+amounts to on the raw input) with SensitiveTermFilter on the pure-Python automaton
+and, when installed, on pyahocorasick. Matching there includes normalisation and
+separator skipping.
+
+Usage: python -m benchmarks.bench_sensitive_terms [n_terms] [n_queries]
+"""
+import random
+import sys
+import time
+
+from app.utils import sensitive_terms
+from app.utils.sensitive_terms import BLOCK, DEFAULT_LEXICON, REWRITE, SensitiveTermFilter, _Automaton
+
+QUESTIONS = ["特休有幾天", "加班費怎麼算", "我剛生小孩可以請什麼假", "被主管性騷擾怎麼申訴",
+             "育嬰留職停薪期間的勞健保要自己付嗎", "如果我在試用期內離職，需要提前多久告知公司？",
+             "主管要求我假日加班但不給加班費，這樣合法嗎", "我想了解一下今年的績效考核標準跟去年有什麼不同"]
+
+
+def _lexicon(n_terms: int, rng: random.Random):
+    entries = list(DEFAULT_LEXICON)
+    for i in range(n_terms):
+        term = ''.join(chr(rng.randint(0x4e00, 0x9fa5)) for _ in range(rng.randint(2, 5)))
+        variant = term[:-1] + chr(rng.randint(0x4e00, 0x9fa5))
+        if i % 2:
+            entries.append({'term': term, 'action': REWRITE, 'replacement': '某行為', 'variants': [variant]})
+        else:
+            entries.append({'term': term, 'action': BLOCK, 'variants': [variant]})
+    return entries
+
+
+def _queries(entries, n_queries: int, rng: random.Random):
+    queries = []
+    for i in range(n_queries):
+        query = rng.choice(QUESTIONS)
+        if i % 10 == 0:
+            query = query[:3] + rng.choice(entries)['term'] + query[3:]
+        queries.append(query)
+    return queries
+
+
+def _timed(label, build, screen, queries):
+    start = time.perf_counter()
+    screener = build()
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    found = sum(1 for query in queries if screen(screener, query))
+    seconds = time.perf_counter() - start
+    print(f"{label:<22} {build_seconds:8.2f} {seconds / len(queries) * 1e6:10.1f} {len(queries) / seconds:12.0f} {found:6d}")
+
+
+def main(n_terms: int = 10000, n_queries: int = 20000):
+    rng = random.Random(0)
+    entries = _lexicon(n_terms, rng)
+    queries = _queries(entries, n_queries, rng)
+    forms = [form for entry in entries for form in (entry['term'], *entry.get('variants', ()))]
+    print(f"{len(entries)} lexicon entries ({len(forms)} forms), {n_queries} queries\n")
+    print(f"{'engine':<22} {'build s':>8} {'us/query':>10} {'queries/s':>12} {'hits':>6}")
+    _timed("linear substring scan", lambda: forms,
+           lambda forms, query: [form for form in forms if form in query], queries)
+
+    new_automaton = sensitive_terms._new_automaton
+    try:
+        sensitive_terms._new_automaton = _Automaton
+        _timed("aho-corasick (python)", lambda: SensitiveTermFilter(entries),
+               lambda screener, query: screener.screen(query)[1], queries)
+    finally:
+        sensitive_terms._new_automaton = new_automaton
+    try:
+        import ahocorasick  # noqa: F401
+    except ImportError:
+        print("pyahocorasick not installed; skipped")
+    else:
+        _timed("aho-corasick (C)", lambda: SensitiveTermFilter(entries),
+               lambda screener, query: screener.screen(query)[1], queries)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,54 @@
+"""Cost of starting a conversation: per-session clients and chains vs. the shared registry.
+
+No network is used; constructing the clients is what is being measured.
+
+Usage: python -m benchmarks.bench_session_start [n_sessions]
+"""
+import sys
+import time
+
+from langchain.chains import ConversationChain
+from langchain.memory import ConversationBufferMemory
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.runnables import RunnablePassthrough
+
+from app.services import chains
+from app.services.llm import HrTalk
+from config import OpenaiConfig
+from app.utils.prompts import initial_data_chain_prompt, refine_query_prompt, refine_query_input
+
+
+def _per_session():
+    # What HrTalk.__init__ used to do for every session.
+    llm = OpenaiConfig.initail_azurechatai_gpt4o.__wrapped__()
+    data_chain = ChatPromptTemplate.from_messages([
+        ("system", initial_data_chain_prompt), ("human", "{text}")
+    ]) | llm | RunnablePassthrough()
+    memory = ConversationBufferMemory(input_key="input", return_messages=True)
+    chain = ConversationChain(
+        llm=llm, memory=memory, input_key='input', output_key="output",
+        prompt=PromptTemplate(input_variables=["history", "input"], template=refine_query_prompt + refine_query_input),
+    )
+    return llm, data_chain, chain
+
+
+def _timed(factory, n):
+    start = time.perf_counter()
+    objects = [factory() for _ in range(n)]
+    return (time.perf_counter() - start) / n, objects
+
+
+def main(n_sessions: int = 200):
+    chains.get('data'), chains.get('refine')  # built once per process, e.g. by the first request
+
+    before, _ = _timed(_per_session, n_sessions)
+    after, talks = _timed(lambda: HrTalk(load_data=None), n_sessions)
+
+    http_clients = {id(talk.llm.root_client._client) for talk in talks}
+    print(f"{n_sessions} sessions")
+    print(f"per-session clients  {before * 1e6:10.1f} us/session")
+    print(f"shared registry      {after * 1e6:10.1f} us/session  ({len(http_clients)} distinct HTTP pool)")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,77 @@
+"""Per-turn session load/save overhead for each SessionStore backend.
+
+Replays ``turns`` turns for ``sessions`` interleaved sessions through
+ConversationManager.load_session / _save_session, with the LLM part of a turn replaced
+by writing a canned answer into the memories, so only the store round trip, the
+(de)serialization and HrTalk construction are timed. Redis is included when the
+redis package is installed and a server answers at SessionStoreConfig.redis_url.
+
+Usage: python -m benchmarks.bench_session_store [sessions] [turns]
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+from app.services import clients
+from benchmarks._fakes import FAKE_ANSWER, FAKE_NLU_RESPONSE, FakeChatModel
+
+
+def _stores(tmp):
+    from config import SessionStoreConfig
+    from app.services.session_store import MemorySessionStore, RedisSessionStore, SQLiteSessionStore
+
+    yield 'memory', MemorySessionStore()
+    yield 'sqlite', SQLiteSessionStore(os.path.join(tmp, 'sessions.db'))
+    try:
+        store = RedisSessionStore(SessionStoreConfig.redis_url, key_prefix='hr:bench:')
+        store._redis.ping()
+    except Exception as e:
+        print(f"redis       skipped ({e.__class__.__name__})")
+        return
+    yield 'redis', store
+
+
+def main(sessions: int = 50, turns: int = 10):
+    clients.set_chat_llm(FakeChatModel())
+
+    from app.services.NLU import NLUOutput
+    from app.services.conversation_manager import ConversationManager
+    from benchmarks._corpus import QUERIES, build_load_data
+
+    nlu_output = NLUOutput.model_validate_json(FAKE_NLU_RESPONSE)
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = build_load_data(tmp, n_chunks=60)
+        for name, store in _stores(tmp):
+            manager = ConversationManager(load_data, session_store=store)
+            loads, saves = [], []
+            for turn in range(turns):
+                for s in range(sessions):
+                    session_id = f"bench-{s}"
+                    start = time.perf_counter()
+                    talk = manager.load_session(session_id)
+                    loads.append(time.perf_counter() - start)
+
+                    query = QUERIES[(s + turn) % len(QUERIES)]
+                    talk._start_turn({'message': query, 'current_conversation_id': session_id})
+                    talk.chain_memories.save_context({"input": query}, {"output": FAKE_ANSWER})
+                    talk.nlu_memory.save(query, FAKE_NLU_RESPONSE)
+                    talk._record_turn(query, FAKE_ANSWER, nlu_output)
+
+                    start = time.perf_counter()
+                    manager._save_session(session_id, talk)
+                    saves.append(time.perf_counter() - start)
+                    talk.chain_memories.wait_for_summary()
+            size = len(store.load("bench-0"))
+            print(f"{name:<11} load p50 {statistics.median(loads) * 1000:.2f}ms  "
+                  f"p99 {statistics.quantiles(loads, n=100)[98] * 1000:.2f}ms  "
+                  f"save p50 {statistics.median(saves) * 1000:.2f}ms  "
+                  f"p99 {statistics.quantiles(saves, n=100)[98] * 1000:.2f}ms  "
+                  f"state after {turns} turns {size / 1024:.1f} KiB")
+            for s in range(sessions):
+                store.delete(f"bench-{s}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,66 @@
+"""Time to first token: /api/chat/hr vs. /api/chat/hr/stream.
+
+Drives both routes through Flask's test client against FakeChatModel, which waits
+``latency`` before its first token and ``token_latency`` between tokens. For the
+blocking route the first byte arrives with the whole answer.
+
+Usage: python -m benchmarks.bench_streaming_ttft [llm_latency_seconds] [token_latency_seconds] [turns]
+"""
+import sys
+import json
+import time
+import tempfile
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+
+
+def _post(client, path, body):
+    start = time.perf_counter()
+    response = client.post(path, json=body, buffered=False)
+    first = None
+    payload = b""
+    for chunk in response.response:
+        if first is None and chunk:
+            first = time.perf_counter() - start
+        payload += chunk
+    response.close()
+    return first, time.perf_counter() - start, payload.decode("utf-8")
+
+
+def main(latency: float = 0.5, token_latency: float = 0.02, turns: int = 4):
+    clients.set_chat_llm(FakeChatModel(latency=latency, token_latency=token_latency))
+
+    from flask import Flask
+    from app.routes import chat_routes
+    from app.services.conversation_manager import ConversationManager
+    from app.services.session_store import MemorySessionStore
+    from config import AnswerCacheConfig
+    from benchmarks._corpus import QUERIES, build_load_data
+
+    # Every query is asked once per route; keep the answer cache from serving the second.
+    AnswerCacheConfig.enabled = False
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.conversation_manager = ConversationManager(build_load_data(tmp), session_store=MemorySessionStore())
+        app.register_blueprint(chat_routes.bp)
+        client = app.test_client()
+
+        for path in ('/api/chat/hr', '/api/chat/hr/stream'):
+            session_id = f"bench{path}"
+            firsts, totals = [], []
+            for i in range(turns):
+                body = {'conversation_id': session_id, 'message': QUERIES[i % len(QUERIES)]}
+                first, total, payload = _post(client, path, body)
+                firsts.append(first)
+                totals.append(total)
+            if path.endswith('/stream'):
+                done = payload.rsplit("event: done\ndata: ", 1)[1]
+                print(f"  last done event cost_detail_list: {json.loads(done)['cost_detail_list']}")
+                history = app.conversation_manager.load_session(session_id).chain_memories
+                print(f"  turns saved to chain_memories: {len(history._turns) + len(history._pending)}")
+            print(f"{path:<20} first byte {sum(firsts) / turns:.3f}s  full answer {sum(totals) / turns:.3f}s")
+
+
+if __name__ == '__main__':
+    main(*(float(a) for a in sys.argv[1:3]), *(int(a) for a in sys.argv[3:4]))
@@ -0,0 +1,42 @@
+"""Turn latency with NLU run before vs. alongside refinement and retrieval.
+
+Uses FakeChatModel (fixed latency per call) and FakeEmbeddings, so the difference
+is purely how the three LLM round trips are scheduled.
+
+Usage: python -m benchmarks.bench_turn_latency [llm_latency_seconds] [turns]
+"""
+import sys
+import tempfile
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+
+
+def main(latency: float = 0.5, turns: int = 4):
+    clients.set_chat_llm(FakeChatModel(latency=latency))
+
+    from config import AnswerCacheConfig, ChatConfig, NLUFastPathConfig
+    from app.services.llm import HrTalk
+    from benchmarks._corpus import QUERIES, build_load_data
+
+    # Every turn makes the same three LLM round trips (NLU, refine, answer): no merged
+    # understand call on follow-ups, no local NLU and no cached answers.
+    ChatConfig.combined_understand = False
+    NLUFastPathConfig.enabled = False
+    AnswerCacheConfig.enabled = False
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = build_load_data(tmp)
+        for concurrent in (False, True):
+            ChatConfig.concurrent_nlu = concurrent
+            talk = HrTalk(load_data)
+            totals = []
+            for i in range(turns):
+                talk.chat_with_follow_up({'message': QUERIES[i % len(QUERIES)], 'current_conversation_id': 'bench'})
+                totals.append(talk.last_timings)
+            mode = "concurrent" if concurrent else "sequential"
+            breakdown = {name: sum(t.get(name, 0.0) for t in totals) / turns for name in totals[-1]}
+            print(f"{mode:<11} " + "  ".join(f"{name} {seconds:.3f}s" for name, seconds in breakdown.items()))
+
+
+if __name__ == '__main__':
+    main(*(float(a) for a in sys.argv[1:2]), *(int(a) for a in sys.argv[2:3]))
@@ -0,0 +1,49 @@
+"""LLM round trips and prompt tokens per turn: separate NLU + refine calls vs. one understand call.
+
+Replays a recorded follow-up conversation through HrTalk.chat_with_follow_up with
+FakeChatModel answering every prompt with its recorded reply (NLU JSON, refined
+query, understand JSON, answer) after ``latency`` seconds. The fake counts the calls
+and prompt tokens it receives from every thread, so the NLU call running beside
+retrieval is included. The first turn has no history and runs the same in both modes.
+
+Usage: python -m benchmarks.bench_understand [llm_latency_seconds]
+"""
+import sys
+import tempfile
+import statistics
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+
+CONVERSATION = ["我剛生小孩可以請什麼假", "那薪水照給嗎", "育嬰留停要多久前申請", "期間的勞健保怎麼辦", "可以提早復職嗎"]
+
+
+def main(latency: float = 0.5):
+    llm = FakeChatModel(latency=latency)
+    clients.set_chat_llm(llm)
+    from app.services.llm import HrTalk
+    from benchmarks._corpus import build_load_data
+    from config import AnswerCacheConfig, ChatConfig
+
+    AnswerCacheConfig.enabled = False
+    with tempfile.TemporaryDirectory() as tmp:
+        load_data = build_load_data(tmp)
+        print(f"{len(CONVERSATION)}-turn conversation, {latency}s per LLM call; follow-up turns (2..n) averaged\n")
+        print(f"{'mode':<10} {'LLM calls':>10} {'prompt tokens':>14} {'turn s':>8}")
+        for combined in (False, True):
+            ChatConfig.combined_understand = combined
+            talk = HrTalk(load_data)
+            calls, tokens, seconds = [], [], []
+            for message in CONVERSATION:
+                before = (llm.calls, llm.prompt_tokens)
+                talk.chat_with_follow_up({'message': message, 'current_conversation_id': 'bench'})
+                calls.append(llm.calls - before[0])
+                tokens.append(llm.prompt_tokens - before[1])
+                seconds.append(talk.last_timings['total'])
+            mode = "combined" if combined else "separate"
+            print(f"{mode:<10} {statistics.mean(calls[1:]):10.1f} {statistics.mean(tokens[1:]):14.0f} "
+                  f"{statistics.mean(seconds[1:]):8.3f}")
+
+
+if __name__ == '__main__':
+    main(*(float(a) for a in sys.argv[1:2]))
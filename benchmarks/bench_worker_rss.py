@@ -0,0 +1,93 @@
+"""Memory of 8 gunicorn-style workers holding the index: private copies vs. memory-mapped files.
+
+A temp DB is filled with synthetic chunks and the index version is exported once.
+Then 8 processes are spawned, each like a worker running create_app: it loads the
+resident vector store, answers a few queries so the pages it needs are touched, and
+reports its memory while all 8 are alive. Modes are VectorStoreConfig.mmap False
+(index and docstore copied into every worker, as before) and True.
+
+RSS counts a shared page in every process that maps it, so the total over-counts
+mapped files; PSS splits each shared page between its processes and sums to the
+real footprint. Per worker, "grown" is the RSS growth over the worker before loading
+and "private" the part of it that is the worker's own (Private_Dirty), which
+includes per-process state besides the index such as jieba's dictionary.
+
+Usage: python -m benchmarks.bench_worker_rss [n_chunks] [workers] [index_type]
+"""
+import os
+import sys
+import tempfile
+import multiprocessing
+
+from langchain_core.documents import Document
+
+from benchmarks._corpus import QUERIES
+
+
+def _memory():
+    with open('/proc/self/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+    return {key: int(fields[key].split()[0]) / 1024 for key in ('Rss', 'Pss', 'Private_Dirty')}
+
+
+def _worker(directory, mmap, index_type, barrier, results):
+    from app.services import clients  # noqa: F401  (import order: app before config)
+    from benchmarks._fakes import FakeEmbeddings
+    from app.utils.load_data import LoadHRdata
+    from config import VectorStoreConfig
+
+    VectorStoreConfig.mmap = mmap
+    VectorStoreConfig.index_type = index_type
+    embeddings = FakeEmbeddings()
+    before = _memory()
+    load_data = LoadHRdata(data_dir=directory, db_path=os.path.join(directory, 'bench.db'), embeddings=embeddings)
+    load_data.set_resident_vector_store(load_data.get_vector_store())
+    for query in QUERIES:
+        load_data.retrieve(query, embeddings.embed_query(query), k=8)
+    barrier.wait()
+    after = _memory()
+    results.put((after['Rss'], after['Pss'], after['Rss'] - before['Rss'],
+                 after['Private_Dirty'] - before['Private_Dirty']))
+    barrier.wait()
+
+
+def _fill(directory, n_chunks, index_type):
+    from app.services import clients  # noqa: F401
+    from benchmarks._fakes import FakeEmbeddings
+    from app.utils.load_data import LoadHRdata
+    from benchmarks._corpus import synthetic_documents
+    from config import VectorStoreConfig
+
+    VectorStoreConfig.index_type = index_type
+    embeddings = FakeEmbeddings()
+    load_data = LoadHRdata(data_dir=directory, db_path=os.path.join(directory, 'bench.db'), embeddings=embeddings)
+    for name, docs in synthetic_documents(n_chunks).items():
+        # Longer texts, closer to the 1200-character chunks of pdf_loader.
+        docs = [Document(page_content=doc.page_content * 3, metadata=doc.metadata) for doc in docs]
+        load_data.chunk_store.replace_file(name, name, docs, embeddings.embed_documents([d.page_content for d in docs]))
+    # Export the version once, as pdf_loader does, so the workers only open it.
+    load_data.get_vector_store()
+
+
+def main(n_chunks: int = 10000, workers: int = 8, index_type: str = 'flat'):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        _fill(tmp, n_chunks, index_type)
+        print(f"{n_chunks} chunks, {workers} workers, index_type={index_type}\n")
+        print(f"{'mode':<10} {'RSS total MB':>13} {'PSS total MB':>13} {'grown MB/worker':>16} {'private':>8}")
+        for mmap in (False, True):
+            barrier, results = context.Barrier(workers), context.Queue()
+            processes = [context.Process(target=_worker, args=(tmp, mmap, index_type, barrier, results))
+                         for _ in range(workers)]
+            for process in processes:
+                process.start()
+            samples = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            rss, pss, grown, private = (sum(column) for column in zip(*samples))
+            print(f"{'mmap' if mmap else 'private':<10} {rss:13.0f} {pss:13.0f} {grown / workers:16.1f} "
+                  f"{private / workers:8.1f}")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]), *sys.argv[3:4])
@@ -0,0 +1,51 @@
+"""NLU prompt size over thousands of turns: one worker-global history vs. per-session NLUMemory.
+
+Prompt tokens are what FakeChatModel reports for the prompt it received.
+
+Usage: python -m benchmarks.load_nlu_prompt [turns] [sessions]
+"""
+import sys
+import time
+
+from langchain_community.callbacks import get_openai_callback
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+
+
+def _run(turns, sessions, memory_for):
+    from app.services.NLU import NLU_classification
+    from benchmarks._corpus import QUERIES
+
+    samples = {}
+    start = time.perf_counter()
+    for turn in range(1, turns + 1):
+        with get_openai_callback() as cb:
+            NLU_classification(QUERIES[turn % len(QUERIES)], memory=memory_for(turn % sessions))
+        if turn in (1, 10, 100, 1000) or turn == turns:
+            samples[turn] = cb.prompt_tokens
+    return samples, (time.perf_counter() - start) / turns
+
+
+def main(turns: int = 3000, sessions: int = 50):
+    clients.set_chat_llm(FakeChatModel())
+    from config import ChatConfig
+    from app.services.memory import NLUMemory
+
+    shared = NLUMemory(max_tokens=float('inf'))
+    per_session = {}
+
+    before, before_cost = _run(turns, sessions, lambda _: shared)
+    after, after_cost = _run(
+        turns, sessions,
+        lambda session: per_session.setdefault(session, NLUMemory(ChatConfig.nlu_history_tokens)))
+
+    print(f"{turns} turns over {sessions} sessions; NLU prompt tokens at turn N")
+    print(f"{'turn':>6} {'global memory':>15} {'per-session':>12}")
+    for turn in before:
+        print(f"{turn:>6} {before[turn]:>15} {after[turn]:>12}")
+    print(f"mean local overhead per turn: global {before_cost * 1000:.2f} ms, per-session {after_cost * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
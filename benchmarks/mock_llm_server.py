@@ -0,0 +1,72 @@
+"""Local stand-in for the Azure OpenAI chat completions endpoint.
+
+Answers POST /openai/deployments/<deployment>/chat/completions after ``latency``
+seconds with the same canned replies as FakeChatModel (NLU JSON, refined query,
+summary, answer), including usage, so the real AzureChatOpenAI client, its
+connection pool and the server under test are all exercised. Streaming requests
+get the reply as server-sent chunks.
+
+Usage: python -m benchmarks.mock_llm_server [port] [latency_seconds]
+"""
+import sys
+import json
+import time
+import asyncio
+
+from aiohttp import web
+
+from benchmarks._fakes import FakeChatModel
+
+_fake = FakeChatModel()
+
+
+def _completion(body, reply: str):
+    prompt_tokens = sum(len(str(message.get('content', ''))) for message in body.get('messages', []))
+    return {
+        'id': 'chatcmpl-mock',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': 'gpt-4o-2024-05-13',
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': reply}}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(reply),
+                  'total_tokens': prompt_tokens + len(reply)},
+    }
+
+
+def create_mock_app(latency: float = 0.5, token_latency: float = 0.0) -> web.Application:
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = "".join(str(message.get('content', '')) for message in body.get('messages', []))
+        reply = next((text for marker, text in _fake.replies.items() if marker in prompt), _fake.response)
+        request.app['requests'] += 1
+        await asyncio.sleep(latency)
+        if not body.get('stream'):
+            return web.json_response(_completion(body, reply))
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for i in range(0, len(reply), _fake.chunk_size):
+            await asyncio.sleep(token_latency)
+            chunk = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': 'gpt-4o-2024-05-13',
+                     'choices': [{'index': 0, 'delta': {'content': reply[i:i + _fake.chunk_size]},
+                                  'finish_reason': None}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({'requests': request.app['requests']})
+
+    app = web.Application()
+    app['requests'] = 0
+    app.router.add_post('/openai/deployments/{deployment}/chat/completions', chat_completions)
+    app.router.add_get('/stats', stats)
+    return app
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8900
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    web.run_app(create_mock_app(latency), host='127.0.0.1', port=port, print=None)
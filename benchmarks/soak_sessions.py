@@ -0,0 +1,70 @@
+"""Soak test: many sessions through one ConversationManager against a fake LLM.
+
+Every session asks ``turns`` questions through process_message (FakeChatModel with
+no latency, FakeEmbeddings, a SQLite session store in a temp dir). Worker RSS and
+SessionRegistry.stats() are printed every ``report_every`` sessions; with the
+registry bounded, RSS should level off once ``max_sessions`` is reached instead of
+growing with the number of sessions served.
+
+Usage: python -m benchmarks.soak_sessions [sessions] [turns] [max_sessions] [write_through 0|1]
+"""
+import os
+import sys
+import time
+import tempfile
+
+from app.services import clients
+from benchmarks._fakes import FakeChatModel
+
+
+def rss_mib() -> float:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(sessions: int = 100_000, turns: int = 2, max_sessions: int = 2000, write_through: int = 1):
+    clients.set_chat_llm(FakeChatModel())
+
+    from config import AnswerCacheConfig, SessionRegistryConfig
+    from app.services.conversation_manager import ConversationManager
+    from app.services.session_store import SQLiteSessionStore
+    from benchmarks._corpus import QUERIES, build_load_data
+
+    AnswerCacheConfig.enabled = False
+    SessionRegistryConfig.max_sessions = max_sessions
+    SessionRegistryConfig.write_through = bool(write_through)
+    report_every = max(1, sessions // 10)
+    # The per-turn prints in HrTalk would dominate the run.
+    devnull = open(os.devnull, 'w')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ConversationManager(build_load_data(tmp, n_chunks=120),
+                                      session_store=SQLiteSessionStore(os.path.join(tmp, 'sessions.db')))
+        start = time.perf_counter()
+        print(f"{'sessions':>9} {'elapsed':>8} {'rss MiB':>8} {'live':>6} {'bytes/session':>13} "
+              f"{'evicted':>8} {'spilled':>8} {'stored':>8}")
+        for i in range(sessions):
+            session_id = f"soak-{i}"
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                for turn in range(turns):
+                    manager.process_message(session_id, QUERIES[(i + turn) % len(QUERIES)])
+            finally:
+                sys.stdout = stdout
+            if (i + 1) % report_every == 0:
+                stats = manager.session_stats()
+                print(f"{i + 1:>9} {time.perf_counter() - start:>7.0f}s {rss_mib():>8.1f} {stats['live_sessions']:>6} "
+                      f"{stats['approx_bytes_per_session']:>13} {stats['evicted']:>8} {stats['spilled']:>8} "
+                      f"{manager.session_store.count():>8}")
+        manager.registry.flush()
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:5]))
@@ -2,12 +2,16 @@ import os
 
 import openai
 from openai import AzureOpenAI
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, AsyncAzureOpenAI
 
 from langchain_openai import AzureChatOpenAI  
 from langchain_openai.embeddings.azure import AzureOpenAIEmbeddings
 
 from app.utils.utils import measure_time
+from app.utils.embedding_cache import CachedEmbeddings
+from app.utils.local_embeddings import LocalEmbeddings
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hr_data.db')
 
 class OpenaiConfig:
     token="bc0865881852423cbf3534b07401b39b"
@@ -39,7 +43,8 @@ class OpenaiConfig:
     
     @staticmethod
     @measure_time
-    def initail_azurechatai_gpt4o(temperature=0):
+    def initail_azurechatai_gpt4o(temperature=0, http_client=None, http_async_client=None, async_client=None):
+        # Prefer app.services.clients.get_chat_llm(), which shares one pooled client per process.
         os.environ["AZURE_OPENAI_ENDPOINT"] = OpenaiConfig.endpoint
         os.environ["AZURE_OPENAI_API_KEY"] = OpenaiConfig.token
         return AzureChatOpenAI(  
@@ -47,27 +52,259 @@ class OpenaiConfig:
             api_version="2024-05-01-preview",  
             model="gpt-4o",  
             model_version="2024-05-13",
-            temperature=temperature
+            temperature=temperature,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            # ainvoke goes through this client when given (see initial_openai_client)
+            async_client=async_client.chat.completions if async_client is not None else None
         )
     
     @staticmethod
     @measure_time
-    def initail_azureopenai_embeddings():
-        return AzureOpenAIEmbeddings(
+    def initail_azureopenai_embeddings(db_path: str = DEFAULT_DB_PATH, http_client=None, http_async_client=None):
+        embeddings = AzureOpenAIEmbeddings(
             deployment="embeddings",
             model="text-embedding-ada-002",
             azure_endpoint=OpenaiConfig.endpoint,
             openai_api_type="azure",
-            openai_api_key=OpenaiConfig.token
+            openai_api_key=OpenaiConfig.token,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
+        return CachedEmbeddings(embeddings, db_path, lru_size=EmbeddingCacheConfig.lru_size)
     
     @staticmethod
     @measure_time
-    def initial_openai_client():
-        client = AsyncOpenAI(
-            # This is the default and can be omitted
+    def initial_openai_client(http_client=None):
+        # AsyncAzureOpenAI is the AsyncOpenAI client for the Azure deployment (deployment
+        # path and api-key header); the asyncio app runs the chat model's ainvoke on it.
+        client = AsyncAzureOpenAI(
             api_key = OpenaiConfig.token,
-            base_url = OpenaiConfig.endpoint,
+            azure_endpoint = OpenaiConfig.endpoint,
+            azure_deployment = "gpt4o",
+            api_version = "2024-05-01-preview",
+            http_client = http_client,
             timeout = 3000
         )
-        return client
\ No newline at end of file
+        return client
+
+class VectorStoreConfig:
+    # Seconds between checks of the index version stamp in hr_data.db;
+    # the resident FAISS index is reloaded only when the stamp changes.
+    version_check_interval = 5.0
+    # FAISS index type (see app/utils/faiss_index.py): 'flat' is exact; 'ivf_flat' and
+    # 'hnsw' are approximate; 'ivf_pq' and 'ivf_sq8' are approximate and compressed
+    # (96 and 1536 bytes per vector instead of 6 KB). pdf_loader trains the index once
+    # per index version and exports it for the other workers (see mmap below).
+    index_type = os.getenv('VECTOR_INDEX_TYPE', 'flat')
+    # Below this many chunks every type falls back to flat.
+    min_points = 2000
+    # IVF: clusters (None: 4 * sqrt(n)) and clusters probed per query.
+    nlist = None
+    nprobe = 16
+    # HNSW: links per node and candidate list sizes at build and at query time.
+    hnsw_m = 32
+    ef_construction = 200
+    ef_search = 128
+    # PQ: sub-quantizers (None: dim / 16) and bits per code.
+    pq_m = None
+    pq_nbits = 8
+    max_train_points = 100_000
+    # Workers memory-map the index file and the chunk texts exported per version to
+    # hr_data_index/, so all of them share one copy in the page cache; False copies
+    # both into each worker.
+    mmap = True
+
+    @staticmethod
+    def index_options() -> dict:
+        return {
+            'index_type': VectorStoreConfig.index_type, 'min_points': VectorStoreConfig.min_points,
+            'nlist': VectorStoreConfig.nlist, 'nprobe': VectorStoreConfig.nprobe,
+            'hnsw_m': VectorStoreConfig.hnsw_m, 'ef_construction': VectorStoreConfig.ef_construction,
+            'ef_search': VectorStoreConfig.ef_search, 'pq_m': VectorStoreConfig.pq_m,
+            'pq_nbits': VectorStoreConfig.pq_nbits, 'max_train_points': VectorStoreConfig.max_train_points,
+            'mmap': VectorStoreConfig.mmap,
+        }
+
+
+class RetrievalConfig:
+    # Fuse BM25 over jieba terms with FAISS similarity by reciprocal rank fusion;
+    # False keeps the previous MMR-only retrieval.
+    hybrid = True
+    # Candidates taken from each ranking before fusion, and the RRF constant.
+    candidates = 20
+    rrf_k = 60
+    bm25_k1 = 1.5
+    bm25_b = 0.75
+    # Queries this short whose terms all occur together in some chunk (e.g. "婚假",
+    # "第8條 產假") are answered from BM25 alone, without an embedding call.
+    keyword_query_max_chars = 8
+    # Pre-filter candidates by chunk tags derived from the NLU intent/entities and
+    # any article number in the query (see app/utils/chunk_tags.py). Retrieval waits
+    # at most nlu_filter_wait seconds for a concurrently running NLU call, then
+    # filters on what it has. A tag group that would leave fewer than
+    # filter_min_candidates chunks is dropped; a filtered search returns at most
+    # filtered_k chunks.
+    nlu_filters = True
+    nlu_filter_wait = 0.5
+    filter_min_candidates = 3
+    filtered_k = 5
+
+
+class RerankConfig:
+    # Rerank a wide candidate set with a local CPU cross-encoder and send only the
+    # best top_k chunks to data_chain. Needs sentence-transformers and torch (see
+    # req.txt) and the model in the image or the Hugging Face cache.
+    enabled = os.getenv('RERANK_ENABLED', '0') == '1'
+    model_name = os.getenv('RERANK_MODEL', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+    candidates = 50
+    top_k = 4
+    max_length = 256
+    batch_size = 16
+    # torch intra-op threads, and batches scored at once per worker process.
+    max_threads = 2
+    max_concurrent = 1
+    # (query, chunk) scores kept in memory.
+    cache_size = 8192
+
+
+class IngestConfig:
+    # Worker processes for PDF/CSV parsing and splitting (0 parses in-process).
+    parse_workers = min(4, os.cpu_count() or 1)
+    # Chunks per embedding request, concurrent embedding requests, and how many
+    # batches may wait in the queue before parsing is throttled.
+    embed_batch_size = 64
+    embed_concurrency = 4
+    queue_size = 8
+    # Retries per batch, with exponential backoff starting at backoff_base seconds.
+    max_retries = 5
+    backoff_base = 1.0
+
+
+class EmbeddingConfig:
+    # 'azure' (text-embedding-ada-002) or 'local' (sentence-transformers on CPU; needs
+    # torch, see req.txt). The index is tagged with the model, and switching drops
+    # the chunks so pdf_loader re-embeds every file with the new one.
+    provider = os.getenv('EMBEDDING_PROVIDER', 'azure')
+    local_model = os.getenv('LOCAL_EMBEDDING_MODEL', 'BAAI/bge-small-zh-v1.5')
+    # 'torch' or 'onnx' (sentence-transformers >= 3.2 and onnxruntime); quantize 'int8' or unset.
+    local_backend = os.getenv('LOCAL_EMBEDDING_BACKEND', 'torch')
+    local_quantize = os.getenv('LOCAL_EMBEDDING_QUANTIZE') or None
+    local_batch_size = 32
+    # Encoding threads for ingest batches, and torch intra-op threads each.
+    local_workers = 2
+    local_max_threads = 4
+
+    @staticmethod
+    @measure_time
+    def initial_local_embeddings(db_path: str = DEFAULT_DB_PATH):
+        embeddings = LocalEmbeddings(
+            EmbeddingConfig.local_model,
+            backend=EmbeddingConfig.local_backend,
+            quantize=EmbeddingConfig.local_quantize,
+            batch_size=EmbeddingConfig.local_batch_size,
+            workers=EmbeddingConfig.local_workers,
+            max_threads=EmbeddingConfig.local_max_threads,
+        )
+        return CachedEmbeddings(embeddings, db_path, lru_size=EmbeddingCacheConfig.lru_size)
+
+
+class EmbeddingCacheConfig:
+    # Hot query/chunk vectors kept in memory in front of the embedding_cache table.
+    lru_size = 2048
+
+
+class AnswerCacheConfig:
+    # Serve a stored answer when the refined query's embedding is at least this
+    # cosine-similar to a cached one; entries also expire and are LRU-evicted.
+    enabled = True
+    similarity_threshold = 0.97
+    ttl_seconds = 6 * 3600
+    max_entries = 2000
+
+
+class ClientConfig:
+    # Connection pool shared by every LLM/embedding client in a worker process.
+    max_connections = 100
+    max_keepalive_connections = 20
+    keepalive_expiry = 60.0
+    timeout = 300.0
+
+
+class ChatConfig:
+    # Run NLU classification alongside query refinement and embedding instead of
+    # before them; retrieval only waits for it up to RetrievalConfig.nlu_filter_wait.
+    concurrent_nlu = True
+    # On turns with history, classify and refine the query in one JSON-mode call
+    # (NLU.understand) instead of separate NLU and refine calls: one request and
+    # one copy of the history less per turn, but the NLU fields are now generated
+    # before retrieval instead of alongside it. First turns have nothing to refine
+    # and keep the NLU call alongside retrieval.
+    combined_understand = True
+    # Thread pool size for background work when not running under gevent.
+    background_workers = 16
+    # Token budget for the per-session history injected into the NLU prompt.
+    nlu_history_tokens = 600
+    # Conversation history fed to query refinement and data_chain: a hard token
+    # budget, the last N turns verbatim, older turns folded into a rolling summary.
+    history_max_tokens = 2000
+    history_keep_turns = 3
+    history_summary_max_tokens = 400
+    # Retrieved chunks are merged, ordered csv > company rules > law and packed
+    # into at most this many tokens for data_chain; a block cut to fit must keep
+    # at least context_min_block_tokens or it is dropped.
+    context_max_tokens = 4000
+    context_min_block_tokens = 80
+
+
+class NLUFastPathConfig:
+    # Classify short keyword queries locally (app/utils/nlu_rules.py) and call the LLM
+    # only for the rest. Inputs longer than max_chars always go to the LLM, and so do
+    # results whose intent confidence is below threshold.
+    enabled = True
+    threshold = 0.8
+    max_chars = 16
+    # Intent model trained on log_path (python -m app.utils.nlu_rules <log> <model>;
+    # needs scikit-learn); without it the intent comes from cue words.
+    model_path = os.getenv('NLU_INTENT_MODEL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nlu_intent_model.pkl'))
+    # Opt-in: set NLU_LOG_PATH to append every LLM classification, with the raw
+    # employee input, to that file. Unset or empty keeps logging off. Past
+    # log_max_bytes the file is moved to <log_path>.1 (replacing the previous one).
+    log_path = os.getenv('NLU_LOG_PATH') or None
+    log_max_bytes = 20 * 1024 * 1024
+
+
+class SensitiveTermConfig:
+    # Screen every user message against the sensitive-term lexicon before any LLM
+    # call (app/utils/sensitive_terms.py): answer block terms with
+    # sensitive_word_response right away, and rewrite the terms Azure's content
+    # filter rejects in the prompts (retrieval and history keep the original text).
+    enabled = True
+    # JSON lexicon added to the built-in terms; None uses the built-in terms only.
+    lexicon_path = os.getenv('SENSITIVE_LEXICON_PATH') or None
+
+
+class SessionStoreConfig:
+    # Where conversation state lives between requests: 'memory' (per worker, only
+    # correct with a single worker), 'sqlite' (shared by the workers on one host)
+    # or 'redis' (shared across hosts; needs the redis package).
+    backend = os.getenv('SESSION_STORE_BACKEND', 'sqlite')
+    # Sessions idle for longer than this are dropped.
+    ttl_seconds = 24 * 3600
+    # Upper bound on sessions kept by the memory backend (LRU).
+    max_entries = 10000
+    sqlite_path = os.getenv('SESSION_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db'))
+    redis_url = os.getenv('SESSION_STORE_REDIS_URL', 'redis://localhost:6379/0')
+    key_prefix = 'hr:session:'
+
+
+class SessionRegistryConfig:
+    # Live sessions kept in memory per worker, in front of the session store.
+    # Least recently used sessions beyond max_sessions, and sessions idle for
+    # idle_ttl_seconds, are dropped from memory.
+    max_sessions = 2000
+    idle_ttl_seconds = 30 * 60
+    # Save every turn to the session store (required with several workers). With a
+    # single worker this can be turned off: sessions are then spilled to the store
+    # only when evicted from memory or when the worker exits.
+    write_through = True